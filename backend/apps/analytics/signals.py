@@ -36,17 +36,9 @@ def log_user_login_failed(sender, credentials, request, **kwargs):
     
     # Notify admins about unauthorized access attempt
     from apps.bot.notifications import notify_admins_unauthorized_access
-    import threading
-    import asyncio
-    
-    def run_notify():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(notify_admins_unauthorized_access(
-            username=credentials.get('username', 'Unknown'),
-            ip_address=ip,
-            details=f"Failed login attempt. User-Agent: {request.META.get('HTTP_USER_AGENT')}"
-        ))
-        loop.close()
-    
-    threading.Thread(target=run_notify).start()
+    from apps.bot.telegram_client import submit
+    submit(notify_admins_unauthorized_access(
+        username=credentials.get('username', 'Unknown'),
+        ip_address=ip,
+        details=f"Failed login attempt. User-Agent: {request.META.get('HTTP_USER_AGENT')}"
+    ))
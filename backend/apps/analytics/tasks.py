@@ -1,19 +1,20 @@
 from celery import shared_task
-import asyncio
-from asgiref.sync import async_to_sync
 from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
 @shared_task
-def send_telegram_notification_task(chat_id, message, parse_mode='HTML'):
-    """Async wrapper for sending Telegram notifications in background"""
-    from apps.bot.notifications import send_telegram_notification
-    try:
-        async_to_sync(send_telegram_notification)(chat_id, message, parse_mode)
-    except Exception as e:
-        logger.error(f"Failed to send background notification to {chat_id}: {e}")
+def send_telegram_messages_task(messages, parse_mode='HTML'):
+    """Sends many (chat_id, text) pairs in one task and reports delivery stats"""
+    from apps.bot.notifications import send_telegram_messages
+    from apps.bot.telegram_client import run_sync
+    stats = run_sync(send_telegram_messages(messages, parse_mode))
+    logger.info(
+        f"Message batch: {stats['sent']}/{stats['total']} delivered, "
+        f"{stats['failed']} failed in {stats['seconds']}s"
+    )
+    return stats
 
 @shared_task
 def create_audit_log_task(user_id=None, bot_user_id=None, action_type=None, object_type="", object_id=None, details=None, ip_address=None, user_agent=None):
@@ -6,9 +6,15 @@ from apps.analytics.models import BotInteraction, SearchQueryLog, AuditLog
 
 logger = logging.getLogger(__name__)
 
-async def log_interaction(user_id=None, action_type="unknown", path=None, duration=0, django_user=None):
-    """Logs an interaction (Bot or Web) to the database asynchronously."""
+async def log_interaction(user_id=None, action_type="unknown", path=None, duration=None, django_user=None):
+    """
+    Logs an interaction (Bot or Web) to the database asynchronously.
+    Without ``duration``, the time since the running bot handler started is used.
+    """
     from apps.bot.models import BotUser
+    if duration is None:
+        from apps.bot.instrumentation import current_duration_ms
+        duration = current_duration_ms()
     try:
         user = None
         if user_id:
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
 from datetime import timedelta
-from .models import BotUser, BotStatus, AdminNotificationSettings
+from .models import BotUser, BotStatus, AdminNotificationSettings, NotificationOutbox
 
 @admin.register(BotUser)
 class BotUserAdmin(admin.ModelAdmin):
@@ -13,8 +13,8 @@ class BotUserAdmin(admin.ModelAdmin):
 
 @admin.register(BotStatus)
 class BotStatusAdmin(admin.ModelAdmin):
-    list_display = ('get_status_display', 'last_heartbeat', 'started_at')
-    readonly_fields = ('last_heartbeat',)
+    list_display = ('get_status_display', 'last_heartbeat', 'started_at', 'queued_updates', 'processing_lag')
+    readonly_fields = ('last_heartbeat', 'queued_updates', 'processing_lag')
     
     def get_status_display(self, obj):
         # Check if heartbeat is recent (within last minute)
@@ -69,3 +69,14 @@ class AdminNotificationSettingsAdmin(admin.ModelAdmin):
             'description': 'Выберите, о каких событиях вы хотите получать уведомления в Telegram'
         }),
     )
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('version', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('recipient',)
+    list_select_related = ('version__content_node',)
+    readonly_fields = ('version', 'recipient', 'message', 'parse_mode', 'created_at', 'sent_at')
+    
+    def has_add_permission(self, request):
+        return False
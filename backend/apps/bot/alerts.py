@@ -0,0 +1,146 @@
+"""
+Admin alerting.
+
+Admin notification settings are cached, so raising an alert does not
+touch the database, and messages are handed to Celery and sent to all
+admins concurrently instead of being awaited one by one.
+
+Alerts that can repeat (errors, failed logins) carry a fingerprint. The
+first occurrence within ``ALERT_WINDOW`` is sent right away; later ones
+only increment a counter in Redis, and when the window closes a single
+"repeated N times" summary goes out. A storm of identical errors thus
+costs two messages per admin instead of hundreds.
+"""
+import hashlib
+import logging
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+ALERT_WINDOW = 60 * 5
+ALERT_KEY = "alerts:{fingerprint}"
+
+RECIPIENTS_KEY = "bot:admin_recipients"
+RECIPIENTS_TIMEOUT = 60 * 10
+
+SETTING_FLAGS = ("notify_on_errors", "notify_on_unauthorized", "notify_on_bot_down")
+
+# Ids, counters and addresses that differ between otherwise identical errors
+_VOLATILE_RE = re.compile(r"0x[0-9a-fA-F]+|\d+")
+
+
+def fingerprint(*parts, normalize=True):
+    """
+    Key of alerts that count as the same. Numbers and hex ids are masked
+    unless ``normalize`` is False, for parts that are identities
+    themselves (IP addresses).
+    """
+    if normalize:
+        parts = (_VOLATILE_RE.sub("#", str(part)) for part in parts)
+    normalized = "\x1f".join(str(part)[:300] for part in parts)
+    return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+
+def get_admin_recipients(setting=None):
+    """
+    Telegram ids of the admins with ``setting`` enabled (all admins with a
+    Telegram id if ``setting`` is None), cached until the settings change.
+    """
+    admins = cache.get(RECIPIENTS_KEY)
+    if admins is None:
+        from apps.bot.models import AdminNotificationSettings
+        admins = list(
+            AdminNotificationSettings.objects
+            .filter(telegram_id__isnull=False)
+            .values("telegram_id", *SETTING_FLAGS)
+        )
+        cache.set(RECIPIENTS_KEY, admins, timeout=RECIPIENTS_TIMEOUT)
+    return [admin["telegram_id"] for admin in admins if setting is None or admin[setting]]
+
+
+def invalidate_admin_recipients():
+    cache.delete(RECIPIENTS_KEY)
+
+
+def send_to_admins(setting, message):
+    """Queues ``message`` for every admin with ``setting`` enabled. Returns the number of admins."""
+    from apps.analytics.tasks import send_telegram_messages_task
+
+    recipients = get_admin_recipients(setting)
+    if recipients:
+        send_telegram_messages_task.delay([(telegram_id, message) for telegram_id in recipients])
+    return len(recipients)
+
+
+def _count_occurrence(key, setting, message):
+    from django_redis import get_redis_connection
+
+    pipe = get_redis_connection("default").pipeline()
+    pipe.hincrby(key, "count", 1)
+    pipe.hsetnx(key, "setting", setting or "")
+    pipe.hsetnx(key, "message", message)
+    # Outlives the window in case the summary task never runs
+    pipe.expire(key, ALERT_WINDOW * 2)
+    return pipe.execute()[0]
+
+
+def raise_alert(setting, message, key=None):
+    """
+    Sends ``message`` to the admins with ``setting`` enabled. With a
+    fingerprint ``key``, repeats within ``ALERT_WINDOW`` are summarized.
+    """
+    if key is None:
+        return send_to_admins(setting, message)
+
+    alert_key = ALERT_KEY.format(fingerprint=key)
+    try:
+        count = _count_occurrence(alert_key, setting, message)
+    except RedisError as e:
+        logger.warning(f"Alert aggregation unavailable, sending directly: {e}")
+        return send_to_admins(setting, message)
+
+    if count != 1:
+        return 0
+    from apps.bot.tasks import flush_admin_alert_task
+    try:
+        flush_admin_alert_task.apply_async(args=[key], countdown=ALERT_WINDOW)
+    except Exception as e:
+        # Without the summary the repeats are only dropped until the key expires
+        logger.warning(f"Failed to schedule alert summary: {e}")
+    return send_to_admins(setting, message)
+
+
+async def alert_admins(setting, message, key=None):
+    """``raise_alert`` for async callers, run off the event loop."""
+    return await sync_to_async(raise_alert)(setting, message, key)
+
+
+def summary_message(count, message):
+    minutes = ALERT_WINDOW // 60
+    return f"🔁 <b>Повторилось ещё {count} раз за последние {minutes} мин</b>\n\n{message}"
+
+
+def flush_alert(key):
+    """
+    Closes the window of the alert ``key`` and sends a summary if it
+    repeated. Returns the number of repeats.
+    """
+    from django_redis import get_redis_connection
+
+    alert_key = ALERT_KEY.format(fingerprint=key)
+    pipe = get_redis_connection("default").pipeline()
+    pipe.hgetall(alert_key)
+    pipe.delete(alert_key)
+    state = pipe.execute()[0]
+    if not state:
+        return 0
+
+    repeats = int(state[b"count"]) - 1
+    if repeats > 0:
+        setting = state[b"setting"].decode() or None
+        send_to_admins(setting, summary_message(repeats, state[b"message"].decode()))
+    return repeats
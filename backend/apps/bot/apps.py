@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class BotConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "apps.bot"
+
+    def ready(self):
+        import apps.bot.signals  # noqa
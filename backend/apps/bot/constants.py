@@ -1,3 +1,7 @@
 # Conversation States
 ASK_NAME, ASK_EMAIL, ASK_CONSENT = range(3)
 ASK_SUPPORT_MESSAGE = 10
+
+# Document files sent as photos rather than as files. GIFs are not among
+# them: Telegram turns them into animations, which sendPhoto does not return
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
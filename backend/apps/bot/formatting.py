@@ -0,0 +1,217 @@
+"""
+CKEditor HTML to Telegram HTML.
+
+Telegram understands only a handful of tags and the &lt; &gt; &amp; &quot;
+entities. ``convert`` splits the document into text and tags with one
+compiled pattern: whitelisted tags are re-emitted (with the attributes
+Telegram accepts) and kept balanced, tables and block tags become plain
+text layout, and all other text is unescaped and escaped again for
+Telegram. Non-breaking spaces become plain spaces.
+
+To stay as cheap as the regex substitutions it replaced, the work per
+tag is kept to a dictionary lookup: tags are classified once and cached,
+the ones that only turn into text are replaced in bulk, and the text
+between the tags is decoded and escaped in a single pass. Results are
+memoized by a hash of the input, since the same descriptions are
+converted over and over.
+"""
+import hashlib
+import html
+import re
+
+from apps.bot.instrumentation import render
+from apps.content.cache import LocalCache
+
+# Tag -> attributes kept on it
+ALLOWED_TAGS = {
+    "b": (), "strong": (), "i": (), "em": (), "u": (), "ins": (),
+    "s": (), "strike": (), "del": (), "a": ("href",), "code": ("class",), "pre": (),
+}
+ROW_SEPARATOR = "\n" + "—" * 15 + "\n"
+CELL_SEPARATOR = " | "
+# Tags dropped together with their content
+SKIPPED_TAGS = {"script", "style"}
+
+# Text produced when a tag opens / closes
+START_TEXT = {"br": "\n", "li": "• "}
+END_TEXT = {
+    "td": CELL_SEPARATOR, "th": CELL_SEPARATOR, "tr": ROW_SEPARATOR,
+    "p": "\n", "div": "\n", "li": "\n", "pre": "\n", "h1": "\n", "h2": "\n", "h3": "\n", "h4": "\n",
+}
+
+# A comment, or a start/end tag with its attributes (serializers escape ">" in values)
+_TOKEN_RE = re.compile(r"(<(?:/?[a-zA-Z][^>]*|!--.*?--)>)", re.DOTALL)
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)([^>]*)>")
+_ATTR_RE = re.compile(r"""([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+_ENTITY_RE = re.compile(r"&#?[a-zA-Z0-9]+;")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n")
+# Joins the text between tags so it is unescaped and escaped in one go
+_TEXT_SEPARATOR = "\x00"
+# Entities CKEditor writes, decoded with str.replace instead of html.unescape
+_COMMON_ENTITIES = {
+    entity: html.unescape(entity)
+    for entity in (
+        "&nbsp;", "&laquo;", "&raquo;", "&ndash;", "&mdash;", "&minus;", "&quot;", "&hellip;", "&bull;",
+        "&deg;", "&copy;", "&reg;", "&trade;", "&times;", "&plusmn;", "&lsquo;", "&rsquo;", "&ldquo;",
+        "&rdquo;", "&bdquo;", "&euro;", "&#39;",
+    )
+}
+# Entities Telegram understands as they are
+_TELEGRAM_ENTITIES = {"&amp;", "&lt;", "&gt;"}
+_KNOWN_ENTITIES = _COMMON_ENTITIES.keys() | _TELEGRAM_ENTITIES
+
+CACHE_SIZE = 1024
+CACHE_TIMEOUT = 60 * 60 * 24
+TOKEN_CACHE_SIZE = 4096
+
+# What a token does: emit text, open / close a whitelisted tag, close
+# another tag (ends a skipped section), start a skipped section
+_TEXT, _OPEN, _CLOSE, _END, _SKIP = range(5)
+
+
+def _text(text):
+    """Decodes entities and escapes what Telegram needs escaped."""
+    if "&" in text:
+        entities = _ENTITY_RE.findall(text)
+        found = set(entities)
+        if len(entities) < text.count("&") or not found <= _KNOWN_ENTITIES:
+            # Bare ampersands or rare entities
+            return html.escape(html.unescape(text), quote=False).replace("\xa0", " ")
+        for entity in found - _TELEGRAM_ENTITIES:
+            text = text.replace(entity, _COMMON_ENTITIES[entity])
+    if "\xa0" in text:
+        text = text.replace("\xa0", " ")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _start_tag(tag, raw_attrs):
+    allowed = ALLOWED_TAGS[tag]
+    if not allowed or not raw_attrs.strip():
+        return f"<{tag}>"
+
+    kept = []
+    for name, double, single, bare in _ATTR_RE.findall(raw_attrs):
+        name = name.lower()
+        if name in allowed:
+            value = html.unescape(double or single or bare)
+            kept.append(f' {name}="{html.escape(value, quote=True)}"')
+    return f"<{tag}{''.join(kept)}>"
+
+
+def _classify(token):
+    """``(kind, tag, text)`` of a comment or tag token."""
+    match = _TAG_RE.match(token)
+    if match is None:
+        # Comment
+        return _TEXT, None, ""
+    closing, tag, raw_attrs = match.groups()
+    tag = tag.lower()
+    if closing:
+        return (_CLOSE if tag in ALLOWED_TAGS else _END), tag, END_TEXT.get(tag, "")
+    if tag in ALLOWED_TAGS:
+        if raw_attrs.endswith("/"):
+            return _TEXT, tag, ""
+        return _OPEN, tag, _start_tag(tag, raw_attrs)
+    if tag in SKIPPED_TAGS:
+        return _SKIP, tag, ""
+    return _TEXT, tag, START_TEXT.get(tag, "")
+
+
+# Classified tokens; the same few tags make up most of every document.
+# Tokens that only turn into text (most of them) map to that text, the
+# ones that open or close a kept tag or a skipped section to their info.
+_outputs = {}
+_tokens = {}
+
+
+def _lookup(token):
+    output = _outputs.get(token)
+    if output is not None:
+        return _TEXT, None, output
+    info = _tokens.get(token)
+    if info is None:
+        info = _classify(token)
+        kind, tag, text = info
+        stateless = kind == _TEXT or (kind == _END and tag not in SKIPPED_TAGS)
+        cache = _outputs if stateless else _tokens
+        if len(cache) < TOKEN_CACHE_SIZE:
+            cache[token] = text if stateless else info
+    return info
+
+
+def convert(html_content):
+    """Converts without memoization."""
+    if _TEXT_SEPARATOR in html_content:
+        html_content = html_content.replace(_TEXT_SEPARATOR, "")
+    # Text and tokens alternate: text, token, text, ..., text
+    parts = _TOKEN_RE.split(html_content)
+    tokens = parts[1::2]
+    # Known text-only tokens are replaced in one go, the rest (None) one by one
+    outputs = list(map(_outputs.get, tokens))
+    open_tags = []
+    skip_from = skip_until = None
+
+    known = _tokens.get
+    for i in [i for i, output in enumerate(outputs) if output is None]:
+        kind, tag, text = known(tokens[i]) or _lookup(tokens[i])
+        if skip_until is not None:
+            if kind == _END and tag == skip_until:
+                # Drop the <script>/<style> section with its text
+                outputs[skip_from:i + 1] = [""] * (i + 1 - skip_from)
+                parts[2 * skip_from + 2:2 * i + 1:2] = [""] * (i - skip_from)
+                skip_until = None
+            continue
+        if kind == _TEXT or kind == _END:
+            outputs[i] = text
+        elif kind == _OPEN:
+            open_tags.append(tag)
+            outputs[i] = text
+        elif kind == _CLOSE:
+            if tag not in open_tags:
+                # Stray closing tag
+                outputs[i] = ""
+                continue
+            # Close everything opened inside it so the output stays balanced
+            closed = []
+            while open_tags:
+                opened = open_tags.pop()
+                closed.append(f"</{opened}>")
+                if opened == tag:
+                    break
+            closed.append(text)
+            outputs[i] = "".join(closed)
+        else:
+            skip_from, skip_until = i, tag
+
+    if skip_until is not None:
+        # Unclosed section: everything after it goes
+        outputs[skip_from:] = [""] * (len(outputs) - skip_from)
+        parts[2 * skip_from + 2::2] = [""] * (len(outputs) - skip_from)
+    parts[1::2] = outputs
+    parts[::2] = _text(_TEXT_SEPARATOR.join(parts[::2])).split(_TEXT_SEPARATOR)
+    parts.extend(f"</{tag}>" for tag in reversed(open_tags))
+    return _BLANK_LINES_RE.sub("\n\n", "".join(parts)).strip()
+
+
+_converted = LocalCache(CACHE_SIZE, CACHE_TIMEOUT)
+
+
+@render
+def html_to_telegram(html_content):
+    """
+    Converts a subset of HTML to Telegram-compatible HTML.
+    Strips unsupported tags while trying to preserve structure (tables, blocks).
+    """
+    if not html_content:
+        return ""
+
+    key = hashlib.blake2b(html_content.encode(), digest_size=16).digest()
+    result = _converted.get(key)
+    if result is None:
+        result = convert(html_content)
+        _converted.set(key, result)
+    return result
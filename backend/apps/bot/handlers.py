@@ -1,19 +1,18 @@
 import os
-import time
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.ext import ContextTypes, ConversationHandler
 from django.utils.translation import gettext as _
 from asgiref.sync import sync_to_async
 
-from apps.bot.constants import ASK_NAME, ASK_EMAIL, ASK_CONSENT, ASK_SUPPORT_MESSAGE
+from apps.bot.constants import ASK_NAME, ASK_EMAIL, ASK_CONSENT, ASK_SUPPORT_MESSAGE, IMAGE_EXTENSIONS
 from apps.bot.utils import (
     get_bot_user, create_initial_user, update_user_name, update_user_email,
     update_user_agreement, is_user_subscribed, save_file_id_safe,
     toggle_subscription, save_support_request, notify_admins,
     html_to_telegram
 )
-from apps.bot.keyboards import build_root_keyboard, get_category_menu_content
+from apps.bot.keyboards import build_root_keyboard, get_category_menu_content, get_search_results_content
 from apps.analytics.utils import log_interaction, log_search_query
 
 logger = logging.getLogger(__name__)
@@ -23,7 +22,6 @@ from django.conf import settings
 MEDIA_ROOT = settings.MEDIA_ROOT
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    start_time = time.time()
     user = update.effective_user
     
     # 1. Создаем запись если нет (чтобы не было ошибок), но не сохраняем имя из телеграма
@@ -36,8 +34,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard = await build_root_keyboard()
         await update.message.reply_text(_("Выберите раздел:"), reply_markup=keyboard)
         
-        duration = int((time.time() - start_time) * 1000)
-        await log_interaction(user.id, "command", "/start", duration=duration)
+        await log_interaction(user.id, "command", "/start")
         return ConversationHandler.END
 
     # Иначе начинаем регистрацию
@@ -47,8 +44,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown"
     )
     
-    duration = int((time.time() - start_time) * 1000)
-    await log_interaction(user.id, "command", "/start_reg", duration=duration)
+    await log_interaction(user.id, "command", "/start_reg")
     return ASK_NAME
 
 async def receive_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -132,7 +128,6 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 async def category_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id=None, answer=True, prefix=""):
-    start_time = time.time()
     query = update.callback_query
     if query and answer:
         await query.answer()
@@ -152,28 +147,23 @@ async def category_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, c
 
     logger.info(f"Requesting category data for: {category_id}")
 
-    from apps.content import services
     try:
-        data = await sync_to_async(services.get_category_details)(category_id)
+        text, reply_markup = await get_category_menu_content(category_id, query.from_user.id, prefix=prefix)
     except Exception as e:
         logger.error(f"Error fetching category {category_id}: {e}")
         if query:
             await query.edit_message_text(_("Ошибка загрузки категории."))
         return
 
-    text, reply_markup = await get_category_menu_content(data, query.from_user.id, prefix=prefix)
-
     await query.edit_message_text(
         text=text,
         parse_mode="HTML",
         reply_markup=reply_markup
     )
     
-    duration = int((time.time() - start_time) * 1000)
-    await log_interaction(query.from_user.id, "callback", f"cat:{category_id}", duration=duration)
+    await log_interaction(query.from_user.id, "callback", f"cat:{category_id}")
 
 async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    start_time = time.time()
     query = update.callback_query
     await query.answer()
 
@@ -214,24 +204,31 @@ async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 1. Отправляем файл
     sent_msg = None
+    is_image = bool(file_path) and os.path.splitext(file_path)[1].lower() in IMAGE_EXTENSIONS
     if telegram_file_id:
         try:
-            sent_msg = await query.message.reply_document(
-                document=telegram_file_id,
-                caption=caption,
-                parse_mode="HTML"
-            )
+            if is_image:
+                sent_msg = await query.message.reply_photo(
+                    photo=telegram_file_id,
+                    caption=caption,
+                    parse_mode="HTML"
+                )
+            else:
+                sent_msg = await query.message.reply_document(
+                    document=telegram_file_id,
+                    caption=caption,
+                    parse_mode="HTML"
+                )
         except Exception as e:
             logger.error(f"Failed to send by file_id: {e}")
             telegram_file_id = None
 
     if not telegram_file_id and file_path:
         full_path = os.path.join(MEDIA_ROOT, file_path)
-        ext = os.path.splitext(full_path)[1].lower()
 
         if os.path.exists(full_path):
             with open(full_path, "rb") as f:
-                if ext in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
+                if is_image:
                    sent_msg = await query.message.reply_photo(
                         photo=f,
                         caption=caption,
@@ -270,23 +267,19 @@ async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pass 
 
     # Получаем данные категории заново
-    from apps.content import services
     try:
-        cat_data = await sync_to_async(services.get_category_details)(category_id)
+        text, reply_markup = await get_category_menu_content(category_id, query.from_user.id)
     except Exception as e:
          logger.error(f"Error re-fetching category {category_id}: {e}")
          return
 
-    text, reply_markup = await get_category_menu_content(cat_data, query.from_user.id)
-
     await query.message.reply_text(
         text=text,
         parse_mode="HTML",
         reply_markup=reply_markup
     )
     
-    duration = int((time.time() - start_time) * 1000)
-    await log_interaction(query.from_user.id, "callback", f"doc:{doc_id}", duration=duration)
+    await log_interaction(query.from_user.id, "callback", f"doc:{doc_id}")
 
 async def back_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -301,7 +294,6 @@ async def back_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    start_time = time.time()
     if not context.args:
         await update.message.reply_text("Использование: /search <текст>")
         return
@@ -319,35 +311,39 @@ async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not data:
         await update.message.reply_text(_("По запросу \"{query}\" ничего не найдено.").format(query=query_text))
         await log_search_query(update.effective_user.id, query_text, 0)
-        duration = int((time.time() - start_time) * 1000)
-        await log_interaction(update.effective_user.id, "command", "/search", duration=duration)
+        await log_interaction(update.effective_user.id, "command", "/search")
         return
 
-    keyboard = []
-    for item in data:
-        keyboard.append([InlineKeyboardButton(f"📄 {item['title']}", callback_data=f"doc:{item['id']}")])
-    
-    keyboard.append([InlineKeyboardButton(_("🔙 В главное меню"), callback_data="back")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text, reply_markup = get_search_results_content(query_text, data)
     await update.message.reply_text(
-        f"🔍 Результаты поиска по запросу \"{query_text}\":",
+        text,
+        parse_mode="HTML",
         reply_markup=reply_markup
     )
     
     await log_search_query(update.effective_user.id, query_text, len(data))
-    duration = int((time.time() - start_time) * 1000)
-    await log_interaction(update.effective_user.id, "command", "/search", duration=duration)
+    await log_interaction(update.effective_user.id, "command", "/search")
 
 async def initiate_search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
+    # data format: "search_init" (everywhere) or "search_init:<category_id>" (within a section)
+    parts = query.data.split(":")
+    category_id = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+
     context.user_data['awaiting_search'] = True
-    
+    context.user_data['search_category_id'] = category_id
+
+    if category_id is not None:
+        prompt = _("🔍 Введите поисковый запрос:\n\n"
+                   "Я найду документы по названию и описанию в текущем разделе.")
+    else:
+        prompt = _("🔍 Введите поисковый запрос:\n\n"
+                   "Я найду документы по названию и описанию.")
+
     await query.edit_message_text(
-        _("🔍 Введите поисковый запрос:\n\n"
-        "Я найду документы по названию и описанию."),
+        prompt,
         reply_markup=InlineKeyboardMarkup([[
             InlineKeyboardButton(_("❌ Отмена"), callback_data="back")
         ]])
@@ -358,8 +354,8 @@ async def handle_search_query(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     context.user_data['awaiting_search'] = False
+    category_id = context.user_data.pop('search_category_id', None)
     
-    start_time = time.time()
     query_text = update.message.text.strip()
     
     if not query_text:
@@ -368,7 +364,7 @@ async def handle_search_query(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     from apps.content import services
     try:
-        data = await sync_to_async(services.search_content)(query_text)
+        data = await sync_to_async(services.search_content)(query_text, category_id=category_id)
     except Exception as e:
         logger.error(f"Search Error: {e}")
         await update.message.reply_text("Произошла ошибка при поиске.")
@@ -382,28 +378,20 @@ async def handle_search_query(update: Update, context: ContextTypes.DEFAULT_TYPE
             ]])
         )
         await log_search_query(update.effective_user.id, query_text, 0)
-        duration = int((time.time() - start_time) * 1000)
-        await log_interaction(update.effective_user.id, "text_search", query_text, duration=duration)
+        await log_interaction(update.effective_user.id, "text_search", query_text)
         return
 
-    keyboard = []
-    for item in data:
-        keyboard.append([InlineKeyboardButton(f"📄 {item['title']}", callback_data=f"doc:{item['id']}")])
-    
-    keyboard.append([InlineKeyboardButton("🔙 В главное меню", callback_data="back")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text, reply_markup = get_search_results_content(query_text, data)
     await update.message.reply_text(
-        f"🔍 Результаты поиска по запросу \"{query_text}\":",
+        text,
+        parse_mode="HTML",
         reply_markup=reply_markup
     )
     
     await log_search_query(update.effective_user.id, query_text, len(data))
-    duration = int((time.time() - start_time) * 1000)
-    await log_interaction(update.effective_user.id, "text_search", query_text, duration=duration)
+    await log_interaction(update.effective_user.id, "text_search", query_text)
 
 async def toggle_subscription_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    start_time = time.time()
     query = update.callback_query
 
     category_id = int(query.data.split(":")[2])
@@ -425,8 +413,7 @@ async def toggle_subscription_handler(update: Update, context: ContextTypes.DEFA
     
     await category_handler(update, context, category_id=category_id, answer=False, prefix=prefix)
     
-    duration = int((time.time() - start_time) * 1000)
-    await log_interaction(query.from_user.id, "callback", f"sub:toggle:{category_id}", duration=duration)
+    await log_interaction(query.from_user.id, "callback", f"sub:toggle:{category_id}")
 
 async def start_support_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -450,7 +437,7 @@ async def receive_support_message_handler(update: Update, context: ContextTypes.
     await notify_admins(context.application, text, user_info)
     
     # Log interaction
-    await log_interaction(user.id, "support_request", "text", duration=0)
+    await log_interaction(user.id, "support_request", "text")
 
     # Reply to user
     await update.message.reply_text(
@@ -0,0 +1,183 @@
+"""
+Per-handler latency breakdown.
+
+``instrument_handlers`` wraps the callback of every handler of the bot.
+While a callback runs, a context variable collects where its time goes:
+
+* database time and query count, from an execute wrapper installed on
+  every Django connection (``sync_to_async`` carries the context variable
+  into the worker thread running the query);
+* Telegram API time, measured around each Bot API request by the rate
+  limiter, including the time spent waiting for a token;
+* render time, spent in the functions building message texts and
+  keyboards (decorated with ``render``).
+
+When the callback returns, the timings are observed in Prometheus
+histograms labelled with the handler name, served on a local ``/metrics``
+endpoint by ``start_metrics_server``. ``log_interaction`` takes its
+duration from here when called inside a handler.
+"""
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+DB = "db"
+TELEGRAM = "telegram"
+RENDER = "render"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Time spent in a bot handler", ["handler"], buckets=LATENCY_BUCKETS
+)
+PHASE_SECONDS = Histogram(
+    "bot_handler_phase_seconds", "Time a bot handler spent on the database, the Telegram API and rendering",
+    ["handler", "phase"], buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "bot_handler_db_queries", "Database queries made by a bot handler", ["handler"], buckets=QUERY_BUCKETS
+)
+
+
+class HandlerTimings:
+    """Time and count per phase of one handler call."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = {DB: 0.0, TELEGRAM: 0.0, RENDER: 0.0}
+        self.queries = 0
+        # Render sections call each other; only the outermost one counts
+        self.render_depth = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+_timings = ContextVar("bot_handler_timings", default=None)
+
+
+def current_duration_ms():
+    """Milliseconds since the running handler started, 0 outside handlers."""
+    timings = _timings.get()
+    return int(timings.elapsed() * 1000) if timings else 0
+
+
+@contextmanager
+def measure(phase):
+    """Adds the time of the block to ``phase`` of the running handler, if any."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.seconds[phase] += time.perf_counter() - started
+
+
+def render(func):
+    """Counts calls of ``func`` as render time, net of the queries they make."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = _timings.get()
+        if timings is None or timings.render_depth:
+            return func(*args, **kwargs)
+        started, db_before = time.perf_counter(), timings.seconds[DB]
+        timings.render_depth += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings.render_depth -= 1
+            db = timings.seconds[DB] - db_before
+            timings.seconds[RENDER] += time.perf_counter() - started - db
+
+    return wrapper
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.seconds[DB] += time.perf_counter() - started
+        timings.queries += 1
+
+
+def _instrument_connection(connection, **kwargs):
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+def install_db_timing():
+    """Times the queries of every connection opened from now on and of the open ones of this thread."""
+    connection_created.connect(_instrument_connection, dispatch_uid="bot_handler_db_timing")
+    for connection in connections.all(initialized_only=True):
+        _instrument_connection(connection)
+
+
+def observe(handler, timings):
+    HANDLER_SECONDS.labels(handler).observe(timings.elapsed())
+    for phase, seconds in timings.seconds.items():
+        PHASE_SECONDS.labels(handler, phase).observe(seconds)
+    DB_QUERIES.labels(handler).observe(timings.queries)
+
+
+def instrument(callback, name=None):
+    """Wraps a handler callback so each call is measured and observed under ``name``."""
+    if getattr(callback, "instrumented", False):
+        return callback
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        timings = HandlerTimings()
+        token = _timings.set(timings)
+        try:
+            return await callback(update, context)
+        finally:
+            _timings.reset(token)
+            observe(name, timings)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _handlers(handlers):
+    from telegram.ext import ConversationHandler
+
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _handlers(state_handlers)
+            yield from _handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument_handlers(app):
+    """Instruments every handler added to ``app`` so far, conversation steps included."""
+    for group in app.handlers.values():
+        for handler in _handlers(group):
+            handler.callback = instrument(handler.callback)
+
+
+def start_metrics_server(port, addr="127.0.0.1"):
+    """Serves the histograms at ``http://addr:port/metrics`` from a daemon thread. Returns the server."""
+    server, _thread = start_http_server(port, addr=addr)
+    logger.info(f"Bot metrics on http://{addr}:{port}/metrics")
+    return server
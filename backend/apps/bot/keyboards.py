@@ -1,60 +1,49 @@
 import html
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from django.utils.translation import gettext as _
-from asgiref.sync import sync_to_async
+from apps.bot.instrumentation import render
 from apps.bot.utils import is_user_subscribed, html_to_telegram
 
+@render
+def _markup(rows):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, callback_data=callback_data) for label, callback_data in row]
+        for row in rows
+    ])
+
+@render
+def render_root_menu(tree):
+    """Root menu rows as (label, callback_data) pairs."""
+    rows = [[(f"🗂 {c.title}", f"cat:{c.id}")] for c in tree.roots]
+    rows.append([(_("🔍 Поиск"), "search_init")])
+    rows.append([(_("📨 Написать администратору"), "support_start")])
+    return rows
+
 async def build_root_keyboard():
-    from apps.content import services
-    # Wrap in list to evaluate QuerySet in sync context
-    categories = await sync_to_async(lambda: list(services.get_root_categories()))()
-
-    keyboard = [
-        [InlineKeyboardButton(f"🗂 {c.title}", callback_data=f"cat:{c.id}")]
-        for c in categories
-    ]
-    keyboard.append([InlineKeyboardButton(_("🔍 Поиск"), callback_data="search_init")])
-    keyboard.append([InlineKeyboardButton(_("📨 Написать администратору"), callback_data="support_start")])
-    return InlineKeyboardMarkup(keyboard)
-
-async def get_category_menu_content(data, user_id, prefix=""):
+    from apps.content.tree import aget_content_tree
+    tree = await aget_content_tree()
+    return _markup(tree.memoize("menu:root", lambda: render_root_menu(tree)))
+
+@render
+def render_category_menu(data):
+    """
+    User-independent part of a category menu: the HTML text and the keyboard
+    rows as (label, callback_data) pairs. The subscription bell is inserted
+    before the last two rows (search and back) at send time.
+    """
     category_id = data["id"]
-    keyboard = []
+    rows = []
 
     # Subcategories (data["subcategories"] is a list of dicts from service)
     for sub in data.get("subcategories", []):
-         keyboard.append(
-            [InlineKeyboardButton(
-                f"📂 {sub['title']}",
-                callback_data=f"cat:{sub['id']}"
-            )]
-        )
+        rows.append([(f"📂 {sub['title']}", f"cat:{sub['id']}")])
 
     # Documents
     for doc in data["documents"]:
-        keyboard.append(
-            [InlineKeyboardButton(
-                f"📄 {doc['title']}",
-                callback_data=f"doc:{doc['id']}"
-            )]
-        )
-
-    # Subscription button
-    is_subbed, sub_type = await is_user_subscribed(user_id, category_id)
-    
-    if sub_type == "inherited":
-        sub_text = "🔕"
-    else:
-        sub_text = "🔕" if is_subbed else "🔔"
-    
-    keyboard.append(
-        [InlineKeyboardButton(sub_text, callback_data=f"sub:toggle:{category_id}")]
-    )
+        rows.append([(f"📄 {doc['title']}", f"doc:{doc['id']}")])
 
     # Search button
-    keyboard.append(
-        [InlineKeyboardButton(_("🔍 Поиск по разделу"), callback_data="search_init")]
-    )
+    rows.append([(_("🔍 Поиск по разделу"), f"search_init:{category_id}")])
 
     # Back button
     parent_id = data.get("parent_id")
@@ -63,9 +52,7 @@ async def get_category_menu_content(data, user_id, prefix=""):
     else:
         back_callback = "back"
 
-    keyboard.append(
-        [InlineKeyboardButton(_("⬅ Назад"), callback_data=back_callback)]
-    )
+    rows.append([(_("⬅ Назад"), back_callback)])
 
     # Clearer status indicator
     status_icon = "🗂" if parent_id is None else "📂"
@@ -87,7 +74,54 @@ async def get_category_menu_content(data, user_id, prefix=""):
         if clean_desc:
             description_text = f"\n\n{clean_desc}"
 
-    text = f"{prefix}{status_icon} {safe_breadcrumbs}<u>{safe_title}</u>{description_text}"
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = f"{status_icon} {safe_breadcrumbs}<u>{safe_title}</u>{description_text}"
+    return text, rows
+
+async def get_category_menu_content(category_id, user_id, prefix=""):
+    """
+    Category menu for a user. The menu itself is rendered once per content
+    revision; only the subscription bell is added per request.
+    Raises ``Category.DoesNotExist`` for unknown categories.
+    """
+    from apps.content.tree import aget_content_tree
+    category_id = int(category_id)
+    tree = await aget_content_tree()
+    text, rows = tree.memoize(
+        f"menu:category:{category_id}",
+        lambda: render_category_menu(tree.category_details(category_id))
+    )
+
+    # Subscription button
+    is_subbed, sub_type = await is_user_subscribed(user_id, category_id)
     
-    return text, reply_markup
+    if sub_type == "inherited":
+        sub_text = "🔕"
+    else:
+        sub_text = "🔕" if is_subbed else "🔔"
+
+    rows = rows[:-2] + [[(sub_text, f"sub:toggle:{category_id}")]] + rows[-2:]
+    return f"{prefix}{text}", _markup(rows)
+
+@render
+def get_search_results_content(query_text, results):
+    """Search reply: result list with highlighted snippets and a button per document."""
+    if results and results[0].get("fuzzy"):
+        suggestions = list(dict.fromkeys(item["suggestion"] for item in results))[:3]
+        lines = [
+            _("По запросу \"{query}\" точных совпадений нет.").format(query=html.escape(query_text)),
+            _("Возможно, вы имели в виду: {suggestions}?").format(
+                suggestions=", ".join(f"<b>{html.escape(s)}</b>" for s in suggestions)
+            ),
+        ]
+    else:
+        lines = [_("🔍 Результаты поиска по запросу \"{query}\":").format(query=html.escape(query_text))]
+    keyboard = []
+    for index, item in enumerate(results, start=1):
+        lines.append(f"\n{index}. <b>{html.escape(item['title'])}</b>")
+        snippet = html_to_telegram(item.get("headline") or "")
+        if snippet:
+            lines.append(snippet)
+        keyboard.append([InlineKeyboardButton(f"📄 {item['title']}", callback_data=f"doc:{item['id']}")])
+
+    keyboard.append([InlineKeyboardButton(_("🔙 В главное меню"), callback_data="back")])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
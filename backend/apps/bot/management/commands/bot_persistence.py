@@ -0,0 +1,32 @@
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.bot.persistence import STATE_TTL, persistence_report, prune_inactive
+
+
+class Command(BaseCommand):
+    help = 'Reports the memory used by the bot persistence per category of state and prunes inactive entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete entries without activity for longer than --days')
+        parser.add_argument('--days', type=int, default=STATE_TTL // 86400,
+                            help='Days of inactivity after which an entry is pruned')
+
+    def handle(self, *args, **options):
+        client = redis.from_url(settings.REDIS_URL)
+        ttl = options['days'] * 86400
+
+        if options['prune']:
+            pruned = prune_inactive(client, ttl=ttl)
+            for category, count in pruned.items():
+                if count:
+                    self.stdout.write(f"Pruned {count} inactive entries from {category}")
+            self.stdout.write(self.style.SUCCESS(f"Pruned {sum(pruned.values())} entries"))
+
+        self.stdout.write(f"{'State':<28}{'Entries':>10}{'Memory KiB':>12}{'Inactive':>10}")
+        for row in persistence_report(client, ttl=ttl):
+            self.stdout.write(
+                f"{row['category']:<28}{row['entries']:>10}{row['bytes'] / 1024:>12.1f}{row['inactive']:>10}"
+            )
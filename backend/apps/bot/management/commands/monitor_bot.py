@@ -66,15 +66,11 @@ class Command(BaseCommand):
                 if status.last_alert_sent_at:
                     # Bot has recovered!
                     print(f"[{timezone.now()}] Bot recovery detected!")
-                    from apps.bot.notifications import send_telegram_notification, get_admin_notification_settings
+                    from apps.bot.alerts import alert_admins
                     
                     try:
-                        settings_list = await get_admin_notification_settings()
                         recovery_msg = "🟢 <b>Бот снова в строю!</b>\nРабота системы восстановлена."
-                        
-                        for settings_obj in settings_list:
-                            if settings_obj.notify_on_bot_down and settings_obj.telegram_id:
-                                await send_telegram_notification(settings_obj.telegram_id, recovery_msg)
+                        await alert_admins("notify_on_bot_down", recovery_msg)
                     except Exception as e:
                         print(f"[{timezone.now()}] Error sending recovery alert: {e}")
                     
@@ -1,8 +1,15 @@
-from django.core.management.base import BaseCommand
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.utils import timezone
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ConversationHandler, MessageHandler, filters, PicklePersistence
+from apps.bot.instrumentation import install_db_timing, instrument_handlers, start_metrics_server
 from apps.bot.persistence import RedisPersistence
+from apps.bot.ratelimit import SharedRateLimiter
+from apps.bot.webhook import WEBHOOK_PATH, serve_webhook
+from apps.bot.workers import PartitionedUpdateProcessor
+from apps.content.cache import start_invalidation_listener
 from apps.bot.handlers import (
     start,
     category_handler,
@@ -37,21 +44,33 @@ logger = logging.getLogger(__name__)
 from django.utils import autoreload
 
 @sync_to_async
-def update_bot_status(is_running=True, error_message=""):
+def update_bot_status(is_running=True, error_message="", queued_updates=0, processing_lag=0.0):
     """Update bot status in database"""
     from apps.bot.models import BotStatus
     status = BotStatus.get_status()
     status.is_running = is_running
     status.error_message = error_message
     status.last_heartbeat = timezone.now()
+    status.queued_updates = queued_updates
+    status.processing_lag = processing_lag
     if is_running and not status.started_at:
         status.started_at = timezone.now()
     status.save()
 
+def queue_metrics(app):
+    """Updates waiting to be processed and the processing lag in seconds."""
+    queued, lag = app.update_queue.qsize(), 0.0
+    if isinstance(app.update_processor, PartitionedUpdateProcessor):
+        snapshot = app.update_processor.snapshot()
+        queued += snapshot["queued"]
+        lag = snapshot["lag"]
+    return queued, lag
+
 async def heartbeat_job(context):
     """Periodic job to update bot heartbeat"""
     try:
-        await update_bot_status(is_running=True, error_message="")
+        queued, lag = queue_metrics(context.application)
+        await update_bot_status(is_running=True, error_message="", queued_updates=queued, processing_lag=round(lag, 3))
     except Exception as e:
         logger.error(f"Failed to update heartbeat: {e}")
 
@@ -67,49 +86,95 @@ async def error_handler(update, context):
     except Exception as e:
         logger.error(f"Failed to notify admins about error: {e}")
 
+def register_handlers(app):
+    """Adds the bot's conversations, callbacks and error handler to ``app``."""
+    # Registration Conversation
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={
+            ASK_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_name)],
+            ASK_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_email)],
+            ASK_CONSENT: [CallbackQueryHandler(agreement_handler)],
+        },
+        fallbacks=[CommandHandler("start", start)],
+    )
+
+    # Support Conversation
+    support_conv = ConversationHandler(
+        entry_points=[CallbackQueryHandler(start_support_handler, pattern="^support_start$")],
+        states={
+            ASK_SUPPORT_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_support_message_handler)]
+        },
+        fallbacks=[CallbackQueryHandler(back_handler, pattern="^back$")]
+    )
+    app.add_handler(support_conv)
+
+    app.add_handler(conv_handler)
+
+    app.add_handler(CallbackQueryHandler(category_handler, pattern="^cat:"))
+    app.add_handler(CallbackQueryHandler(document_handler, pattern="^doc:"))
+    app.add_handler(CallbackQueryHandler(back_handler, pattern="^back$"))
+    app.add_handler(CallbackQueryHandler(toggle_subscription_handler, pattern="^sub:toggle:"))
+    app.add_handler(CallbackQueryHandler(initiate_search_handler, pattern=r"^search_init(:\d+)?$"))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_search_query))
+    app.add_handler(CommandHandler("search", search_handler))
+
+    # Add error handler
+    app.add_error_handler(error_handler)
+
+    # Latency breakdown of every handler above, see apps.bot.instrumentation
+    instrument_handlers(app)
+
+
 class Command(BaseCommand):
     help = "Run Telegram bot"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--webhook', action='store_true',
+                            help='Receive updates through a webhook server instead of long polling '
+                                 '(single replica: a second one refuses to start)')
+        parser.add_argument('--host', default='0.0.0.0', help='Webhook server interface')
+        parser.add_argument('--port', type=int, default=8080, help='Webhook server port')
+        parser.add_argument('--webhook-url', default=settings.TELEGRAM_WEBHOOK_URL,
+                            help='Public URL Telegram posts updates to (TELEGRAM_WEBHOOK_URL)')
+        parser.add_argument('--metrics-port', type=int, default=settings.BOT_METRICS_PORT,
+                            help='Local port of the /metrics endpoint (0 disables it)')
+
     def handle(self, *args, **options):
-        redis_url = getattr(settings, 'REDIS_URL', 'redis://redis:6379/1')
+        if options['webhook']:
+            # Fail before anything is started
+            if not options['webhook_url'] or not settings.TELEGRAM_WEBHOOK_SECRET:
+                raise CommandError(
+                    "--webhook needs TELEGRAM_WEBHOOK_URL (or --webhook-url) and TELEGRAM_WEBHOOK_SECRET"
+                )
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError("--webhook needs uvicorn installed")
+
+        start_invalidation_listener()
+        install_db_timing()
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'], settings.BOT_METRICS_ADDR)
+
+        redis_url = getattr(settings, 'REDIS_URL', 'redis://redis:6379/0')
         persistence = RedisPersistence(url=redis_url)
 
-        app = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).persistence(persistence).build()
-
-        # Registration Conversation
-        conv_handler = ConversationHandler(
-            entry_points=[CommandHandler("start", start)],
-            states={
-                ASK_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_name)],
-                ASK_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_email)],
-                ASK_CONSENT: [CallbackQueryHandler(agreement_handler)],
-            },
-            fallbacks=[CommandHandler("start", start)],
+        # Shares the Telegram flood limits with the Celery workers and the monitor
+        builder = (
+            Application.builder()
+            .token(settings.TELEGRAM_BOT_TOKEN)
+            .persistence(persistence)
+            .rate_limiter(SharedRateLimiter())
+            # Users are handled concurrently, each user's updates in order
+            .concurrent_updates(PartitionedUpdateProcessor(settings.BOT_UPDATE_WORKERS))
         )
+        if options['webhook']:
+            # Updates arrive through the webhook server, nothing polls
+            builder = builder.updater(None)
+        app = builder.build()
+        register_handlers(app)
 
-        # Support Conversation
-        support_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(start_support_handler, pattern="^support_start$")],
-            states={
-                ASK_SUPPORT_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_support_message_handler)]
-            },
-            fallbacks=[CallbackQueryHandler(back_handler, pattern="^back$")]
-        )
-        app.add_handler(support_conv)
-
-        app.add_handler(conv_handler)
-
-        app.add_handler(CallbackQueryHandler(category_handler, pattern="^cat:"))
-        app.add_handler(CallbackQueryHandler(document_handler, pattern="^doc:"))
-        app.add_handler(CallbackQueryHandler(back_handler, pattern="^back$"))
-        app.add_handler(CallbackQueryHandler(toggle_subscription_handler, pattern="^sub:toggle:"))
-        app.add_handler(CallbackQueryHandler(initiate_search_handler, pattern="^search_init$"))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_search_query))
-        app.add_handler(CommandHandler("search", search_handler))
-        
-        # Add error handler
-        app.add_error_handler(error_handler)
-        
         # Add heartbeat job (every 30 seconds)
         job_queue = app.job_queue
         job_queue.run_repeating(heartbeat_job, interval=30, first=0)
@@ -119,7 +184,14 @@ class Command(BaseCommand):
 
         print("🤖 Telegram bot started")
         try:
-            app.run_polling(close_loop=False)
+            if options['webhook']:
+                url = options['webhook_url']
+                asyncio.run(serve_webhook(
+                    app, url, settings.TELEGRAM_WEBHOOK_SECRET,
+                    host=options['host'], port=options['port'], path=urlsplit(url).path or WEBHOOK_PATH,
+                ))
+            else:
+                app.run_polling(close_loop=False)
         except Exception as e:
             logger.error(f"Bot stopped with error: {e}")
             # We can't easily run async code here if the loop is broken,
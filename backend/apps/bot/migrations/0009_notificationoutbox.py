@@ -0,0 +1,40 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_supportrequest'),
+        ('content', '0014_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.BigIntegerField(verbose_name='Telegram ID получателя')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('parse_mode', models.CharField(default='HTML', max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='content.documentversion', verbose_name='Версия файла')),
+            ],
+            options={
+                'verbose_name': 'Уведомление в очереди',
+                'verbose_name_plural': 'Очередь уведомлений',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='bot_outbox_due_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notificationoutbox',
+            constraint=models.UniqueConstraint(fields=('version', 'recipient'), name='bot_outbox_version_recipient_uniq'),
+        ),
+    ]
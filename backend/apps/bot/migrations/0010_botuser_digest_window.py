@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botuser',
+            name='digest_window',
+            field=models.PositiveIntegerField(blank=True, help_text='Обновления за это время приходят одним сообщением. Пусто — общая настройка, 0 — сразу.', null=True, verbose_name='Окно дайджеста (сек)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_botuser_digest_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botstatus',
+            name='processing_lag',
+            field=models.FloatField(default=0, verbose_name='Задержка обработки, с'),
+        ),
+        migrations.AddField(
+            model_name='botstatus',
+            name='queued_updates',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обновлений в очереди'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class BotUser(models.Model):
@@ -17,6 +18,13 @@ class BotUser(models.Model):
         verbose_name="Подписки на категории"
     )
 
+    digest_window = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Окно дайджеста (сек)",
+        help_text="Обновления за это время приходят одним сообщением. Пусто — общая настройка, 0 — сразу."
+    )
+
     def __str__(self):
         return str(self.telegram_id)
 
@@ -26,6 +34,9 @@ class BotStatus(models.Model):
     last_alert_sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Последнее уведомление о сбое")
     error_message = models.TextField(blank=True, verbose_name="Последняя ошибка")
     started_at = models.DateTimeField(null=True, blank=True, verbose_name="Время запуска")
+    # Reported with every heartbeat, see apps.bot.workers
+    queued_updates = models.PositiveIntegerField(default=0, verbose_name="Обновлений в очереди")
+    processing_lag = models.FloatField(default=0, verbose_name="Задержка обработки, с")
     
     class Meta:
         verbose_name = 'Статус бота'
@@ -74,3 +85,44 @@ class SupportRequest(models.Model):
         elif self.django_user:
             user_display = f"Web: {self.django_user.username}"
         return f"{user_display} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+class NotificationOutbox(models.Model):
+    """
+    Notification waiting to be delivered to one recipient. Rows are written
+    in the transaction that creates the document version and are sent by
+    ``apps.bot.outbox.dispatch_outbox``.
+    """
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Ожидает отправки"),
+        (SENT, "Отправлено"),
+        (FAILED, "Ошибка"),
+    ]
+
+    version = models.ForeignKey(
+        "content.DocumentVersion", on_delete=models.CASCADE, related_name="outbox", verbose_name="Версия файла"
+    )
+    recipient = models.BigIntegerField(verbose_name="Telegram ID получателя")
+    message = models.TextField(verbose_name="Сообщение")
+    parse_mode = models.CharField(max_length=16, default="HTML")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        verbose_name = 'Уведомление в очереди'
+        verbose_name_plural = 'Очередь уведомлений'
+        constraints = [
+            models.UniqueConstraint(fields=["version", "recipient"], name="bot_outbox_version_recipient_uniq"),
+        ]
+        indexes = [
+            # Dispatcher claims due pending rows
+            models.Index(fields=["status", "next_attempt_at"], name="bot_outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.version_id} → {self.recipient} ({self.status})"
@@ -1,79 +1,113 @@
-import httpx
-from django.conf import settings
 from django.utils import timezone
+from apps.bot.alerts import alert_admins, fingerprint
 from apps.bot.models import BotUser
+from apps.bot.ratelimit import BULK, MAX_RETRIES, rate_limit
+from apps.bot.telegram_client import get_client
+import asyncio
 import logging
-from asgiref.sync import sync_to_async
+import time
 
 logger = logging.getLogger(__name__)
 
-async def broadcast_notification(document_version):
+# Recipients per outbox insert and messages in flight per batch
+FANOUT_CHUNK_SIZE = 500
+NOTIFICATION_CONCURRENCY = 20
+
+# Outcomes of deliver_telegram_message
+SENT = "sent"
+RETRY = "retry"
+PERMANENT = "permanent"
+
+def iter_subscribers(category):
     """
-    Sends notification to all users subscribed to the document's category
-    or any of its parent categories.
+    Streams ``(telegram_id, digest_window)`` of users subscribed to
+    ``category`` or any of its ancestors through a server-side cursor,
+    each user once.
     """
-    
-    @sync_to_async
-    def get_notification_data():
-        document = document_version.content_node
-        category = document.parent
-        
-        # Find all relevant categories (including ancestors)
-        if category:
-            relevant_categories = list(category.get_ancestors(include_self=True))
-        else:
-            relevant_categories = []
-        
-        # Find all users subscribed to any of these categories
-        subscribers = list(BotUser.objects.filter(
-            subscribed_categories__in=relevant_categories,
-            agreed_to_policy=True
-        ).distinct())
-        
-        return document, category, subscribers
-
-    document, category, subscribers = await get_notification_data()
-    
-    message_text = (
-        f"🔔 *Обновление файлов!*\n\n"
-        f"В разделе *{category.title}* доступен новый документ:\n"
-        f"📄 *{document.title}* (v{document_version.version})\n\n"
-        f"Вы получили это сообщение, так как подписаны на этот раздел."
+    category_ids = category.get_ancestors(include_self=True).values("id")
+    return (
+        BotUser.subscribed_categories.through.objects
+        .filter(category_id__in=category_ids, botuser__agreed_to_policy=True)
+        .order_by()
+        .values_list("botuser__telegram_id", "botuser__digest_window")
+        .distinct()
+        .iterator(chunk_size=FANOUT_CHUNK_SIZE)
     )
-    
-    from apps.analytics.tasks import send_telegram_notification_task
-
-    for user in subscribers:
-        if user.telegram_id:
-            send_telegram_notification_task.delay(user.telegram_id, message_text, parse_mode="Markdown")
-
-@sync_to_async
-def get_admin_notification_settings():
-    """Get all admins who should receive notifications"""
-    from apps.bot.models import AdminNotificationSettings
-    return list(AdminNotificationSettings.objects.select_related('admin_user').all())
-
-async def send_telegram_notification(telegram_id, message, parse_mode="HTML"):
-    """Send a Telegram message to a specific user"""
-    token = settings.TELEGRAM_BOT_TOKEN
-    base_url = f"https://api.telegram.org/bot{token}/sendMessage"
-    
+
+def iter_subscriber_ids(category):
+    """Telegram ids of the users ``iter_subscribers`` yields."""
+    return (telegram_id for telegram_id, _window in iter_subscribers(category))
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def send_telegram_messages(messages, parse_mode="HTML", concurrency=NOTIFICATION_CONCURRENCY):
+    """
+    Sends ``(chat_id, text)`` pairs over the shared client with at most
+    ``concurrency`` requests in flight. Returns delivery stats.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(chat_id, text):
+        async with semaphore:
+            return await send_telegram_notification(chat_id, text, parse_mode)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages))
+    sent = sum(1 for ok in results if ok)
+    return {
+        "total": len(results),
+        "sent": sent,
+        "failed": len(results) - sent,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+async def deliver_telegram_message(telegram_id, message, parse_mode="HTML", priority=BULK):
+    """
+    Sends a Telegram message to a specific user. Waits for the shared rate
+    limit and retries after a 429 once its ``retry_after`` has passed.
+
+    Returns ``SENT``, ``RETRY`` when trying again later may succeed (still
+    rate limited, a 5xx or a network error) or ``PERMANENT`` when Telegram
+    refused the message itself (user blocked the bot, chat not found, bad
+    markup).
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(base_url, json={
+        for attempt in range(MAX_RETRIES + 1):
+            await rate_limit.acquire(telegram_id, priority)
+            response = await get_client().post("sendMessage", json={
                 "chat_id": telegram_id,
                 "text": message,
                 "parse_mode": parse_mode
             })
-            return response.status_code == 200
+            if response.status_code == 200:
+                return SENT
+            if response.status_code != 429:
+                if response.status_code < 500:
+                    logger.warning(f"Telegram refused notification to {telegram_id}: {response.text}")
+                    return PERMANENT
+                return RETRY
+            retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+            await rate_limit.ablock(retry_after)
+        logger.warning(f"Telegram notification to {telegram_id} still rate limited after {MAX_RETRIES} retries")
+        return RETRY
     except Exception as e:
         logger.error(f"Failed to send Telegram notification to {telegram_id}: {e}")
-        return False
+        return RETRY
+
+async def send_telegram_notification(telegram_id, message, parse_mode="HTML", priority=BULK):
+    """Sends a Telegram message to a specific user. True if it was delivered."""
+    return await deliver_telegram_message(telegram_id, message, parse_mode, priority) == SENT
 
 async def notify_admins_error(error_type, details):
     """Notify admins about system errors"""
-    settings_list = await get_admin_notification_settings()
-    
     message = (
         f"🚨 <b>Ошибка в системе</b>\n\n"
         f"<b>Тип:</b> {error_type}\n"
@@ -81,14 +115,10 @@ async def notify_admins_error(error_type, details):
         f"<b>Время:</b> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
-    for settings_obj in settings_list:
-        if settings_obj.notify_on_errors and settings_obj.telegram_id:
-            await send_telegram_notification(settings_obj.telegram_id, message)
+    await alert_admins("notify_on_errors", message, key=fingerprint("error", error_type, details))
 
 async def notify_admins_unauthorized_access(username, ip_address, details=""):
     """Notify admins about unauthorized access attempts"""
-    settings_list = await get_admin_notification_settings()
-    
     message = (
         f"⚠️ <b>Попытка несанкционированного доступа</b>\n\n"
         f"<b>Пользователь:</b> {username}\n"
@@ -97,15 +127,12 @@ async def notify_admins_unauthorized_access(username, ip_address, details=""):
         f"<b>Время:</b> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
-    from apps.analytics.tasks import send_telegram_notification_task
-    for settings_obj in settings_list:
-        if settings_obj.notify_on_unauthorized and settings_obj.telegram_id:
-            send_telegram_notification_task.delay(settings_obj.telegram_id, message)
+    # Repeated attempts from one address are summarized; the address is kept as is
+    key = fingerprint("unauthorized", ip_address, normalize=False)
+    await alert_admins("notify_on_unauthorized", message, key=key)
 
 async def notify_admins_bot_down(error_message=""):
     """Notify admins that the bot has stopped working"""
-    settings_list = await get_admin_notification_settings()
-    
     message = (
         f"🔴 <b>Бот остановлен</b>\n\n"
         f"Telegram бот перестал отвечать.\n"
@@ -113,15 +140,10 @@ async def notify_admins_bot_down(error_message=""):
         f"<b>Время:</b> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
-    from apps.analytics.tasks import send_telegram_notification_task
-    for settings_obj in settings_list:
-        if settings_obj.notify_on_bot_down and settings_obj.telegram_id:
-            send_telegram_notification_task.delay(settings_obj.telegram_id, message)
+    await alert_admins("notify_on_bot_down", message)
 
 async def notify_admins_document_error(document_title, error_details):
     """Notify admins about document processing errors"""
-    settings_list = await get_admin_notification_settings()
-    
     message = (
         f"📄 <b>Ошибка обработки документа</b>\n\n"
         f"<b>Документ:</b> {document_title}\n"
@@ -129,14 +151,10 @@ async def notify_admins_document_error(document_title, error_details):
         f"<b>Время:</b> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
-    for settings_obj in settings_list:
-        if settings_obj.notify_on_errors and settings_obj.telegram_id:
-            await send_telegram_notification(settings_obj.telegram_id, message)
+    await alert_admins("notify_on_errors", message, key=fingerprint("document", document_title, error_details))
 
 async def notify_admins_storage_limit(total_size_bytes):
     """Notify admins that the storage limit (5GB) has been exceeded"""
-    settings_list = await get_admin_notification_settings()
-    
     try:
         gb_size = "%.2f" % (total_size_bytes / (1024 * 1024 * 1024))
     except (TypeError, ZeroDivisionError):
@@ -149,14 +167,10 @@ async def notify_admins_storage_limit(total_size_bytes):
         f"<b>Время:</b> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
-    for settings_obj in settings_list:
-        if settings_obj.notify_on_errors and settings_obj.telegram_id:
-            await send_telegram_notification(settings_obj.telegram_id, message)
+    await alert_admins("notify_on_errors", message)
 
 async def notify_admins_support_request(support_request):
     """Notify admins about a new support request from web or bot"""
-    settings_list = await get_admin_notification_settings()
-    
     django_user = getattr(support_request, 'django_user', None)
     bot_user = getattr(support_request, 'user', None)
     
@@ -173,15 +187,10 @@ async def notify_admins_support_request(support_request):
         f"<b>Время:</b> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
-    from apps.analytics.tasks import send_telegram_notification_task
-    for settings_obj in settings_list:
-        if settings_obj.telegram_id:
-            send_telegram_notification_task.delay(settings_obj.telegram_id, message)
+    await alert_admins(None, message)
 
 async def notify_admins_new_user(user, source="Web"):
     """Notify admins about a new user registration"""
-    settings_list = await get_admin_notification_settings()
-    
     message = (
         f"👤 <b>Новый пользователь!</b>\n\n"
         f"<b>Логин:</b> <code>{user.username}</code>\n"
@@ -191,7 +200,4 @@ async def notify_admins_new_user(user, source="Web"):
         f"<b>Время:</b> {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
-    from apps.analytics.tasks import send_telegram_notification_task
-    for settings_obj in settings_list:
-        if settings_obj.telegram_id:
-            send_telegram_notification_task.delay(settings_obj.telegram_id, message)
+    await alert_admins(None, message)
@@ -0,0 +1,255 @@
+"""
+Transactional outbox for subscriber notifications.
+
+When a document version is created, one ``NotificationOutbox`` row per
+subscriber is written in the same transaction, so notifications are never
+sent for a rolled back version and never lost when a process dies.
+Dispatchers claim due rows with ``SELECT ... FOR UPDATE SKIP LOCKED`` and
+lease them for ``CLAIM_TIMEOUT`` seconds, so any number of them can run
+side by side. Sends that may succeed later (429, 5xx, network errors) are
+retried with exponential backoff, messages Telegram refuses (the user
+blocked the bot, unknown chat) fail at once; the unique
+``(version, recipient)`` pair keeps each recipient to one row.
+
+Subscribers with a digest window (``BotUser.digest_window`` or the global
+``BOT_DIGEST_WINDOW``) get their rows scheduled that far ahead. When a
+recipient's first row falls due, all of their buffered rows are claimed
+with it and sent as one combined message, so a burst of uploads costs one
+message per user per window. Delivered events and messages are counted
+in the cache (see ``get_delivery_stats``).
+"""
+import asyncio
+import html
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.bot.models import NotificationOutbox
+from apps.bot.notifications import (
+    FANOUT_CHUNK_SIZE,
+    NOTIFICATION_CONCURRENCY,
+    PERMANENT,
+    SENT,
+    chunked,
+    deliver_telegram_message,
+    iter_subscribers,
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+# Delay before the first retry, doubled on every further attempt
+RETRY_BACKOFF = 30
+MAX_BACKOFF = 60 * 60
+# A claimed row becomes due again if its dispatcher has not finished by then
+CLAIM_TIMEOUT = 60 * 5
+
+EVENTS_KEY = "bot:outbox:events"
+MESSAGES_KEY = "bot:outbox:messages"
+
+
+# Messages are HTML: titles are escaped, so no title can break the markup
+# and have Telegram refuse the message
+def version_message(document_version):
+    document = document_version.content_node
+    return (
+        f"🔔 <b>Обновление файлов!</b>\n\n"
+        f"В разделе <b>{html.escape(document.parent.title)}</b> доступен новый документ:\n"
+        f"📄 <b>{html.escape(document.title)}</b> (v{html.escape(document_version.version)})\n\n"
+        f"Вы получили это сообщение, так как подписаны на этот раздел."
+    )
+
+
+def digest_message(versions):
+    lines = [
+        f"📄 <b>{html.escape(version.content_node.title)}</b> (v{html.escape(version.version)}) — "
+        f"{html.escape(version.content_node.parent.title)}"
+        for version in versions
+    ]
+    return (
+        f"🔔 <b>Обновления файлов: {len(versions)}</b>\n\n"
+        + "\n".join(lines)
+        + "\n\nВы получили это сообщение, так как подписаны на эти разделы."
+    )
+
+
+def enqueue_version_notifications(document_version):
+    """
+    Writes an outbox row for every user subscribed to the version's
+    category or its ancestors, in the current transaction, and wakes a
+    dispatcher once it commits. Returns the number of recipients.
+    """
+    document = document_version.content_node
+    category = document.parent if document else None
+    if category is None:
+        return 0
+
+    message = version_message(document_version)
+    now = timezone.now()
+    default_window = settings.BOT_DIGEST_WINDOW
+    recipients = 0
+    for chunk in chunked(iter_subscribers(category), FANOUT_CHUNK_SIZE):
+        NotificationOutbox.objects.bulk_create(
+            [
+                NotificationOutbox(
+                    version=document_version,
+                    recipient=telegram_id,
+                    message=message,
+                    parse_mode="HTML",
+                    next_attempt_at=now + timedelta(seconds=default_window if window is None else window),
+                )
+                for telegram_id, window in chunk
+            ],
+            ignore_conflicts=True,
+        )
+        recipients += len(chunk)
+
+    if recipients:
+        transaction.on_commit(_wake_dispatcher)
+    return recipients
+
+
+def _wake_dispatcher():
+    from apps.bot.tasks import dispatch_outbox_task
+    try:
+        dispatch_outbox_task.delay()
+    except Exception as e:
+        # The periodic dispatch picks the rows up later
+        logger.warning(f"Failed to queue notification dispatch: {e}")
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """
+    Claims up to ``batch_size`` due rows, skipping rows other dispatchers
+    hold, together with the rows their recipients still have buffered.
+    """
+    now = timezone.now()
+    pending = (
+        NotificationOutbox.objects
+        .select_for_update(skip_locked=True, of=("self",))
+        .select_related("version__content_node__parent")
+        .filter(status=NotificationOutbox.PENDING)
+    )
+    with transaction.atomic():
+        rows = list(pending.filter(next_attempt_at__lte=now).order_by("next_attempt_at", "id")[:batch_size])
+        if rows:
+            # The recipients' other untried rows (buffered for a digest) go out in the same message
+            rows += (
+                pending.filter(recipient__in={row.recipient for row in rows}, attempts=0)
+                .exclude(pk__in=[row.pk for row in rows])
+                .order_by("id")
+            )
+            NotificationOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+                attempts=F("attempts") + 1,
+                next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT),
+            )
+    for row in rows:
+        row.attempts += 1
+    return rows
+
+
+def group_by_recipient(rows):
+    """``(recipient, rows, message, parse_mode)`` with one combined message per recipient."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.recipient, []).append(row)
+
+    for recipient, recipient_rows in groups.items():
+        if len(recipient_rows) == 1:
+            row = recipient_rows[0]
+            yield recipient, recipient_rows, row.message, row.parse_mode
+        else:
+            recipient_rows.sort(key=lambda row: row.version.created_at)
+            yield recipient, recipient_rows, digest_message([row.version for row in recipient_rows]), "HTML"
+
+
+def retry_delay(attempts):
+    return min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+async def _send(groups, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(recipient, message, parse_mode):
+        async with semaphore:
+            return await deliver_telegram_message(recipient, message, parse_mode)
+
+    return await asyncio.gather(*(
+        send(recipient, message, parse_mode) for recipient, _rows, message, parse_mode in groups
+    ))
+
+
+def _record(groups, results):
+    now = timezone.now()
+    delivered = [group for group, result in zip(groups, results) if result == SENT]
+    sent = [row.pk for _recipient, rows, _message, _mode in delivered for row in rows]
+    NotificationOutbox.objects.filter(pk__in=sent).update(status=NotificationOutbox.SENT, sent_at=now)
+    record_delivery(len(sent), len(delivered))
+
+    failed = [
+        (row, result)
+        for (_recipient, rows, _message, _mode), result in zip(groups, results) if result != SENT
+        for row in rows
+    ]
+    # Refused messages would be refused again, so only spend retries on the others
+    dead = {row.pk for row, result in failed if result == PERMANENT or row.attempts >= MAX_ATTEMPTS}
+    NotificationOutbox.objects.filter(pk__in=dead).update(status=NotificationOutbox.FAILED)
+
+    by_attempts = {}
+    for row, _result in failed:
+        if row.pk not in dead:
+            by_attempts.setdefault(row.attempts, []).append(row.pk)
+    for attempts, pks in by_attempts.items():
+        NotificationOutbox.objects.filter(pk__in=pks).update(
+            next_attempt_at=now + timedelta(seconds=retry_delay(attempts))
+        )
+    return len(sent), len(failed) - len(dead), len(dead)
+
+
+def record_delivery(events, messages):
+    if not events:
+        return
+    cache.add(EVENTS_KEY, 0, timeout=None)
+    cache.add(MESSAGES_KEY, 0, timeout=None)
+    cache.incr(EVENTS_KEY, events)
+    cache.incr(MESSAGES_KEY, messages)
+
+
+def get_delivery_stats():
+    """
+    Delivered notification events, the Telegram messages they took and
+    the share of messages saved by digests.
+    """
+    events = cache.get(EVENTS_KEY) or 0
+    messages = cache.get(MESSAGES_KEY) or 0
+    return {
+        "events": events,
+        "messages": messages,
+        "savings": round(1 - messages / events, 3) if events else 0.0,
+    }
+
+
+def dispatch_outbox(batch_size=BATCH_SIZE, concurrency=NOTIFICATION_CONCURRENCY):
+    """Sends due notifications batch by batch until none are left. Returns stats."""
+    from apps.bot.telegram_client import run_sync
+
+    stats = {"sent": 0, "messages": 0, "retrying": 0, "failed": 0}
+    while True:
+        rows = claim_batch(batch_size)
+        if not rows:
+            return stats
+        groups = list(group_by_recipient(rows))
+        results = run_sync(_send(groups, concurrency))
+        sent, retrying, failed = _record(groups, results)
+        stats["sent"] += sent
+        stats["messages"] += results.count(SENT)
+        stats["retrying"] += retrying
+        stats["failed"] += failed
+        if failed:
+            logger.warning(f"{failed} notifications dropped as undeliverable or after {MAX_ATTEMPTS} attempts")
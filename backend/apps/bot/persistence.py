@@ -1,8 +1,99 @@
+"""
+python-telegram-bot persistence in Redis.
+
+User data, chat data and the states of every conversation are kept in
+Redis hashes with one field per user, chat or conversation key, so an
+update reads or writes only the entry it touches. User and chat data are
+not loaded at startup: each entry is fetched the first time an update for
+that user or chat arrives (``refresh_user_data`` / ``refresh_chat_data``).
+
+All calls go through ``redis.asyncio`` with a connection pool, so waiting
+on Redis never blocks the bot's event loop. Writes issued together (the
+application persists every changed user, chat and conversation at once)
+are sent to Redis in a single pipeline.
+
+Entries are stored as compact JSON behind a schema tag (``J1``); values
+JSON cannot represent faithfully (tuples, non-string keys, objects) fall
+back to tagged pickle (``P1``), and untagged pickles of earlier versions
+are still read. Redis hashes cannot expire single fields, so every write
+or load records the entry's last activity in a sorted set next to its
+hash; ``prune_inactive`` drops entries idle for longer than ``STATE_TTL``
+(see the ``bot_persistence`` command). The idle check and the delete run
+in one Lua script, and a write records the activity before the data, so
+an entry used while the prune runs is never deleted.
+"""
+import asyncio
+import json
 import pickle
+import time
 import redis
+import redis.asyncio
 from typing import Any, Dict, Optional, Tuple, cast
 from telegram.ext import BasePersistence, PersistenceInput
 
+KEY_PREFIX = "bot:persistence:"
+USER_DATA_KEY = KEY_PREFIX + "user_data"
+CHAT_DATA_KEY = KEY_PREFIX + "chat_data"
+BOT_DATA_KEY = KEY_PREFIX + "bot_data"
+CALLBACK_DATA_KEY = KEY_PREFIX + "callback_data"
+CONVERSATION_KEY = KEY_PREFIX + "conv:{name}"
+# Sorted set of field -> last activity timestamp for each hash above
+ACTIVITY_KEY = "{key}:activity"
+
+MAX_CONNECTIONS = 20
+STATE_TTL = 60 * 60 * 24 * 180
+PRUNE_CHUNK_SIZE = 500
+
+# KEYS: hash, activity; ARGV: cutoff, fields
+# Deletes the fields still idle since the cutoff and returns how many.
+_PRUNE_SCRIPT = """
+local cutoff = tonumber(ARGV[1])
+local pruned = 0
+for i = 2, #ARGV do
+    local score = redis.call('ZSCORE', KEYS[2], ARGV[i])
+    if score and tonumber(score) <= cutoff then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+        redis.call('ZREM', KEYS[2], ARGV[i])
+        pruned = pruned + 1
+    end
+end
+return pruned
+"""
+
+JSON_TAG = b"J1"
+PICKLE_TAG = b"P1"
+
+
+def encode(data):
+    """Tagged compact JSON, or tagged pickle when JSON would not round-trip."""
+    try:
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        if json.loads(text) == data:
+            return JSON_TAG + text.encode()
+    except (TypeError, ValueError):
+        pass
+    return PICKLE_TAG + pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode(raw):
+    tag = raw[:2]
+    if tag == JSON_TAG:
+        return json.loads(raw[2:])
+    if tag == PICKLE_TAG:
+        return pickle.loads(raw[2:])
+    # Untagged pickle written before the schema tag
+    return pickle.loads(raw)
+
+
+def _field(key):
+    """Hash field of a user / chat id or a conversation key tuple."""
+    return json.dumps(key) if isinstance(key, tuple) else str(key)
+
+
+def _conversation_key(field):
+    return tuple(json.loads(field))
+
+
 class RedisPersistence(BasePersistence):
     def __init__(
         self,
@@ -10,67 +101,205 @@ class RedisPersistence(BasePersistence):
         store_data: Optional[PersistenceInput] = None,
     ):
         super().__init__(store_data=store_data)
-        self.redis = redis.from_url(url)
+        self.redis = redis.asyncio.Redis(
+            connection_pool=redis.asyncio.ConnectionPool.from_url(url, max_connections=MAX_CONNECTIONS)
+        )
+        # Ids whose stored data was already merged into the application
+        self._loaded_users = set()
+        self._loaded_chats = set()
+        # Writes waiting for the next pipeline and the task sending them
+        self._pending = []
+        self._writer = None
+        legacy_client = redis.from_url(url)
+        try:
+            self._migrate_legacy_keys(legacy_client)
+        finally:
+            legacy_client.close()
+
+    @staticmethod
+    def _migrate_legacy_keys(client) -> None:
+        """Splits the whole-dict pickles of earlier versions into hashes (runs once, before the loop starts)."""
+        for legacy_key, key in (("user_data", USER_DATA_KEY), ("chat_data", CHAT_DATA_KEY)):
+            data = client.get(legacy_key)
+            if data:
+                entries = pickle.loads(data)
+                if entries:
+                    client.hset(key, mapping={_field(k): encode(v) for k, v in entries.items()})
+            client.delete(legacy_key)
+
+        for legacy_key, key in (("bot_data", BOT_DATA_KEY), ("callback_data", CALLBACK_DATA_KEY)):
+            data = client.get(legacy_key)
+            if data:
+                client.set(key, data)
+            client.delete(legacy_key)
+
+        for legacy_key in client.scan_iter(match="conv:*"):
+            name = legacy_key.decode().split(":", 1)[1]
+            states = pickle.loads(client.get(legacy_key) or pickle.dumps({}))
+            if states:
+                client.hset(
+                    CONVERSATION_KEY.format(name=name),
+                    mapping={_field(k): encode(v) for k, v in states.items()},
+                )
+            client.delete(legacy_key)
 
     async def get_user_data(self) -> Dict[int, Any]:
-        data = self.redis.get("user_data")
-        return pickle.loads(data) if data else {}
+        # Loaded per user on first use, see refresh_user_data
+        return {}
 
     async def get_chat_data(self) -> Dict[int, Any]:
-        data = self.redis.get("chat_data")
-        return pickle.loads(data) if data else {}
+        # Loaded per chat on first use, see refresh_chat_data
+        return {}
+
+    async def _write(self, *commands: Tuple[Any, ...]) -> None:
+        """Queues ``(command, *args)`` writes and waits until the pipeline carrying them has been executed."""
+        self._pending.extend(commands)
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write_pending())
+        await asyncio.shield(self._writer)
+
+    async def _write_pending(self) -> None:
+        try:
+            # Writes queued while a pipeline is in flight go out in the next one
+            while self._pending:
+                batch, self._pending = self._pending, []
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for command, *args in batch:
+                        getattr(pipe, command)(*args)
+                    await pipe.execute()
+        finally:
+            self._pending = []
+            self._writer = None
+
+    async def _store(self, key: str, field: str, data: Any) -> None:
+        # Activity first: a prune between the two commands then skips the entry
+        await self._write(
+            ("zadd", ACTIVITY_KEY.format(key=key), {field: time.time()}),
+            ("hset", key, field, encode(data)),
+        )
+
+    async def _drop(self, key: str, field: str) -> None:
+        await self._write(("hdel", key, field), ("zrem", ACTIVITY_KEY.format(key=key), field))
+
+    async def _load(self, key: str, field: str, into: Any) -> None:
+        data = await self.redis.hget(key, field)
+        if data:
+            into.update(decode(data))
+            await self._write(("zadd", ACTIVITY_KEY.format(key=key), {field: time.time()}))
 
     async def get_bot_data(self) -> Dict[Any, Any]:
-        data = self.redis.get("bot_data")
-        return pickle.loads(data) if data else {}
+        data = await self.redis.get(BOT_DATA_KEY)
+        return decode(data) if data else {}
 
     async def get_conversations(self, name: str) -> Dict[Tuple[Any, ...], Any]:
-        data = self.redis.get(f"conv:{name}")
-        return pickle.loads(data) if data else {}
+        # Conversation handlers need every state up front; these are small
+        states = await self.redis.hgetall(CONVERSATION_KEY.format(name=name))
+        return {_conversation_key(field): decode(state) for field, state in states.items()}
 
     async def update_user_data(self, user_id: int, data: Any) -> None:
-        full_data = await self.get_user_data()
-        full_data[user_id] = data
-        self.redis.set("user_data", pickle.dumps(full_data))
+        self._loaded_users.add(user_id)
+        await self._store(USER_DATA_KEY, _field(user_id), data)
 
     async def update_chat_data(self, chat_id: int, data: Any) -> None:
-        full_data = await self.get_chat_data()
-        full_data[chat_id] = data
-        self.redis.set("chat_data", pickle.dumps(full_data))
+        self._loaded_chats.add(chat_id)
+        await self._store(CHAT_DATA_KEY, _field(chat_id), data)
 
     async def update_bot_data(self, data: Any) -> None:
-        self.redis.set("bot_data", pickle.dumps(data))
+        await self._write(("set", BOT_DATA_KEY, encode(data)))
 
     async def update_conversation(self, name: str, key: Tuple[Any, ...], new_state: Optional[Any]) -> None:
-        full_data = await self.get_conversations(name)
+        redis_key = CONVERSATION_KEY.format(name=name)
         if new_state is None:
-            full_data.pop(key, None)
+            await self._drop(redis_key, _field(key))
         else:
-            full_data[key] = new_state
-        self.redis.set(f"conv:{name}", pickle.dumps(full_data))
+            await self._store(redis_key, _field(key), new_state)
 
     async def flush(self) -> None:
-        pass # We update in real-time in this implementation
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+        await self.redis.aclose()
 
     async def drop_chat_data(self, chat_id: int) -> None:
-        pass
+        self._loaded_chats.discard(chat_id)
+        await self._drop(CHAT_DATA_KEY, _field(chat_id))
 
     async def drop_user_data(self, user_id: int) -> None:
-        pass
+        self._loaded_users.discard(user_id)
+        await self._drop(USER_DATA_KEY, _field(user_id))
 
     async def refresh_bot_data(self, bot_data: Any) -> None:
         pass
 
     async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
-        pass
+        if chat_id in self._loaded_chats:
+            return
+        await self._load(CHAT_DATA_KEY, _field(chat_id), chat_data)
+        self._loaded_chats.add(chat_id)
 
     async def refresh_user_data(self, user_id: int, user_data: Any) -> None:
-        pass
+        if user_id in self._loaded_users:
+            return
+        await self._load(USER_DATA_KEY, _field(user_id), user_data)
+        self._loaded_users.add(user_id)
 
     # Added for compatibility with PTB 20.x
     async def get_callback_data(self) -> Optional[cast(Any, Tuple[Any, ...])]:
-        data = self.redis.get("callback_data")
-        return pickle.loads(data) if data else None
+        data = await self.redis.get(CALLBACK_DATA_KEY)
+        return decode(data) if data else None
 
     async def update_callback_data(self, data: cast(Any, Tuple[Any, ...])) -> None:
-        self.redis.set("callback_data", pickle.dumps(data))
+        await self._write(("set", CALLBACK_DATA_KEY, encode(data)))
+
+
+def state_keys(client):
+    """``(category, hash key)`` for user data, chat data and every conversation."""
+    keys = [("user_data", USER_DATA_KEY), ("chat_data", CHAT_DATA_KEY)]
+    for key in sorted(client.scan_iter(match=CONVERSATION_KEY.format(name="*"))):
+        key = key.decode()
+        if not key.endswith(":activity"):
+            keys.append((key[len(KEY_PREFIX):], key))
+    return keys
+
+
+def _track_untracked(client, key, now):
+    """Entries written before activity tracking start their TTL now."""
+    activity = ACTIVITY_KEY.format(key=key)
+    for fields in _chunks(client.hkeys(key)):
+        client.zadd(activity, {field: now for field in fields}, nx=True)
+
+
+def _chunks(items, size=PRUNE_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def persistence_report(client, ttl=STATE_TTL):
+    """Entries, memory and entries idle for longer than ``ttl`` per category of state."""
+    cutoff = time.time() - ttl
+    report = []
+    for category, key in state_keys(client):
+        activity = ACTIVITY_KEY.format(key=key)
+        report.append({
+            "category": category,
+            "entries": client.hlen(key),
+            "bytes": (client.memory_usage(key) or 0) + (client.memory_usage(activity) or 0),
+            "inactive": client.zcount(activity, "-inf", cutoff),
+        })
+    return report
+
+
+def prune_inactive(client, ttl=STATE_TTL):
+    """Deletes entries idle for longer than ``ttl``. Returns the number deleted per category."""
+    now = time.time()
+    cutoff = now - ttl
+    prune = client.register_script(_PRUNE_SCRIPT)
+    pruned = {}
+    for category, key in state_keys(client):
+        _track_untracked(client, key, now)
+        activity = ACTIVITY_KEY.format(key=key)
+        # Candidates only: the script re-checks each one before deleting it
+        stale = client.zrangebyscore(activity, "-inf", cutoff)
+        pruned[category] = sum(
+            prune(keys=[key, activity], args=[cutoff, *fields]) for fields in _chunks(stale)
+        )
+    return pruned
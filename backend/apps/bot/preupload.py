@@ -0,0 +1,218 @@
+"""
+Pre-uploading document files to Telegram.
+
+A document is sent to users by ``telegram_file_id`` once Telegram has the
+file; until then ``document_handler`` uploads it from ``MEDIA_ROOT`` while
+the user waits. When a version is created, ``preupload_version`` (run by
+a Celery task after the commit) uploads the file once to the storage chat
+``TELEGRAM_STORAGE_CHAT_ID`` and stores the file_id it gets back.
+
+``sync_file_ids`` runs periodically: it uploads the current versions that
+still have no file_id (older documents, failed uploads) and asks Telegram
+(``getFile``) whether file_ids not confirmed for ``REVALIDATE_AFTER`` are
+still valid, uploading the file again when one is not.
+"""
+import logging
+import os
+from datetime import timedelta
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from apps.bot.constants import IMAGE_EXTENSIONS
+from apps.bot.ratelimit import BULK, MAX_RETRIES, rate_limit
+from apps.bot.telegram_client import get_client, run_sync
+
+logger = logging.getLogger(__name__)
+
+# Largest files the Bot API accepts as an upload
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+MAX_PHOTO_SIZE = 10 * 1024 * 1024
+UPLOAD_TIMEOUT = httpx.Timeout(300.0, connect=10.0)
+REVALIDATE_AFTER = timedelta(days=7)
+SYNC_BATCH_SIZE = 50
+
+
+def storage_chat():
+    return settings.TELEGRAM_STORAGE_CHAT_ID
+
+
+def schedule_preupload(version):
+    """Queues the upload of a new version's file once the version is committed."""
+    if storage_chat() and version.file:
+        transaction.on_commit(lambda: _queue_upload(version.pk))
+
+
+def _queue_upload(version_id):
+    from apps.bot.tasks import preupload_document_task
+    try:
+        preupload_document_task.delay(version_id)
+    except Exception as e:
+        # sync_file_ids uploads it later
+        logger.warning(f"Failed to queue pre-upload of version {version_id}: {e}")
+
+
+def is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def sent_file_id(message):
+    """file_id of the file in a sent message, whatever Telegram made of it."""
+    if message.get("photo"):
+        # Sizes come smallest first; the original is the last one
+        return message["photo"][-1]["file_id"]
+    # Animations come with the document alongside
+    media = message.get("animation") or message.get("document")
+    return media["file_id"] if media else None
+
+
+async def upload_document(path, chat_id):
+    """
+    Sends the file at ``path`` to ``chat_id`` the way ``document_handler``
+    sends it (images as photos, anything else as a document). Returns its
+    file_id, or None.
+    """
+    method, field = ("sendPhoto", "photo") if is_image(path) else ("sendDocument", "document")
+    for attempt in range(MAX_RETRIES + 1):
+        await rate_limit.acquire(chat_id, BULK)
+        with open(path, "rb") as f:
+            response = await get_client().post(
+                method,
+                data={"chat_id": str(chat_id), "disable_notification": "true"},
+                files={field: (os.path.basename(path), f)},
+                timeout=UPLOAD_TIMEOUT,
+            )
+        payload = response.json()
+        if response.status_code == 429:
+            await rate_limit.ablock(payload.get("parameters", {}).get("retry_after", 1))
+            continue
+        if not payload.get("ok"):
+            logger.error(f"Pre-upload of {path} rejected: {payload.get('description')}")
+            return None
+        return sent_file_id(payload["result"])
+    logger.warning(f"Pre-upload of {path} still rate limited after {MAX_RETRIES} retries")
+    return None
+
+
+async def check_file_id(file_id):
+    """True if Telegram still knows ``file_id``, False if not, None if that could not be told."""
+    try:
+        response = await get_client().post("getFile", json={"file_id": file_id})
+        if response.status_code == 200:
+            return True
+        description = response.json().get("description", "")
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning(f"file_id check failed: {e}")
+        return None
+    if response.status_code == 400:
+        # getFile refuses files over 20 MB but still recognizes their id
+        return "too big" in description
+    return None
+
+
+def preupload_version(version_id, force=False):
+    """
+    Uploads the file of the version ``version_id`` to the storage chat and
+    stores the file_id. A version that already has one is skipped unless
+    ``force``. Returns the file_id, or None if nothing was uploaded.
+    """
+    from apps.bot.utils import save_file_id_safe
+    from apps.content.models import DocumentVersion
+
+    version = DocumentVersion.objects.filter(pk=version_id).first()
+    if version is None or not version.file or not storage_chat():
+        return None
+    if version.telegram_file_id and not force:
+        return version.telegram_file_id
+
+    path = version.file.path
+    if not os.path.isfile(path):
+        logger.warning(f"Pre-upload skipped, file of version {version_id} is missing: {path}")
+        return None
+    if os.path.getsize(path) > (MAX_PHOTO_SIZE if is_image(path) else MAX_UPLOAD_SIZE):
+        logger.info(f"Pre-upload skipped, file of version {version_id} is over the Bot API upload limit")
+        return None
+
+    try:
+        file_id = run_sync(upload_document(path, storage_chat()))
+    except Exception as e:
+        logger.error(f"Pre-upload of version {version_id} failed: {e}")
+        return None
+    if file_id:
+        async_to_sync(save_file_id_safe)(version.content_node_id, file_id, version_id=version.pk)
+    return file_id
+
+
+def served_versions():
+    """The newest version of every document, the one users download."""
+    from apps.content.models import DocumentVersion
+
+    newest = (
+        DocumentVersion.objects
+        .filter(content_node=OuterRef("content_node"))
+        .order_by("-created_at")
+        .values("pk")[:1]
+    )
+    return DocumentVersion.objects.filter(pk=Subquery(newest)).exclude(file="")
+
+
+def _mark_checked(version_id):
+    from apps.content.models import DocumentVersion
+
+    # Not served data, so no need to go through save() and the content cache
+    DocumentVersion.objects.filter(pk=version_id).update(telegram_file_checked_at=timezone.now())
+
+
+def sync_file_ids(batch_size=SYNC_BATCH_SIZE):
+    """
+    Uploads up to ``batch_size`` served versions without a file_id and
+    re-checks up to ``batch_size`` file_ids not confirmed recently.
+    Returns counts of ``uploaded``, ``valid``, ``replaced`` and ``failed``.
+    """
+    stats = {"uploaded": 0, "valid": 0, "replaced": 0, "failed": 0}
+    if not storage_chat():
+        return stats
+
+    no_file_id = Q(telegram_file_id__isnull=True) | Q(telegram_file_id="")
+    missing = (
+        served_versions()
+        .filter(no_file_id)
+        .order_by(F("telegram_file_checked_at").asc(nulls_first=True), "pk")
+        .values_list("pk", flat=True)
+    )
+    for version_id in missing[:batch_size]:
+        if preupload_version(version_id):
+            stats["uploaded"] += 1
+        else:
+            # Files that cannot be uploaded go to the back of the line
+            _mark_checked(version_id)
+            stats["failed"] += 1
+
+    stale = (
+        served_versions()
+        .exclude(no_file_id)
+        .filter(
+            Q(telegram_file_checked_at__isnull=True)
+            | Q(telegram_file_checked_at__lt=timezone.now() - REVALIDATE_AFTER)
+        )
+        .order_by(F("telegram_file_checked_at").asc(nulls_first=True), "pk")
+    )
+    for version in stale[:batch_size]:
+        valid = run_sync(check_file_id(version.telegram_file_id))
+        if valid:
+            _mark_checked(version.pk)
+            stats["valid"] += 1
+        elif valid is False:
+            logger.info(f"file_id of version {version.pk} is no longer valid, uploading again")
+            if preupload_version(version.pk, force=True):
+                stats["replaced"] += 1
+            else:
+                # Let the bot upload from disk instead of failing on the dead id first
+                version.telegram_file_id = None
+                version.save(update_fields=["telegram_file_id"])
+                stats["failed"] += 1
+    return stats
@@ -0,0 +1,254 @@
+"""
+Telegram flood limits shared by every process that talks to the Bot API.
+
+The bot, the Celery notification tasks and the monitor all send messages
+with the same token, so the limits are enforced with token buckets kept
+in Redis: one global bucket (about 30 messages per second) and one bucket
+per chat (about one message per second). Both are checked and taken
+atomically by a Lua script that uses the Redis clock, so the processes
+never disagree about time.
+
+Interactive replies of the bot have priority over bulk notifications:
+bulk senders only take a global token while ``INTERACTIVE_RESERVE``
+tokens stay in the bucket. When Telegram answers 429 anyway its
+``retry_after`` is stored centrally and every process waits it out.
+
+Coroutines (the bot's rate limiter, notification and upload senders) run
+the scripts through ``redis.asyncio``, one client per event loop, so
+waiting on Redis never blocks the loop. ``aclose`` releases the client of
+the running loop; the bot's limiter calls it on shutdown and Celery
+workers when their process exits. ``try_acquire`` and ``block`` use
+the synchronous django-redis connection and are meant for sync callers.
+"""
+import asyncio
+import logging
+import random
+import weakref
+
+import redis.asyncio
+from django.conf import settings
+from redis.exceptions import RedisError
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from apps.bot.instrumentation import TELEGRAM, measure
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+# Global tokens only interactive requests may take
+INTERACTIVE_RESERVE = 10
+
+GLOBAL_KEY = "telegram:ratelimit:global"
+CHAT_KEY = "telegram:ratelimit:chat:{chat_id}"
+BLOCKED_KEY = "telegram:ratelimit:blocked"
+
+# Longest single sleep while waiting for a token, and retries after a 429
+MAX_WAIT_STEP = 1.0
+MAX_RETRIES = 3
+
+# KEYS: blocked, global bucket[, chat bucket]
+# ARGV: global rate, global burst, tokens to leave for others, chat rate, chat burst
+# Returns 0 when the tokens were taken, otherwise milliseconds to wait.
+_ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local blocked = tonumber(redis.call('GET', KEYS[1]) or '0')
+if blocked > now then
+    return blocked - now
+end
+
+local function level(key, rate, burst)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    return math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+end
+
+local global_rate, global_burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local needed = 1 + tonumber(ARGV[3])
+local global_tokens = level(KEYS[2], global_rate, global_burst)
+local wait = 0
+if global_tokens < needed then
+    wait = math.ceil((needed - global_tokens) * 1000 / global_rate)
+end
+
+local chat_tokens
+if KEYS[3] then
+    local chat_rate, chat_burst = tonumber(ARGV[4]), tonumber(ARGV[5])
+    chat_tokens = level(KEYS[3], chat_rate, chat_burst)
+    if chat_tokens < 1 then
+        wait = math.max(wait, math.ceil((1 - chat_tokens) * 1000 / chat_rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+
+redis.call('HSET', KEYS[2], 'tokens', global_tokens - 1, 'ts', now)
+redis.call('PEXPIRE', KEYS[2], 60000)
+if KEYS[3] then
+    redis.call('HSET', KEYS[3], 'tokens', chat_tokens - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[3], 60000)
+end
+return 0
+"""
+
+# KEYS: blocked; ARGV: milliseconds. Only ever extends the block.
+_BLOCK_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local until_ms = now + tonumber(ARGV[1])
+if until_ms > tonumber(redis.call('GET', KEYS[1]) or '0') then
+    redis.call('SET', KEYS[1], until_ms, 'PX', ARGV[1])
+end
+return until_ms
+"""
+
+
+class TelegramRateLimit:
+    """Redis token buckets for the global and per-chat Telegram limits."""
+
+    def __init__(self, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, reserve=INTERACTIVE_RESERVE):
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.reserve = reserve
+        self._scripts = None
+        # Async clients and their scripts, one per event loop
+        self._async_scripts = weakref.WeakKeyDictionary()
+
+    def _get_scripts(self):
+        if self._scripts is None:
+            from django_redis import get_redis_connection
+            connection = get_redis_connection("default")
+            self._scripts = (
+                connection.register_script(_ACQUIRE_SCRIPT),
+                connection.register_script(_BLOCK_SCRIPT),
+            )
+        return self._scripts
+
+    def _get_async_scripts(self):
+        loop = asyncio.get_running_loop()
+        scripts = self._async_scripts.get(loop)
+        if scripts is None:
+            client = redis.asyncio.Redis.from_url(settings.CACHES["default"]["LOCATION"])
+            scripts = (client, client.register_script(_ACQUIRE_SCRIPT), client.register_script(_BLOCK_SCRIPT))
+            self._async_scripts[loop] = scripts
+        return scripts[1:]
+
+    async def aclose(self):
+        """Closes the Redis client of the running event loop, if it has one."""
+        scripts = self._async_scripts.pop(asyncio.get_running_loop(), None)
+        if scripts is not None:
+            await scripts[0].aclose()
+
+    def _acquire_args(self, chat_id, priority):
+        keys = [BLOCKED_KEY, GLOBAL_KEY]
+        if chat_id is not None:
+            keys.append(CHAT_KEY.format(chat_id=chat_id))
+        reserve = self.reserve if priority == BULK else 0
+        return keys, [self.global_rate, self.global_burst, reserve, self.chat_rate, self.chat_burst]
+
+    def try_acquire(self, chat_id=None, priority=BULK):
+        """
+        Takes a token for one request. Returns 0 on success, otherwise the
+        seconds to wait before trying again. Fails open if Redis is down.
+        """
+        keys, args = self._acquire_args(chat_id, priority)
+        try:
+            acquire, _block = self._get_scripts()
+            wait_ms = acquire(keys=keys, args=args)
+        except RedisError as e:
+            logger.warning(f"Telegram rate limiter unavailable, sending unthrottled: {e}")
+            return 0
+        return int(wait_ms) / 1000
+
+    async def atry_acquire(self, chat_id=None, priority=BULK):
+        """``try_acquire`` without blocking the event loop."""
+        keys, args = self._acquire_args(chat_id, priority)
+        try:
+            acquire, _block = self._get_async_scripts()
+            wait_ms = await acquire(keys=keys, args=args)
+        except RedisError as e:
+            logger.warning(f"Telegram rate limiter unavailable, sending unthrottled: {e}")
+            return 0
+        return int(wait_ms) / 1000
+
+    async def acquire(self, chat_id=None, priority=BULK):
+        """Waits until a request to ``chat_id`` may be sent."""
+        while True:
+            wait = await self.atry_acquire(chat_id, priority)
+            if not wait:
+                return
+            # Jitter keeps the waiting senders from polling in lockstep
+            await asyncio.sleep(min(wait, MAX_WAIT_STEP) + random.uniform(0, 0.05))
+
+    def block(self, retry_after):
+        """Stops all senders for ``retry_after`` seconds after a 429 from Telegram."""
+        logger.warning(f"Telegram flood limit hit, pausing all senders for {retry_after}s")
+        try:
+            _acquire, block = self._get_scripts()
+            block(keys=[BLOCKED_KEY], args=[max(1, int(float(retry_after) * 1000))])
+        except RedisError as e:
+            logger.warning(f"Could not store Telegram retry_after: {e}")
+
+    async def ablock(self, retry_after):
+        """``block`` without blocking the event loop."""
+        logger.warning(f"Telegram flood limit hit, pausing all senders for {retry_after}s")
+        try:
+            _acquire, block = self._get_async_scripts()
+            await block(keys=[BLOCKED_KEY], args=[max(1, int(float(retry_after) * 1000))])
+        except RedisError as e:
+            logger.warning(f"Could not store Telegram retry_after: {e}")
+
+
+rate_limit = TelegramRateLimit()
+
+
+def chat_of(data):
+    """The chat a Bot API request is addressed to, if any."""
+    chat_id = data.get("chat_id") if data else None
+    if chat_id is None or isinstance(chat_id, (int, str)):
+        return chat_id
+    return getattr(chat_id, "id", None)
+
+
+class SharedRateLimiter(BaseRateLimiter):
+    """
+    python-telegram-bot rate limiter backed by ``rate_limit``. Requests of
+    the bot are interactive unless ``rate_limit_args`` says ``"bulk"``.
+    """
+
+    def __init__(self, limit=None, max_retries=MAX_RETRIES):
+        self.limit = limit or rate_limit
+        self.max_retries = max_retries
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        await self.limit.aclose()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = rate_limit_args if rate_limit_args in (INTERACTIVE, BULK) else INTERACTIVE
+        chat_id = chat_of(data)
+        # Waiting for a token is part of the handler's Telegram time
+        with measure(TELEGRAM):
+            for attempt in range(self.max_retries + 1):
+                await self.limit.acquire(chat_id, priority)
+                try:
+                    return await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    await self.limit.ablock(e.retry_after)
+                    if attempt == self.max_retries:
+                        raise
@@ -0,0 +1,25 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.bot.alerts import invalidate_admin_recipients
+from apps.bot.models import AdminNotificationSettings, BotUser
+from apps.bot.subscriptions import invalidate_subscriptions
+
+
+@receiver(m2m_changed, sender=BotUser.subscribed_categories.through)
+def drop_cached_subscriptions(sender, instance, action, reverse, pk_set, **kwargs):
+    # Covers the bot and web toggles as well as edits in the admin
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        invalidate_subscriptions(instance.telegram_id)
+    elif action == "pre_clear":
+        invalidate_subscriptions(*instance.subscribers.values_list("telegram_id", flat=True))
+    else:
+        invalidate_subscriptions(*BotUser.objects.filter(pk__in=pk_set).values_list("telegram_id", flat=True))
+
+
+@receiver(post_save, sender=AdminNotificationSettings)
+@receiver(post_delete, sender=AdminNotificationSettings)
+def drop_cached_admin_recipients(sender, instance, **kwargs):
+    invalidate_admin_recipients()
@@ -0,0 +1,67 @@
+"""
+Cached category subscriptions of bot users.
+
+Every menu render shows a subscribe bell, so each user's subscribed
+category ids are kept in the cache as one compact set. Whether a
+subscription is inherited from an ancestor is answered by the in-memory
+content tree, so the bell state costs no database queries.
+
+The sets are keyed by a per-user version that is bumped when a change to
+the subscriptions commits (see ``apps.bot.signals``). A reader that
+loaded the rows before the commit writes them under the old version,
+which is never read again, so a stale set cannot outlive the change.
+
+Versions expire too. Every bump sets a new timestamp, and a version key
+outlives every set cached under it, so once it expires and the user is
+back on version 0 no set from before remains.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.bot.models import BotUser
+
+SUBSCRIPTIONS_KEY = "bot:subscriptions:{telegram_id}:{version}"
+SUBSCRIPTIONS_VERSION_KEY = "bot:subscriptions:{telegram_id}:version"
+SUBSCRIPTIONS_TIMEOUT = 60 * 60 * 24
+SUBSCRIPTIONS_VERSION_TIMEOUT = SUBSCRIPTIONS_TIMEOUT * 2
+
+
+def get_subscribed_category_ids(telegram_id):
+    """Ids of the categories the user subscribed to directly (empty for unknown users)."""
+    version = cache.get(SUBSCRIPTIONS_VERSION_KEY.format(telegram_id=telegram_id), 0)
+    key = SUBSCRIPTIONS_KEY.format(telegram_id=telegram_id, version=version)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            BotUser.subscribed_categories.through.objects
+            .filter(botuser__telegram_id=telegram_id)
+            .values_list("category_id", flat=True)
+        )
+        cache.set(key, ids, timeout=SUBSCRIPTIONS_TIMEOUT)
+    return ids
+
+
+def subscription_status(subscribed_ids, tree, category_id):
+    """
+    ``(True, "direct")``, ``(True, "inherited")`` or ``(False, None)`` for
+    ``category_id`` given the user's subscribed ids and a content tree.
+    """
+    category_id = int(category_id)
+    if category_id in subscribed_ids:
+        return True, "direct"
+    if subscribed_ids and not subscribed_ids.isdisjoint(tree.ancestor_ids(category_id)):
+        return True, "inherited"
+    return False, None
+
+
+def _bump_versions(keys):
+    cache.set_many(dict.fromkeys(keys, time.time_ns()), timeout=SUBSCRIPTIONS_VERSION_TIMEOUT)
+
+
+def invalidate_subscriptions(*telegram_ids):
+    """Moves the users to fresh cache keys once the current transaction commits."""
+    keys = [SUBSCRIPTIONS_VERSION_KEY.format(telegram_id=telegram_id) for telegram_id in telegram_ids]
+    if keys:
+        transaction.on_commit(lambda: _bump_versions(keys))
@@ -0,0 +1,56 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def dispatch_outbox_task():
+    """Delivers due notifications from the outbox"""
+    from apps.bot.outbox import dispatch_outbox
+    stats = dispatch_outbox()
+    if any(stats.values()):
+        logger.info(
+            f"Outbox dispatch: {stats['sent']} sent in {stats['messages']} messages, "
+            f"{stats['retrying']} to retry, {stats['failed']} failed"
+        )
+    return stats
+
+
+@shared_task
+def flush_admin_alert_task(key):
+    """Sends the summary of an alert that repeated within its window"""
+    from apps.bot.alerts import flush_alert
+    return flush_alert(key)
+
+
+@shared_task
+def prune_bot_persistence_task():
+    """Drops bot persistence entries of users and chats inactive for longer than STATE_TTL"""
+    import redis
+    from django.conf import settings
+    from apps.bot.persistence import prune_inactive
+
+    pruned = prune_inactive(redis.from_url(settings.REDIS_URL))
+    logger.info(f"Pruned {sum(pruned.values())} inactive bot persistence entries")
+    return pruned
+
+
+@shared_task
+def preupload_document_task(version_id):
+    """Uploads a new document version to the storage chat to get its telegram_file_id"""
+    from apps.bot.preupload import preupload_version
+    return preupload_version(version_id)
+
+
+@shared_task
+def sync_file_ids_task():
+    """Uploads documents still without a telegram_file_id and re-checks old ones"""
+    from apps.bot.preupload import sync_file_ids
+    stats = sync_file_ids()
+    if any(stats.values()):
+        logger.info(
+            f"file_id sync: {stats['uploaded']} uploaded, {stats['valid']} still valid, "
+            f"{stats['replaced']} replaced, {stats['failed']} failed"
+        )
+    return stats
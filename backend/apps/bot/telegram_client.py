@@ -0,0 +1,85 @@
+"""
+Shared HTTP client for the Telegram Bot API outside of the bot process.
+
+Opening an ``httpx.AsyncClient`` per message pays a TCP and TLS handshake
+for every notification. Instead every event loop gets one pooled
+keep-alive client (HTTP/2 when the ``h2`` package is installed), and sync
+callers such as Celery tasks and Django signals run their coroutines on a
+single long-lived loop per process rather than a fresh loop per call.
+"""
+import asyncio
+import logging
+import os
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# One client per event loop: pooled connections cannot be shared between loops
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """The pooled Bot API client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/",
+            http2=HTTP2,
+            limits=LIMITS,
+            timeout=TIMEOUT,
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def get_worker_loop():
+    """The process-wide background event loop, started on first use (and again after a fork)."""
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid() or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="telegram-worker-loop", daemon=True).start()
+        return _loop
+
+
+def submit(coro):
+    """Schedules ``coro`` on the worker loop without waiting for it."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_worker_loop())
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def run_sync(coro, timeout=None):
+    """Runs ``coro`` on the worker loop and returns its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_worker_loop()).result(timeout)
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Background coroutine failed: {future.exception()}")
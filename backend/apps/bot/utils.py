@@ -1,8 +1,9 @@
+import asyncio
 import logging
-import re
-import html as html_lib
 from asgiref.sync import sync_to_async
-from apps.bot.models import BotUser, SupportRequest, AdminNotificationSettings
+from django.utils import timezone
+from apps.bot.models import BotUser, SupportRequest
+from apps.bot.formatting import html_to_telegram  # noqa: F401
 
 logger = logging.getLogger(__name__)
 
@@ -87,30 +88,24 @@ def update_user_agreement(telegram_id):
 
 @sync_to_async
 def is_user_subscribed(telegram_id, category_id):
-    from apps.content.models import Category
-    user = BotUser.objects.filter(telegram_id=telegram_id).prefetch_related('subscribed_categories').first()
-    if user:
-        if user.subscribed_categories.filter(id=category_id).exists():
-            return True, "direct"
-        
-        try:
-            category = Category.objects.get(id=category_id)
-            ancestors = category.get_ancestors()
-            if user.subscribed_categories.filter(id__in=ancestors).exists():
-                return True, "inherited"
-        except Category.DoesNotExist:
-            pass
-            
-    return False, None
+    from apps.content.tree import get_content_tree
+    from apps.bot.subscriptions import get_subscribed_category_ids, subscription_status
+    subscribed_ids = get_subscribed_category_ids(telegram_id)
+    return subscription_status(subscribed_ids, get_content_tree(), category_id)
 
 @sync_to_async
-def save_file_id_safe(document_id, file_id):
+def save_file_id_safe(document_id, file_id, version_id=None):
+    """Stores ``file_id`` on the version ``version_id``, by default the newest version of the document."""
     from apps.content.models import Category, DocumentVersion
     try:
         node = Category.objects.get(id=document_id)
-        version = DocumentVersion.objects.filter(content_node=node).order_by("-created_at").first()
+        versions = DocumentVersion.objects.filter(content_node=node)
+        if version_id is not None:
+            versions = versions.filter(pk=version_id)
+        version = versions.order_by("-created_at").first()
         if version:
             version.telegram_file_id = file_id
+            version.telegram_file_checked_at = timezone.now()
             version.save()
     except Exception as e:
         logger.error(f"Error saving file_id: {e}") 
@@ -135,68 +130,14 @@ def save_support_request(telegram_id, message):
     return user
 
 async def notify_admins(app, message, user_info):
-    admins = await sync_to_async(lambda: list(AdminNotificationSettings.objects.filter(telegram_id__isnull=False)))()
-    
-    for admin in admins:
+    from apps.bot.alerts import get_admin_recipients
+    admin_ids = await sync_to_async(get_admin_recipients)()
+    text = f"📨 <b>Новое обращение в поддержку!</b>\n\nОт: {user_info}\n\nСообщение:\n<i>{message}</i>"
+
+    async def send(admin_id):
         try:
-            text = f"📨 <b>Новое обращение в поддержку!</b>\n\nОт: {user_info}\n\nСообщение:\n<i>{message}</i>"
-            await app.bot.send_message(chat_id=admin.telegram_id, text=text, parse_mode="HTML")
+            await app.bot.send_message(chat_id=admin_id, text=text, parse_mode="HTML")
         except Exception as e:
-            logger.error(f"Failed to notify admin {admin.telegram_id}: {e}")
+            logger.error(f"Failed to notify admin {admin_id}: {e}")
 
-def html_to_telegram(html_content):
-    """
-    Converts a subset of HTML to Telegram-compatible HTML.
-    Strips unsupported tags while trying to preserve structure (tables, blocks).
-    """
-    if not html_content:
-        return ""
-        
-    # 0. Handle &nbsp; and common entities that TG HATES in HTML mode
-    # TG supports &lt; &gt; &amp; but NOT &nbsp;
-    html_content = html_content.replace("&nbsp;", " ")
-    
-    # 1. Handle tables (Telegram doesn't support them in captions)
-    # Add vertical bars for cells and newlines for rows
-    html_content = re.sub(r'</td>|</th>', ' | ', html_content)
-    # Row separator
-    html_content = re.sub(r'</tr>', '\n' + '—' * 15 + '\n', html_content)
-    
-    # 2. Convert block tags to newlines
-    html_content = re.sub(r'</p>|</div>|<br\s*/?>', '\n', html_content)
-    
-    # 3. Strip all tags except those supported by Telegram
-    allowed_tags = ['b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del', 'a', 'code', 'pre']
-    
-    def strip_unsupported(match):
-        tag_full = match.group(0)
-        tag_name = match.group(2).lower() # Group 2 is the tag name in re below: (/?)([a-zA-Z0-9]+)
-        if tag_name in allowed_tags:
-            return tag_full
-        return ""
-        
-    # Match <tag...>, </tag>, <tag/>
-    clean_html = re.sub(r'<(/?)([a-zA-Z0-9]+)[^>]*>', strip_unsupported, html_content)
-    
-    # 4. Handle other entities (but carefully, avoiding breaking < > & for TG)
-    # We want to unescape things like &quot; if they aren't < > &
-    # Actually, html_lib.unescape is mostly safe if we've already handled < > in tags
-    # But for safety, let's just specifically unescape everything and THEN escape < > & back 
-    # except for the tags we kept. This is hard.
-    # Let's just do a specific unescape for common ones CKEditor might produce.
-    entities_to_fix = {
-        "&laquo;": "«",
-        "&raquo;": "»",
-        "&ndash;": "–",
-        "&mdash;": "—",
-        "&copy;": "©",
-        "&reg;": "®",
-    }
-    for ent, val in entities_to_fix.items():
-        clean_html = clean_html.replace(ent, val)
-
-    # 5. Clean up multiple newlines and spaces
-    clean_html = re.sub(r'\n\s*\n', '\n\n', clean_html)
-    clean_html = clean_html.strip()
-    
-    return clean_html
+    await asyncio.gather(*(send(admin_id) for admin_id in admin_ids))
@@ -0,0 +1,154 @@
+"""
+Webhook ingestion of Telegram updates.
+
+``TelegramWebhook`` is a plain ASGI application: it checks the secret
+token Telegram sends with every update (``setWebhook(secret_token=...)``),
+puts the parsed update on the application's update queue and answers 200
+right away. Handlers run afterwards, so a slow handler never makes
+Telegram time out and redeliver. ``serve_webhook`` runs it under uvicorn
+next to a started ``Application`` built without an updater.
+
+Webhook mode runs as a single replica. Conversation states are loaded
+once at startup and user and chat data once per process (see
+``apps.bot.persistence``), so a second process would keep its own copy
+of them and a user whose updates alternate between the two would drop
+out of the registration and support conversations. ``serve_webhook``
+holds a lock in Redis while it serves and refuses to start while another
+process holds it.
+"""
+import asyncio
+import hmac
+import json
+import logging
+
+import redis.asyncio
+from django.conf import settings
+from redis.exceptions import LockError
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+HEALTH_PATH = "/healthz"
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+# Telegram updates are a few KB; anything far bigger is not from Telegram
+MAX_BODY_SIZE = 1024 * 1024
+
+# Held by the one process serving the webhook; renewed every third of its timeout
+INSTANCE_LOCK_KEY = "bot:webhook:instance"
+INSTANCE_LOCK_TIMEOUT = 30
+
+
+class TelegramWebhook:
+    """ASGI endpoint feeding updates into ``application.update_queue``."""
+
+    def __init__(self, application, secret_token, path=WEBHOOK_PATH):
+        if not secret_token:
+            raise ValueError("A webhook needs a secret token")
+        self.application = application
+        self.secret_token = secret_token.encode()
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] == HEALTH_PATH and scope["method"] in ("GET", "HEAD"):
+            return await _respond(send, 200, b"ok")
+        if scope["path"] != self.path:
+            return await _respond(send, 404)
+        if scope["method"] != "POST":
+            return await _respond(send, 405)
+
+        secret = dict(scope["headers"]).get(SECRET_HEADER, b"")
+        if not hmac.compare_digest(secret, self.secret_token):
+            logger.warning(f"Rejected webhook request from {scope.get('client')}: bad secret token")
+            return await _respond(send, 403)
+
+        body = await _read_body(receive)
+        if body is None:
+            return await _respond(send, 413)
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Malformed webhook update: {e}")
+            return await _respond(send, 400)
+
+        await self.application.update_queue.put(update)
+        await _respond(send, 200)
+
+
+async def _read_body(receive):
+    """The request body, or None once it exceeds ``MAX_BODY_SIZE``."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b"".join(chunks)
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status, body=b""):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _keep_lock(lock, server):
+    """Renews ``lock`` until cancelled; stops ``server`` if the lock was lost."""
+    while True:
+        await asyncio.sleep(INSTANCE_LOCK_TIMEOUT / 3)
+        try:
+            await lock.reacquire()
+        except LockError:
+            logger.error("Lost the webhook instance lock, stopping the webhook server")
+            server.should_exit = True
+            return
+
+
+async def serve_webhook(application, url, secret_token, host="0.0.0.0", port=8080, path=WEBHOOK_PATH):
+    """
+    Registers ``url`` with Telegram and serves updates until the server is
+    stopped (SIGINT / SIGTERM). ``application`` must be built without an
+    updater. Raises RuntimeError if another process is serving the webhook.
+    """
+    import uvicorn
+
+    endpoint = TelegramWebhook(application, secret_token, path)
+    server = uvicorn.Server(uvicorn.Config(endpoint, host=host, port=port, lifespan="off", log_level="warning"))
+
+    client = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+    lock = client.lock(INSTANCE_LOCK_KEY, timeout=INSTANCE_LOCK_TIMEOUT)
+    try:
+        if not await lock.acquire(blocking=False):
+            raise RuntimeError("Another process is already serving the Telegram webhook")
+        renewal = asyncio.ensure_future(_keep_lock(lock, server))
+        try:
+            async with application:
+                await application.start()
+                try:
+                    await application.bot.set_webhook(
+                        url=url,
+                        secret_token=secret_token,
+                        allowed_updates=Update.ALL_TYPES,
+                    )
+                    logger.info(f"Serving Telegram webhook {url} on {host}:{port}{path}")
+                    await server.serve()
+                finally:
+                    await application.stop()
+        finally:
+            renewal.cancel()
+            try:
+                await lock.release()
+            except LockError:
+                pass
+    finally:
+        await client.aclose()
@@ -0,0 +1,122 @@
+"""
+Concurrent update processing with per-user ordering.
+
+By default python-telegram-bot awaits every update before taking the next
+one, so a slow handler (a large document upload) stalls every user queued
+behind it. ``PartitionedUpdateProcessor`` runs ``workers`` coroutines,
+each with its own queue, and routes every update by user (or chat) id.
+Updates of one user always land on the same worker and are processed in
+the order they arrived, which ``ConversationHandler`` relies on, while
+different users no longer wait for each other. Each worker holds at most
+``MAX_QUEUED_PER_WORKER`` updates; further updates for it wait for room
+without taking any from the other workers, so one user flooding the bot
+only slows down the users sharing their worker.
+
+``snapshot()`` reports the queued updates and the longest time an update
+waited for its worker; the bot heartbeat stores both in ``BotStatus``.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+# Updates a worker may hold, queued or in progress, before the next ones wait for room
+MAX_QUEUED_PER_WORKER = 32
+
+
+def partition_key(update):
+    """User id, else chat id, of an update; updates of neither kind get their own key."""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return update.update_id
+    return id(update)
+
+
+class PartitionedUpdateProcessor(BaseUpdateProcessor):
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        if workers < 1:
+            raise ValueError("At least one worker is needed")
+        super().__init__(max_concurrent_updates=workers * MAX_QUEUED_PER_WORKER)
+        self.workers = workers
+        self._queues = []
+        # Room per worker, see process_update
+        self._slots = []
+        self._tasks = []
+        # Enqueue times of the updates waiting in each queue, oldest first
+        self._waiting = []
+        # Longest wait for a worker since the last snapshot
+        self._max_wait = 0.0
+
+    async def initialize(self):
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._slots = [asyncio.Semaphore(MAX_QUEUED_PER_WORKER) for _ in range(self.workers)]
+        self._waiting = [deque() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._work(number), name=f"bot-worker-{number}")
+            for number in range(self.workers)
+        ]
+
+    async def shutdown(self):
+        # Application.stop() has already waited for every queued update
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queues, self._slots, self._waiting, self._tasks = [], [], [], []
+
+    async def process_update(self, update, coroutine):
+        # Bounded per worker in do_process_update instead of by the shared semaphore,
+        # which a single flooding user could fill up for everyone
+        await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        done = asyncio.get_running_loop().create_future()
+        number = partition_key(update) % self.workers
+        self._waiting[number].append(time.monotonic())
+        # The semaphore hands out room first come, first served, so the order is kept
+        async with self._slots[number]:
+            self._queues[number].put_nowait((coroutine, done))
+            # Returning only once handled keeps Application.stop() waiting for the queues to drain
+            await done
+
+    async def _work(self, number):
+        queue, waiting = self._queues[number], self._waiting[number]
+        while True:
+            coroutine, done = await queue.get()
+            self._max_wait = max(self._max_wait, time.monotonic() - waiting.popleft())
+            try:
+                await coroutine
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    # The worker itself is being stopped
+                    done.cancel()
+                    raise
+                # Raised by the handler (a cancelled task it awaited); the worker carries on
+                logger.error("Update processing was cancelled")
+            except Exception as e:
+                # Handler errors go to the error handler inside the coroutine, so this is rare;
+                # not re-raised, or Application.stop() would wait for the update forever
+                logger.error(f"Update processing failed: {e}")
+            if not done.done():
+                done.set_result(None)
+
+    def snapshot(self):
+        """
+        ``{"queued": updates waiting for a worker, "lag": seconds}``, where
+        lag is the longest wait since the previous snapshot or the age of
+        the oldest update still waiting, whichever is larger.
+        """
+        now = time.monotonic()
+        oldest = [now - waiting[0] for waiting in self._waiting if waiting]
+        lag = max([self._max_wait, *oldest])
+        self._max_wait = 0.0
+        return {"queued": sum(len(waiting) for waiting in self._waiting), "lag": lag}
@@ -3,10 +3,10 @@ from django.contrib.auth.views import LoginView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView, ListView, DetailView, CreateView
 from django.views import View
-from django.db.models import Q
 from django.contrib.auth import login
 from django.urls import reverse_lazy
 from apps.content.models import Category, DocumentVersion
+from apps.content.search import highlight, search_documents
 from django.http import HttpResponse, Http404
 import os
 from django.conf import settings
@@ -92,10 +92,9 @@ class CategoryDetailView(LoginRequiredMixin, DetailView):
         
         if self.request.user.telegram_id:
             context['has_telegram'] = True
-            from apps.bot.models import BotUser
-            bot_user = BotUser.objects.filter(telegram_id=self.request.user.telegram_id).first()
-            if bot_user:
-                context['is_subscribed'] = bot_user.subscribed_categories.filter(id=category.id).exists()
+            from apps.bot.subscriptions import get_subscribed_category_ids
+            subscribed_ids = get_subscribed_category_ids(self.request.user.telegram_id)
+            context['is_subscribed'] = category.id in subscribed_ids
         
         return context
 
@@ -167,11 +166,7 @@ class SearchView(LoginRequiredMixin, ListView):
         if not query:
             return Category.objects.none()
         
-        return Category.objects.filter(
-            Q(title__icontains=query) | Q(description__icontains=query),
-            is_folder=False,
-            visible_in_bot=True
-        )
+        return search_documents(query).select_related('parent')
 
     def get(self, request, *args, **kwargs):
         response = super().get(request, *args, **kwargs)
@@ -196,6 +191,8 @@ class SearchView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
+        for result in context['results']:
+            result.headline = highlight(result.headline)
         return context
 
 from django.contrib import messages
@@ -26,5 +26,8 @@ class DocumentDetailView(APIView):
 class SearchView(APIView):
     def get(self, request):
         query = request.GET.get("q", "")
-        results = services.search_content(query)
+        category_id = request.GET.get("category")
+        if category_id and not category_id.isdigit():
+            return Response({"detail": "category must be a category id"}, status=400)
+        results = services.search_content(query, category_id=category_id or None)
         return Response(results)
@@ -0,0 +1,381 @@
+"""
+Global content revision shared by every process that serves content.
+
+Any change to the ``Category`` tree or to a ``DocumentVersion`` bumps a
+single counter in Redis (one atomic INCR) and records which nodes changed
+under that revision. Content caches are namespaced by the revision, so a
+bump logically invalidates all of them at once; entries of older
+revisions are never read again and simply expire. Processes holding
+derived state (e.g. the in-memory content tree of the bot) compare their
+revision with the current one and replay the change log to catch up.
+
+Cached payloads live in two tiers: a bounded LRU inside the process in
+front of the shared Redis cache. Every bump is also published on
+``INVALIDATION_CHANNEL``; processes running the invalidation listener
+(gunicorn workers, celery workers, the bot) track the revision from those
+messages instead of asking Redis for it on every lookup.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+from redis.exceptions import LockError
+
+logger = logging.getLogger(__name__)
+
+REVISION_KEY = "content:revision"
+CHANGES_KEY = "content:changes:{revision}"
+CHANGES_TIMEOUT = 60 * 60
+MAX_CHANGES_REPLAY = 1000
+
+CACHE_KEY = "content:{revision}:{name}"
+CACHE_TIMEOUT = 60 * 15
+
+# Process-local tier
+LOCAL_CACHE_SIZE = 512
+LOCAL_CACHE_TIMEOUT = 60
+
+INVALIDATION_CHANNEL = "content:invalidate"
+# Seconds between reconnection attempts of the invalidation listener
+LISTENER_RETRY_DELAY = 5.0
+
+# Single-flight rebuilds: how long a rebuild may hold the lock and how long
+# other callers wait for it when there is no stale payload to serve
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 1.0
+LOCK_POLL_INTERVAL = 0.02
+
+# Last built payload per name regardless of revision, served during rebuilds
+STALE_KEY = "content:stale:{name}"
+STALE_TIMEOUT = 60 * 60 * 24
+NEGATIVE_TIMEOUT = 60
+
+_MISSING = object()
+
+
+class NotFound:
+    """Cached in place of payloads whose object does not exist."""
+
+
+NOT_FOUND = NotFound()
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def _count(event):
+    with _metrics_lock:
+        _metrics[event] += 1
+
+
+def get_cache_metrics():
+    """Counters of content cache lookups in this process."""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def reset_cache_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+class LocalCache:
+    """Thread-safe LRU with a per-entry time to live."""
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+local_cache = LocalCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TIMEOUT)
+
+# Revision as last announced on INVALIDATION_CHANNEL; None while not subscribed
+_revision = None
+_revision_lock = threading.Lock()
+
+
+def _observe_revision(revision, subscribed=False):
+    """Records a revision seen by the listener and drops outdated local entries."""
+    global _revision
+    with _revision_lock:
+        if subscribed or _revision is None or revision > _revision:
+            if revision != _revision:
+                local_cache.clear()
+            _revision = revision
+
+
+def _forget_revision():
+    global _revision
+    with _revision_lock:
+        _revision = None
+
+
+def tracked_content_revision():
+    """The revision known from pub/sub, or None if this process is not listening."""
+    return _revision
+
+
+def get_content_revision():
+    """Returns the current content revision (0 if nothing changed yet)."""
+    revision = _revision
+    if revision is not None:
+        return revision
+    if _restart_listener:
+        start_invalidation_listener()
+    return cache.get(REVISION_KEY, 0)
+
+
+def content_cache_key(name, revision=None):
+    """Cache key for ``name`` in the namespace of the current (or given) revision."""
+    if revision is None:
+        revision = get_content_revision()
+    return CACHE_KEY.format(revision=revision, name=name)
+
+
+def get_cached_content(name, build, timeout=CACHE_TIMEOUT):
+    """
+    Returns the payload cached under ``name`` for the current revision,
+    looking in the process-local tier first, then in Redis, and calling
+    ``build()`` only if neither has it. Cached payloads are shared between
+    callers and must not be mutated.
+
+    A miss is rebuilt by one caller at a time (see ``_rebuild``). ``Http404``
+    raised by ``build`` is cached as well and re-raised on later lookups.
+    """
+    key = content_cache_key(name)
+    value = local_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count("local_hits")
+    else:
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = _rebuild(name, key, build, timeout)
+        else:
+            _count("redis_hits")
+            local_cache.set(key, value)
+
+    if isinstance(value, NotFound):
+        _count("negative_hits")
+        raise Http404(f"No content for {name}")
+    return value
+
+
+def _rebuild(name, key, build, timeout):
+    """
+    Single-flight recomputation of a missed key: the caller holding the
+    short Redis lock builds the payload, everyone else gets the previous
+    revision's payload if there is one, or waits for the lock holder.
+    """
+    lock = cache.lock(f"{key}:lock", timeout=LOCK_TIMEOUT)
+    if lock.acquire(blocking=False):
+        try:
+            # The previous holder may have finished between our miss and the lock
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = _build(name, key, build, timeout)
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                logger.warning(f"Lock for {key} expired while rebuilding")
+        local_cache.set(key, value)
+        return value
+
+    stale = cache.get(STALE_KEY.format(name=name))
+    if stale is not None:
+        _count("stale_hits")
+        return stale
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            _count("coalesced_hits")
+            local_cache.set(key, value)
+            return value
+
+    # The lock holder is too slow or gone; do not keep the user waiting
+    _count("lock_timeouts")
+    value = _build(name, key, build, timeout)
+    local_cache.set(key, value)
+    return value
+
+
+def _build(name, key, build, timeout):
+    _count("rebuilds")
+    try:
+        value = build()
+    except Http404:
+        cache.set(key, NOT_FOUND, timeout=NEGATIVE_TIMEOUT)
+        cache.delete(STALE_KEY.format(name=name))
+        return NOT_FOUND
+
+    cache.set(key, value, timeout=timeout)
+    cache.set(STALE_KEY.format(name=name), value, timeout=STALE_TIMEOUT)
+    return value
+
+
+def bump_content_revision(node_ids=()):
+    """Atomically increments the revision and logs the changed node ids."""
+    cache.add(REVISION_KEY, 0, timeout=None)
+    revision = cache.incr(REVISION_KEY)
+    cache.set(CHANGES_KEY.format(revision=revision), list(node_ids), timeout=CHANGES_TIMEOUT)
+    if _revision is not None:
+        _observe_revision(revision)
+    _publish_revision(revision)
+    return revision
+
+
+def _publish_revision(revision):
+    from django_redis import get_redis_connection
+    try:
+        get_redis_connection("default").publish(INVALIDATION_CHANNEL, revision)
+    except Exception as e:
+        # Listeners fall back to the local TTL and resync on reconnect
+        logger.warning(f"Failed to publish content revision {revision}: {e}")
+
+
+def get_content_changes(since, until):
+    """
+    Returns the set of node ids changed after revision ``since`` up to
+    ``until``, or None if the log is incomplete and a full reload is needed.
+    """
+    if until < since or until - since > MAX_CHANGES_REPLAY:
+        return None
+
+    keys = [CHANGES_KEY.format(revision=r) for r in range(since + 1, until + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+
+    changed = set()
+    for node_ids in found.values():
+        changed.update(node_ids)
+    return changed
+
+
+def mark_content_changed(*node_ids):
+    """Bumps the revision once the current transaction commits."""
+    node_ids = [node_id for node_id in node_ids if node_id is not None]
+    transaction.on_commit(lambda: _content_committed(node_ids))
+
+
+def _content_committed(node_ids):
+    from apps.content.tasks import schedule_warm_content_cache
+    bump_content_revision(node_ids)
+    schedule_warm_content_cache(len(node_ids) or 1)
+
+
+class InvalidationListener(threading.Thread):
+    """Keeps the tracked revision in sync with ``INVALIDATION_CHANNEL``."""
+
+    def __init__(self):
+        super().__init__(name="content-invalidation", daemon=True)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                logger.warning(f"Content invalidation listener disconnected: {e}")
+            finally:
+                _forget_revision()
+            self._stop_event.wait(LISTENER_RETRY_DELAY)
+
+    def _listen(self):
+        from django_redis import get_redis_connection
+        pubsub = get_redis_connection("default").pubsub()
+        try:
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            while not self._stop_event.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                if message["type"] == "subscribe":
+                    # Read the counter only once subscribed, so no bump falls in between
+                    _observe_revision(cache.get(REVISION_KEY, 0), subscribed=True)
+                elif message["type"] == "message":
+                    _observe_revision(int(message["data"]))
+        finally:
+            pubsub.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+# Set in a child forked from a listening process until it has its own listener
+_restart_listener = False
+
+
+def start_invalidation_listener():
+    """Subscribes this process to revision bumps. Safe to call more than once."""
+    global _listener, _restart_listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = InvalidationListener()
+            _listener.start()
+        _restart_listener = False
+    return _listener
+
+
+def _after_fork_in_child():
+    """
+    The listener thread does not survive a fork (e.g. gunicorn --preload
+    starting it in the master): forget the parent's revision and locks,
+    and start a listener of this process on the first lookup.
+    """
+    global _listener, _listener_lock, _restart_listener, _revision, _revision_lock
+    _revision_lock = threading.Lock()
+    _listener_lock = threading.Lock()
+    _revision = None
+    _restart_listener = _listener is not None
+    _listener = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def stop_invalidation_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
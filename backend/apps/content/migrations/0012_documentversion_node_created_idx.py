@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0011_documentversion_file_size'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentversion',
+            index=models.Index(fields=['content_node', '-created_at'], name='content_ver_node_created_idx'),
+        ),
+    ]
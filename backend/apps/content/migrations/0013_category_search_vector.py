@@ -0,0 +1,55 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# Title (weight A) and tag-stripped description (weight B), Russian stemming.
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('russian', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('russian', regexp_replace(coalesce({row}description, ''), '<[^>]*>', ' ', 'g')), 'B')
+"""
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION content_category_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER content_category_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON content_category
+    FOR EACH ROW EXECUTE FUNCTION content_category_search_vector_update();
+
+UPDATE content_category SET search_vector = {SEARCH_VECTOR_SQL.format(row='')};
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS content_category_search_vector_trigger ON content_category;
+DROP FUNCTION IF EXISTS content_category_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0012_documentversion_node_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='content_category_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['tree_id', 'lft'], name='content_category_tree_id_lbc4a'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
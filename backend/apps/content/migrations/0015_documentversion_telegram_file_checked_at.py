@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0014_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentversion',
+            name='telegram_file_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,7 @@
 from django.db import models
 from django_ckeditor_5.fields import CKEditor5Field
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from django.core.cache import cache
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 class Equipment(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -11,6 +10,9 @@ class Equipment(models.Model):
         return self.name
 
     class Meta:
+        indexes = [
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="content_equip_name_trgm_idx"),
+        ]
         verbose_name = "Оборудование"
         verbose_name_plural = "Оборудование"
 
@@ -32,10 +34,17 @@ class Category(MPTTModel):
     equipment = models.ForeignKey(Equipment, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Оборудование")
     description = CKEditor5Field(verbose_name="Описание", blank=True, config_name='extends')
 
+    # Maintained by a database trigger, see apps.content.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class MPTTMeta:
         order_insertion_by = ["order"]
 
     class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="content_category_search_idx"),
+            GinIndex(fields=["title"], opclasses=["gin_trgm_ops"], name="content_cat_title_trgm_idx"),
+        ]
         verbose_name = "Узел контента"
         verbose_name_plural = "Дерево контента"
 
@@ -87,9 +96,15 @@ class DocumentVersion(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     author = models.CharField(max_length=255)
     telegram_file_id = models.CharField(max_length=255, blank=True, null=True)
+    # Last time telegram_file_id was confirmed by Telegram or an upload was tried, see apps.bot.preupload
+    telegram_file_checked_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Latest-version lookups per node (services._latest_version)
+            models.Index(fields=["content_node", "-created_at"], name="content_ver_node_created_idx"),
+        ]
         verbose_name = "Версия файла"
         verbose_name_plural = "Версии файлов"
 
@@ -116,22 +131,3 @@ class DocumentVersion(models.Model):
         if not self.file:
             return ""
         return self.file.name.split('.')[-1].lower()
-
-
-@receiver(post_save, sender=Category)
-@receiver(post_delete, sender=Category)
-def clear_content_cache(sender, instance, **kwargs):
-    """Clears bot cache when category or document is updated."""
-    # 1. Clear root cache (always safe)
-    cache.delete("category_root")
-    
-    # 2. Clear this item's details cache
-    cache.delete(f"category_{instance.id}_details")
-    
-    # 3. Clear parent's details cache (to update children list)
-    if instance.parent_id:
-        cache.delete(f"category_{instance.parent_id}_details")
-    
-    # 4. Clear all ancestor caches for safety (since path/breadcrumbs might change)
-    for ancestor in instance.get_ancestors():
-        cache.delete(f"category_{ancestor.id}_details")
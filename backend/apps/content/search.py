@@ -0,0 +1,206 @@
+"""
+Full-text search over content nodes.
+
+``Category.search_vector`` is maintained by a database trigger (see
+migration 0013) from the title and the tag-stripped description using the
+``russian`` configuration, so inflected word forms match each other. The
+same queryset backs the bot, the REST ``SearchView`` and the web search.
+
+When nothing matches, ``fuzzy_search_documents`` looks for misspelled
+titles and equipment names through the pg_trgm indexes (migration 0014).
+"""
+import html
+import logging
+import re
+
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, TrigramWordSimilarity,
+)
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, F, FloatField, Func, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils.safestring import mark_safe
+
+from apps.content.models import Category, Equipment
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = "russian"
+
+# Typo-tolerant fallback: similarity threshold and latency budget
+FUZZY_SIMILARITY_THRESHOLD = 0.5
+FUZZY_TIMEOUT_MS = 200
+FUZZY_EQUIPMENT_LIMIT = 5
+
+_WORD_RE = re.compile(r"\w+")
+
+# ts_headline wraps matches in these; ``highlight`` turns them into <b> once
+# the rest of the snippet is escaped
+HEADLINE_START = "\x02"
+HEADLINE_STOP = "\x03"
+
+
+class StripTags(Func):
+    """SQL counterpart of ``striptags`` used for CKEditor HTML."""
+    function = "regexp_replace"
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, Value("<[^>]*>"), Value(" "), Value("g"), **extra)
+
+
+def build_search_query(text):
+    """
+    Turns free user input into a prefix tsquery: every word is stemmed and
+    matched as a prefix, so partial model numbers still find documents.
+    Returns None if the input has no searchable words.
+    """
+    words = _WORD_RE.findall(text or "")
+    if not words:
+        return None
+    raw = " & ".join(f"{word}:*" for word in words)
+    return SearchQuery(raw, config=SEARCH_CONFIG, search_type="raw")
+
+
+def subtree_filter(node):
+    """
+    Restricts a Category queryset to the descendants of ``node`` with one
+    range predicate on the (tree_id, lft) index: in MPTT, descendants are
+    exactly the nodes of the same tree with lft between node.lft and node.rght.
+    """
+    return Q(tree_id=node.tree_id, lft__gt=node.lft, lft__lt=node.rght)
+
+
+def search_documents(text, within=None):
+    """
+    Visible document nodes matching ``text``, best matches first, optionally
+    limited to the subtree of the ``within`` category.
+    Each row is annotated with ``rank`` and a raw ``headline`` snippet, to
+    be rendered with ``highlight``.
+    """
+    search_query = build_search_query(text)
+    if search_query is None:
+        return Category.objects.none()
+
+    queryset = Category.objects.filter(search_vector=search_query, is_folder=False, visible_in_bot=True)
+    if within is not None:
+        queryset = queryset.filter(subtree_filter(within))
+
+    return (
+        queryset
+        .annotate(
+            rank=SearchRank(F("search_vector"), search_query),
+            headline=SearchHeadline(
+                StripTags("description"),
+                search_query,
+                config=SEARCH_CONFIG,
+                start_sel=HEADLINE_START,
+                stop_sel=HEADLINE_STOP,
+                max_words=25,
+                min_words=10,
+            ),
+        )
+        .order_by("-rank", "order", "id")
+    )
+
+
+def highlight(headline):
+    """
+    Safe HTML of a ``search_documents`` headline: the description text is
+    escaped (what survived tag stripping is never trusted) and only the
+    matches are wrapped in ``<b>``.
+    """
+    text = html.escape(html.unescape(headline or ""), quote=False)
+    return mark_safe(text.replace(HEADLINE_START, "<b>").replace(HEADLINE_STOP, "</b>"))
+
+
+def _fuzzy_documents_queryset(text, equipment_similarity, within=None):
+    """
+    Documents whose title resembles ``text`` or whose equipment is one of
+    ``equipment_similarity`` ({equipment_id: (name, similarity)}).
+    Both branches are answered by indexes: the title trigram GIN index and
+    the equipment foreign key index.
+    """
+    condition = Q(title__trigram_word_similar=text)
+    equipment_score = Value(0.0)
+    if equipment_similarity:
+        condition |= Q(equipment_id__in=list(equipment_similarity))
+        equipment_score = Case(
+            *[When(equipment_id=pk, then=Value(score)) for pk, (_, score) in equipment_similarity.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+
+    queryset = Category.objects.filter(condition, is_folder=False, visible_in_bot=True)
+    if within is not None:
+        queryset = queryset.filter(subtree_filter(within))
+
+    return (
+        queryset
+        .annotate(
+            title_similarity=TrigramWordSimilarity(text, "title"),
+            equipment_similarity=equipment_score,
+        )
+        .annotate(similarity=Greatest("title_similarity", "equipment_similarity"))
+        .order_by("-similarity", "order", "id")
+    )
+
+
+def _set_local(settings):
+    """Sets run-time parameters for the current transaction. Returns their previous values."""
+    names = list(settings)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT " + ", ".join(["current_setting(%s, true)"] * len(names)), names
+        )
+        previous = dict(zip(names, cursor.fetchone()))
+        # A None value resets the parameter to its session default
+        cursor.execute(
+            "SELECT " + ", ".join(["set_config(%s, %s, true)"] * len(names)),
+            [param for name in names for param in (name, None if settings[name] is None else str(settings[name]))],
+        )
+    return previous
+
+
+def fuzzy_search_documents(text, limit=10, within=None):
+    """
+    Typo-tolerant fallback for searches that found nothing.
+
+    Returns up to ``limit`` visible documents annotated with ``similarity``
+    and ``suggestion`` (the title or equipment name that matched), or an
+    empty list if the lookup does not fit into ``FUZZY_TIMEOUT_MS``.
+    """
+    text = (text or "").strip()
+    if len(text) < 3:
+        return []
+
+    try:
+        with transaction.atomic():
+            previous = _set_local({
+                "statement_timeout": FUZZY_TIMEOUT_MS,
+                "pg_trgm.word_similarity_threshold": FUZZY_SIMILARITY_THRESHOLD,
+            })
+
+            equipment = (
+                Equipment.objects
+                .filter(name__trigram_word_similar=text)
+                .annotate(similarity=TrigramWordSimilarity(text, "name"))
+                .order_by("-similarity")
+                .values_list("id", "name", "similarity")[:FUZZY_EQUIPMENT_LIMIT]
+            )
+            equipment_similarity = {pk: (name, score) for pk, name, score in equipment}
+
+            nodes = list(_fuzzy_documents_queryset(text, equipment_similarity, within)[:limit])
+            # Inside an outer transaction the block is only a savepoint and the
+            # settings would outlive it. A failed lookup needs no restore: rolling
+            # back the savepoint undoes them.
+            _set_local(previous)
+    except OperationalError as e:
+        logger.warning(f"Fuzzy search for '{text}' aborted: {e}")
+        return []
+
+    for node in nodes:
+        if node.equipment_similarity > node.title_similarity:
+            node.suggestion = equipment_similarity[node.equipment_id][0]
+        else:
+            node.suggestion = node.title
+    return nodes
@@ -1,18 +1,31 @@
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.db.models import OuterRef, Subquery
 from apps.content.models import Category, DocumentVersion
-from django.core.cache import cache
+from apps.content.search import search_documents, fuzzy_search_documents, highlight
+from apps.content.cache import get_cached_content, get_cache_metrics
+
+def get_cache_stats():
+    """
+    Content cache counters of this process: hits per tier, rebuilds, and
+    lookups answered by coalescing onto another rebuild or with a stale payload.
+    """
+    return get_cache_metrics()
 
 def get_root_categories():
     """Calculates the list of root categories visible in the bot."""
-    key = "category_root"
-    cached = cache.get(key)
-    if cached:
-        return cached
+    return get_cached_content("root", _build_root_categories)
 
-    result = list(Category.objects.filter(parent=None, is_folder=True, visible_in_bot=True).order_by("order"))
-    cache.set(key, result, timeout=60*15)
-    return result
+def _build_root_categories():
+    return list(Category.objects.filter(parent=None, is_folder=True, visible_in_bot=True).order_by("order"))
+
+def _latest_version(field):
+    """Subquery selecting ``field`` of the newest version of the outer node."""
+    return Subquery(
+        DocumentVersion.objects
+        .filter(content_node=OuterRef("pk"))
+        .order_by("-created_at")
+        .values(field)[:1]
+    )
 
 def get_category_details(category_id):
     """
@@ -21,53 +34,58 @@ def get_category_details(category_id):
     - Children documents (files)
     - Subcategories (folders)
     - Breadcrumbs (path)
+
+    The payload is built from a fixed number of queries regardless of
+    how many children the category has: the category, its visible
+    children (with the latest file path annotated) and its ancestors.
     """
-    key = f"category_{category_id}_details"
-    cached = cache.get(key)
-    if cached:
-        return cached
+    return get_cached_content(
+        f"category:{category_id}:details", lambda: _build_category_details(category_id)
+    )
 
+def _build_category_details(category_id):
     category = get_object_or_404(Category, id=category_id)
-    
-    # Documents (is_folder=False)
-    document_nodes = Category.objects.filter(parent=category, is_folder=False, visible_in_bot=True).order_by("order")
-    
+
+    # Folders and documents in one pass; documents carry their latest file
+    children = (
+        Category.objects
+        .filter(parent=category, visible_in_bot=True)
+        .annotate(file_path=_latest_version("file"))
+        .order_by("order")
+        .values("id", "title", "is_folder", "file_path")
+    )
+
+    subcategories = []
     documents_data = []
-    for node in document_nodes:
-        version = (
-            DocumentVersion.objects
-            .filter(content_node=node)
-            .order_by("-created_at")
-            .first()
-        )
-        documents_data.append({
-            "id": node.id,
-            "title": node.title,
-            "file_path": version.file.name if version else None
-        })
+    for node in children:
+        if node["is_folder"]:
+            subcategories.append({"id": node["id"], "title": node["title"]})
+        else:
+            documents_data.append({
+                "id": node["id"],
+                "title": node["title"],
+                "file_path": node["file_path"] or None
+            })
 
-    # Subcategories (is_folder=True)
-    subcategories = Category.objects.filter(parent=category, is_folder=True, visible_in_bot=True).order_by("order")
-    
-    result = {
+    return {
         "id": category.id,
         "category": category.title,
-        "path": [c.title for c in category.get_ancestors()],
-        "parent_id": category.parent.id if category.parent else None,
-        "subcategories": [
-            {"id": s.id, "title": s.title} for s in subcategories
-        ],
+        "path": list(category.get_ancestors().values_list("title", flat=True)),
+        "parent_id": category.parent_id,
+        "subcategories": subcategories,
         "documents": documents_data,
         "description": category.description
     }
-    
-    cache.set(key, result, timeout=60*15)
-    return result
 
 def get_document_details(document_id):
     """
     Returns details for a specific document node.
     """
+    return get_cached_content(
+        f"document:{document_id}:details", lambda: _build_document_details(document_id)
+    )
+
+def _build_document_details(document_id):
     document_node = get_object_or_404(Category, id=document_id, is_folder=False)
     
     version = (
@@ -88,24 +106,43 @@ def get_document_details(document_id):
         "equipment_name": document_node.equipment.name if document_node.equipment else None
     }
 
-def search_content(query):
+def search_content(query, limit=10, category_id=None):
     """
-    Searches for documents by title or description.
+    Full-text search over visible documents (title and description),
+    ranked by relevance, with a highlighted description snippet.
+    With ``category_id`` only documents inside that category's subtree match.
+
+    If nothing matches, falls back to a typo-tolerant trigram search over
+    titles and equipment names; such results are marked ``fuzzy`` and carry
+    the matched ``suggestion``.
     """
     if not query:
         return []
 
-    document_nodes = Category.objects.filter(
-        Q(title__icontains=query) | Q(description__icontains=query),
-        is_folder=False,
-        visible_in_bot=True
-    ).select_related('parent')[:10]
+    within = None
+    if category_id is not None:
+        within = get_object_or_404(Category.objects.only("tree_id", "lft", "rght"), id=category_id)
+
+    document_nodes = list(search_documents(query, within=within)[:limit])
+    if document_nodes:
+        return [
+            {
+                "id": node.id,
+                "title": node.title,
+                "category_id": node.parent_id,
+                "headline": highlight(node.headline),
+                "fuzzy": False
+            }
+            for node in document_nodes
+        ]
 
     return [
         {
             "id": node.id,
             "title": node.title,
-            "category_id": node.parent.id if node.parent else None
+            "category_id": node.parent_id,
+            "suggestion": node.suggestion,
+            "fuzzy": True
         }
-        for node in document_nodes
+        for node in fuzzy_search_documents(query, limit=limit, within=within)
     ]
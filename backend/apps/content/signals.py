@@ -1,25 +1,28 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from .models import Category, DocumentVersion
-from apps.bot.notifications import broadcast_notification, notify_admins_document_error
+from .cache import mark_content_changed
+from apps.bot.notifications import notify_admins_document_error
+from apps.bot.outbox import enqueue_version_notifications
+from apps.bot.preupload import schedule_preupload
 from apps.analytics.utils import create_audit_log
 from apps.analytics.middleware import get_current_user, get_current_ip
 from asgiref.sync import async_to_sync
-import asyncio
-import threading
 
 def run_async(coro):
     """Helper to run async code from sync Django signals"""
-    loop = asyncio.new_event_loop()
-    threading.Thread(target=loop.run_until_complete, args=(coro,)).start()
+    from apps.bot.telegram_client import submit
+    submit(coro)
 
 @receiver(post_save, sender=DocumentVersion)
 def notify_subscribers(sender, instance, created, **kwargs):
     if created:
+        # Outbox rows commit or roll back together with the version
+        enqueue_version_notifications(instance)
+        # Telegram gets the file before the first user asks for it
+        schedule_preupload(instance)
+
         try:
-            # Run broadcast in a separate thread/event loop to not block the request
-            run_async(broadcast_notification(instance))
-            
             # Log version creation
             node_title = instance.content_node.title if instance.content_node else "Unknown"
             async_to_sync(create_audit_log)(
@@ -75,17 +78,22 @@ def auto_delete_file_on_delete(sender, instance, **kwargs):
 
 
 
+# Content caches are namespaced by the content revision (see apps.content.cache):
+# bumping it invalidates the root menu, every category and the bot's tree at once.
 @receiver(post_save, sender=Category)
-def log_category_save(sender, instance, created, **kwargs):
-    # Invalidate Cache
-    from django.core.cache import cache
-    cache.delete("category_root")
-    # If it's a child, invalidate parent
-    if instance.parent:
-        cache.delete(f"category_{instance.parent.id}_details")
-    # Invalidate self
-    cache.delete(f"category_{instance.id}_details")
+@receiver(post_delete, sender=Category)
+def mark_category_changed(sender, instance, **kwargs):
+    mark_content_changed(instance.id)
+
+
+@receiver(post_save, sender=DocumentVersion)
+@receiver(post_delete, sender=DocumentVersion)
+def mark_version_changed(sender, instance, **kwargs):
+    mark_content_changed(instance.content_node_id)
+
 
+@receiver(post_save, sender=Category)
+def log_category_save(sender, instance, created, **kwargs):
     action = 'CATEGORY_CREATE' if created else 'CATEGORY_EDIT'
     async_to_sync(create_audit_log)(
         user=get_current_user(),
@@ -98,13 +106,6 @@ def log_category_save(sender, instance, created, **kwargs):
 
 @receiver(post_delete, sender=Category)
 def log_category_delete(sender, instance, **kwargs):
-    # Invalidate Cache
-    from django.core.cache import cache
-    cache.delete("category_root")
-    if instance.parent:
-        cache.delete(f"category_{instance.parent.id}_details")
-    cache.delete(f"category_{instance.id}_details")
-
     async_to_sync(create_audit_log)(
         user=get_current_user(),
         action_type='CATEGORY_DELETE',
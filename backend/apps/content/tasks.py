@@ -0,0 +1,57 @@
+from celery import shared_task
+from django.core.cache import cache
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Changes to this many nodes within AUTO_WARM_WINDOW seconds count as a bulk change
+AUTO_WARM_MIN_CHANGES = 20
+AUTO_WARM_WINDOW = 60 * 5
+# Warm-up starts once no content has changed for this many seconds
+AUTO_WARM_DELAY = 30
+
+PENDING_KEY = "content:warm:pending"
+LAST_CHANGE_KEY = "content:warm:last_change"
+SCHEDULED_KEY = "content:warm:scheduled"
+
+
+def schedule_warm_content_cache(changed_count):
+    """
+    Called after every content commit. Queues a single warm-up once bulk
+    changes are detected; the task itself waits until they settle.
+    """
+    cache.add(PENDING_KEY, 0, timeout=AUTO_WARM_WINDOW)
+    pending = cache.incr(PENDING_KEY, changed_count)
+    cache.set(LAST_CHANGE_KEY, time.time(), timeout=AUTO_WARM_WINDOW)
+
+    if pending >= AUTO_WARM_MIN_CHANGES and cache.add(SCHEDULED_KEY, 1, timeout=AUTO_WARM_WINDOW):
+        try:
+            warm_content_cache_task.apply_async(kwargs={"debounce": True}, countdown=AUTO_WARM_DELAY)
+        except Exception as e:
+            cache.delete(SCHEDULED_KEY)
+            logger.warning(f"Failed to schedule content cache warm-up: {e}")
+
+
+@shared_task(bind=True, max_retries=None)
+def warm_content_cache_task(self, concurrency=None, debounce=False):
+    """Warms the content caches in the background"""
+    from apps.content.warmup import WARM_CONCURRENCY, warm_content_cache
+
+    if debounce:
+        quiet_for = time.time() - cache.get(LAST_CHANGE_KEY, 0)
+        if quiet_for < AUTO_WARM_DELAY:
+            raise self.retry(countdown=AUTO_WARM_DELAY - quiet_for)
+        cache.delete_many([PENDING_KEY, SCHEDULED_KEY])
+
+    started = time.monotonic()
+    stats = warm_content_cache(
+        concurrency=concurrency or WARM_CONCURRENCY,
+        report=lambda level: logger.info(
+            f"Warmed level {level['level']}: {level['folders']} folders, "
+            f"{level['documents']} documents in {level['seconds']:.2f}s"
+        ),
+    )
+    nodes = sum(level["folders"] + level["documents"] for level in stats)
+    logger.info(f"Content cache warmed: {nodes} nodes in {time.monotonic() - started:.2f}s")
+    return stats
@@ -0,0 +1,205 @@
+"""
+In-process snapshot of the content tree.
+
+The bot walks the ``Category`` tree on every callback. The whole tree is
+small enough to keep in RAM, so each process holds one ``ContentTree``
+keyed by the global content revision (see ``apps.content.cache``) and
+answers navigation without touching Redis or Postgres. When the revision
+moves on, the snapshot is patched by re-reading only the changed nodes,
+or rebuilt if the change log has gaps. In processes running the
+invalidation listener the revision is known locally, so the snapshot
+catches up on the first access after a bump instead of once per second.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+from apps.content.cache import get_content_changes, get_content_revision, tracked_content_revision
+from apps.content.models import Category
+from apps.content.services import _latest_version
+
+# Seconds between revision lookups in Redis when not listening to pub/sub
+REVISION_CHECK_INTERVAL = 1.0
+# Above this many changed nodes a full reload is cheaper than a patch
+MAX_PATCH_SIZE = 500
+
+
+class ContentNode:
+    __slots__ = (
+        "id", "title", "parent_id", "is_folder", "visible_in_bot",
+        "order", "description", "file_path",
+    )
+
+    def __init__(self, id, title, parent_id, is_folder, visible_in_bot, order, description, file_path):
+        self.id = id
+        self.title = title
+        self.parent_id = parent_id
+        self.is_folder = is_folder
+        self.visible_in_bot = visible_in_bot
+        self.order = order
+        self.description = description or ""
+        self.file_path = file_path or None
+
+
+def _load_nodes(**filters):
+    rows = (
+        Category.objects
+        .filter(**filters)
+        .annotate(file_path=_latest_version("file"))
+        .values_list(
+            "id", "title", "parent_id", "is_folder", "visible_in_bot",
+            "order", "description", "file_path",
+        )
+    )
+    return {row[0]: ContentNode(*row) for row in rows}
+
+
+class ContentTree:
+    """Immutable tree snapshot with children and breadcrumb indexes."""
+
+    def __init__(self, revision, nodes):
+        self.revision = revision
+        self.nodes = nodes
+
+        folders = {}
+        documents = {}
+        for node in sorted(nodes.values(), key=lambda n: (n.order, n.id)):
+            if not node.visible_in_bot:
+                continue
+            index = folders if node.is_folder else documents
+            index.setdefault(node.parent_id, []).append(node)
+
+        self._folders = {parent_id: tuple(children) for parent_id, children in folders.items()}
+        self._documents = {parent_id: tuple(children) for parent_id, children in documents.items()}
+        self._paths = self._build_paths(nodes)
+        self.roots = self._folders.get(None, ())
+        self._memo = {}
+
+    @staticmethod
+    def _build_paths(nodes):
+        """Maps every node id to the tuple of its ancestors' titles."""
+        paths = {}
+        for node in nodes.values():
+            chain = []
+            current = node
+            while current is not None and current.id not in paths:
+                chain.append(current)
+                current = nodes.get(current.parent_id)
+
+            path = paths[current.id] + (current.title,) if current is not None else ()
+            for item in reversed(chain):
+                paths[item.id] = path
+                path = path + (item.title,)
+        return paths
+
+    @classmethod
+    def load(cls, revision):
+        return cls(revision, _load_nodes())
+
+    def patched(self, revision, changed_ids):
+        """Returns a new snapshot with ``changed_ids`` re-read from the database."""
+        nodes = dict(self.nodes)
+        fresh = _load_nodes(id__in=changed_ids)
+        for node_id in changed_ids:
+            if node_id in fresh:
+                nodes[node_id] = fresh[node_id]
+            else:
+                nodes.pop(node_id, None)
+
+        # Drop subtrees whose parent has been deleted
+        orphans = [n.id for n in nodes.values() if n.parent_id is not None and n.parent_id not in nodes]
+        while orphans:
+            for node_id in orphans:
+                del nodes[node_id]
+            orphans = [n.id for n in nodes.values() if n.parent_id is not None and n.parent_id not in nodes]
+
+        return ContentTree(revision, nodes)
+
+    def memoize(self, key, build):
+        """Caches ``build()`` for the lifetime of this snapshot, i.e. of its revision."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = build()
+            return value
+
+    def ancestor_ids(self, node_id):
+        """Ids of the node's ancestors, nearest parent first."""
+        ids = []
+        node = self.nodes.get(int(node_id))
+        while node is not None and node.parent_id is not None:
+            ids.append(node.parent_id)
+            node = self.nodes.get(node.parent_id)
+        return ids
+
+    def category_details(self, category_id):
+        """Same payload as ``services.get_category_details``, served from memory."""
+        node = self.nodes.get(int(category_id))
+        if node is None:
+            raise Category.DoesNotExist(f"Category {category_id} is not in revision {self.revision}")
+
+        return {
+            "id": node.id,
+            "category": node.title,
+            "path": list(self._paths[node.id]),
+            "parent_id": node.parent_id,
+            "subcategories": [
+                {"id": s.id, "title": s.title} for s in self._folders.get(node.id, ())
+            ],
+            "documents": [
+                {"id": d.id, "title": d.title, "file_path": d.file_path}
+                for d in self._documents.get(node.id, ())
+            ],
+            "description": node.description
+        }
+
+
+_lock = threading.Lock()
+_tree = None
+_checked_at = 0.0
+
+
+def _is_fresh():
+    if _tree is None:
+        return False
+    revision = tracked_content_revision()
+    if revision is not None:
+        return revision == _tree.revision
+    return time.monotonic() - _checked_at < REVISION_CHECK_INTERVAL
+
+
+def get_content_tree():
+    """Returns the process-wide snapshot, catching up with the current revision."""
+    global _tree, _checked_at
+    with _lock:
+        if _is_fresh():
+            return _tree
+
+        revision = get_content_revision()
+        if _tree is None:
+            _tree = ContentTree.load(revision)
+        elif revision != _tree.revision:
+            changed = get_content_changes(_tree.revision, revision)
+            if changed is None or len(changed) > MAX_PATCH_SIZE:
+                _tree = ContentTree.load(revision)
+            else:
+                _tree = _tree.patched(revision, changed)
+
+        _checked_at = time.monotonic()
+        return _tree
+
+
+async def aget_content_tree():
+    """Async variant that skips the thread hop while the snapshot is fresh."""
+    if _is_fresh():
+        return _tree
+    return await sync_to_async(get_content_tree)()
+
+
+def reset_content_tree():
+    """Forgets the snapshot; the next access reloads it from the database."""
+    global _tree, _checked_at
+    with _lock:
+        _tree = None
+        _checked_at = 0.0
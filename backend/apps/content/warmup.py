@@ -0,0 +1,98 @@
+"""
+Cache warm-up for the content services.
+
+After a deploy, a Redis flush or a bulk content change every folder is a
+cold ``get_category_details`` call. ``warm_content_cache`` walks the
+visible tree breadth-first, so the menus users reach first are ready
+first, and fills the root, category and document caches of the current
+revision through the regular services.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.http import Http404
+
+from apps.content import services
+from apps.content.models import Category
+
+logger = logging.getLogger(__name__)
+
+WARM_CONCURRENCY = 4
+
+
+def visible_levels():
+    """Visible nodes as ``(id, is_folder)`` pairs grouped by depth, roots first."""
+    children = {}
+    nodes = (
+        Category.objects
+        .filter(visible_in_bot=True)
+        .order_by("order", "id")
+        .values_list("id", "parent_id", "is_folder")
+    )
+    for node_id, parent_id, is_folder in nodes:
+        children.setdefault(parent_id, []).append((node_id, is_folder))
+
+    levels = []
+    level = children.get(None, [])
+    while level:
+        levels.append(level)
+        level = [
+            child
+            for node_id, is_folder in level if is_folder
+            for child in children.get(node_id, ())
+        ]
+    return levels
+
+
+def _warm_nodes(nodes, close_connection=False):
+    try:
+        for node_id, is_folder in nodes:
+            try:
+                if is_folder:
+                    services.get_category_details(node_id)
+                else:
+                    services.get_document_details(node_id)
+            except Http404:
+                # Deleted while warming
+                pass
+    finally:
+        if close_connection:
+            connection.close()
+
+
+def warm_content_cache(concurrency=WARM_CONCURRENCY, report=None):
+    """
+    Populates the content caches level by level with at most ``concurrency``
+    threads and returns per-level stats. ``report`` is called with the stats
+    of each level as soon as it is done.
+    """
+    services.get_root_categories()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+    stats = []
+    try:
+        for depth, nodes in enumerate(visible_levels()):
+            started = time.monotonic()
+            if executor is None:
+                _warm_nodes(nodes)
+            else:
+                # Every worker thread opens its own connection; close it after each batch
+                batches = [nodes[i::concurrency] for i in range(concurrency) if nodes[i::concurrency]]
+                list(executor.map(lambda batch: _warm_nodes(batch, close_connection=True), batches))
+
+            folders = sum(1 for _, is_folder in nodes if is_folder)
+            level = {
+                "level": depth,
+                "folders": folders,
+                "documents": len(nodes) - folders,
+                "seconds": time.monotonic() - started,
+            }
+            stats.append(level)
+            if report:
+                report(level)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return stats
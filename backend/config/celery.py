@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -14,3 +15,23 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def start_content_invalidation_listener(**kwargs):
+    from apps.content.cache import start_invalidation_listener
+    start_invalidation_listener()
+
+
+@worker_ready.connect
+def warm_content_cache_after_deploy(sender, **kwargs):
+    from apps.content.tasks import warm_content_cache_task
+    warm_content_cache_task.delay()
+
+
+@worker_process_shutdown.connect
+def close_telegram_client(**kwargs):
+    from apps.bot.ratelimit import rate_limit
+    from apps.bot.telegram_client import close_client, run_sync
+    run_sync(close_client(), timeout=5)
+    run_sync(rate_limit.aclose(), timeout=5)
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 
     "rest_framework",
     "django_ckeditor_5",
@@ -34,7 +35,7 @@ INSTALLED_APPS = [
     
     "apps.users",
     "apps.content.apps.ContentConfig",
-    "apps.bot",
+    "apps.bot.apps.BotConfig",
     'apps.analytics.apps.AnalyticsConfig',
     "apps.client.apps.ClientConfig",
 ]
@@ -182,25 +183,58 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # --- TELEGRAM ---
 TELEGRAM_BOT_TOKEN = get_env_variable("TELEGRAM_BOT_TOKEN")
+# Seconds document updates are collected into one digest per subscriber (0 sends right away).
+# BotUser.digest_window overrides it per user.
+BOT_DIGEST_WINDOW = int(os.environ.get("BOT_DIGEST_WINDOW", 0))
+# runbot --webhook: public URL Telegram posts updates to and the secret token
+# it sends with each of them (1-256 characters of A-Z, a-z, 0-9, _ and -).
+TELEGRAM_WEBHOOK_URL = os.environ.get("TELEGRAM_WEBHOOK_URL", "")
+TELEGRAM_WEBHOOK_SECRET = os.environ.get("TELEGRAM_WEBHOOK_SECRET", "")
+# Coroutines processing bot updates; each user's updates stay on one of them, in order.
+BOT_UPDATE_WORKERS = int(os.environ.get("BOT_UPDATE_WORKERS", 8))
+# Chat the bot uploads new document files to ahead of the first download, so users
+# always get them by telegram_file_id (empty disables pre-uploading).
+TELEGRAM_STORAGE_CHAT_ID = os.environ.get("TELEGRAM_STORAGE_CHAT_ID", "")
+# Prometheus histograms of handler latency served by runbot (port 0 disables them).
+BOT_METRICS_ADDR = os.environ.get("BOT_METRICS_ADDR", "127.0.0.1")
+BOT_METRICS_PORT = int(os.environ.get("BOT_METRICS_PORT", 9108))
 
 STATICFILES_FINDERS = [
     "django.contrib.staticfiles.finders.FileSystemFinder",
     "django.contrib.staticfiles.finders.AppDirectoriesFinder",
 ]
 
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+
 # --- CELERY ---
-CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', os.environ.get('REDIS_URL', 'redis://redis:6379/1'))
-CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', os.environ.get('REDIS_URL', 'redis://redis:6379/1'))
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', REDIS_URL)
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', REDIS_URL)
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # Retries and rows whose dispatcher died; new rows wake a dispatcher on commit
+    'dispatch-notification-outbox': {
+        'task': 'apps.bot.tasks.dispatch_outbox_task',
+        'schedule': 60.0,
+    },
+    'prune-bot-persistence': {
+        'task': 'apps.bot.tasks.prune_bot_persistence_task',
+        'schedule': 60.0 * 60 * 24,
+    },
+    # Uploads documents still without a file_id and re-checks old file_ids
+    'sync-document-file-ids': {
+        'task': 'apps.bot.tasks.sync_file_ids_task',
+        'schedule': 60.0 * 60,
+    },
+}
 
 # --- CACHING ---
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": os.environ.get('REDIS_URL', 'redis://redis:6379/1'),
+        "LOCATION": REDIS_URL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
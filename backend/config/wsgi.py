@@ -4,3 +4,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+# Keep this worker's content caches coherent with admin edits in other processes.
+# Workers forked from a preloading master start their own listener on first use.
+from apps.content.cache import start_invalidation_listener  # noqa: E402
+
+start_invalidation_listener()
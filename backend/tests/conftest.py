@@ -0,0 +1,75 @@
+import asyncio
+import json
+import os
+import pytest
+from django.core.cache import cache
+from telegram.request import BaseRequest
+from apps.content.cache import local_cache, reset_cache_metrics
+from apps.content.tree import reset_content_tree
+
+
+@pytest.fixture(autouse=True)
+def isolated_content_state():
+    """Content caches live outside the test database, so reset them per test."""
+    cache.clear()
+    local_cache.clear()
+    reset_cache_metrics()
+    reset_content_tree()
+    yield
+    reset_content_tree()
+
+
+class FakeTelegram(BaseRequest):
+    """Bot API stand-in: records every call and answers like Telegram would."""
+
+    def __init__(self, delay=0):
+        self.calls = []
+        self.sent = asyncio.Event()
+        # Simulated round trip of every request
+        self.delay = delay
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, params))
+        await asyncio.sleep(self.delay)
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Support", "username": "support_bot"}
+        elif endpoint == "sendMessage":
+            self.sent.set()
+            result = {
+                "message_id": len(self.calls), "date": 0, "text": params["text"],
+                "chat": {"id": params["chat_id"], "type": "private"},
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def messages(self):
+        return [params["text"] for endpoint, params in self.calls if endpoint == "sendMessage"]
+
+
+@pytest.fixture
+def telegram():
+    """Fake Bot API for applications built with ``.request(telegram)``."""
+    return FakeTelegram()
+
+
+def pytest_collection_modifyitems(config, items):
+    """Benchmarks are slow and only run on demand: RUN_BENCHMARKS=1 pytest -m benchmark -s"""
+    if os.environ.get("RUN_BENCHMARKS"):
+        return
+    skip = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
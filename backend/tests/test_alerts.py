@@ -0,0 +1,109 @@
+import pytest
+from django.contrib.auth import get_user_model
+from unittest.mock import patch
+
+from apps.analytics.tasks import send_telegram_messages_task
+from apps.bot import alerts
+from apps.bot.models import AdminNotificationSettings
+from apps.bot.notifications import notify_admins_error, notify_admins_unauthorized_access
+from apps.bot.tasks import flush_admin_alert_task
+
+
+@pytest.fixture
+def admins():
+    User = get_user_model()
+    AdminNotificationSettings.objects.create(admin_user=User.objects.create(username="a1"), telegram_id=11)
+    AdminNotificationSettings.objects.create(
+        admin_user=User.objects.create(username="a2"), telegram_id=22, notify_on_errors=False
+    )
+    AdminNotificationSettings.objects.create(admin_user=User.objects.create(username="a3"), telegram_id=None)
+
+
+@pytest.fixture
+def queued():
+    with patch.object(send_telegram_messages_task, "delay") as delay, \
+         patch.object(flush_admin_alert_task, "apply_async") as schedule:
+        yield delay, schedule
+
+
+@pytest.mark.django_db
+class TestAdminRecipients:
+
+    def test_cached_until_settings_change(self, admins, django_assert_num_queries):
+        assert alerts.get_admin_recipients("notify_on_errors") == [11]
+        with django_assert_num_queries(0):
+            assert sorted(alerts.get_admin_recipients()) == [11, 22]
+            assert sorted(alerts.get_admin_recipients("notify_on_unauthorized")) == [11, 22]
+
+        AdminNotificationSettings.objects.filter(telegram_id=22).get().delete()
+        assert alerts.get_admin_recipients() == [11]
+
+
+@pytest.mark.django_db
+class TestAlertCoalescing:
+
+    def test_fingerprint_ignores_volatile_parts(self):
+        first = alerts.fingerprint("error", "OperationalError: connection to 10.0.0.5 failed, pid 4242")
+        second = alerts.fingerprint("error", "OperationalError: connection to 10.0.0.7 failed, pid 17")
+        assert first == second
+        assert first != alerts.fingerprint("error", "KeyError: 'title'")
+
+    def test_storm_sends_first_alert_and_one_summary(self, admins, queued):
+        delay, schedule = queued
+        key = alerts.fingerprint("error", "OperationalError")
+
+        for _ in range(40):
+            alerts.raise_alert("notify_on_errors", "<b>DB down</b>", key=key)
+
+        delay.assert_called_once_with([(11, "<b>DB down</b>")])
+        schedule.assert_called_once_with(args=[key], countdown=alerts.ALERT_WINDOW)
+
+        assert alerts.flush_alert(key) == 39
+        summary = delay.call_args.args[0]
+        assert summary == [(11, alerts.summary_message(39, "<b>DB down</b>"))]
+        assert "ещё 39 раз за последние 5 мин" in summary[0][1]
+
+        # A new window opens after the flush
+        alerts.raise_alert("notify_on_errors", "<b>DB down</b>", key=key)
+        assert delay.call_count == 3
+        assert alerts.flush_alert(key) == 0
+        assert delay.call_count == 3
+
+    def test_distinct_alerts_not_merged(self, admins, queued):
+        delay, _schedule = queued
+        alerts.raise_alert("notify_on_errors", "A", key=alerts.fingerprint("A"))
+        alerts.raise_alert("notify_on_errors", "B", key=alerts.fingerprint("B"))
+        alerts.raise_alert("notify_on_unauthorized", "C")
+        alerts.raise_alert("notify_on_unauthorized", "C")
+
+        assert [call.args[0] for call in delay.call_args_list] == [
+            [(11, "A")], [(11, "B")], [(11, "C"), (22, "C")], [(11, "C"), (22, "C")],
+        ]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestNotifyAdminsError:
+
+    @pytest.mark.asyncio
+    async def test_repeated_bot_errors_coalesced(self, admins, queued):
+        delay, schedule = queued
+        for update_id in range(25):
+            await notify_admins_error("Telegram Bot Error", f"TimedOut: update {update_id} timed out")
+
+        assert delay.call_count == 1
+        assert "TimedOut: update 0 timed out" in delay.call_args.args[0][0][1]
+        assert alerts.flush_alert(schedule.call_args.kwargs["args"][0]) == 24
+
+    @pytest.mark.asyncio
+    async def test_failed_logins_coalesced_per_address(self, admins, queued):
+        delay, _schedule = queued
+        await notify_admins_unauthorized_access("admin", "10.0.0.1")
+        await notify_admins_unauthorized_access("root", "192.168.5.77")
+        await notify_admins_unauthorized_access("admin", "10.0.0.1")
+
+        alerted = [call.args[0][0][1] for call in delay.call_args_list]
+        assert len(alerted) == 2
+        assert "10.0.0.1" in alerted[0] and "192.168.5.77" in alerted[1]
+        assert alerts.fingerprint("unauthorized", "10.0.0.1", normalize=False) != alerts.fingerprint(
+            "unauthorized", "192.168.5.77", normalize=False
+        )
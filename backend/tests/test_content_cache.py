@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+
+import pytest
+from unittest.mock import patch
+from django.core.cache import cache
+from django.http import Http404
+from django_redis import get_redis_connection
+
+from apps.content import cache as content_cache, services
+from apps.content.models import Category
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestLocalCache:
+
+    def test_evicts_least_recently_used(self):
+        local = content_cache.LocalCache(maxsize=2, timeout=60)
+        local.set("a", 1)
+        local.set("b", 2)
+        assert local.get("a") == 1
+        local.set("c", 3)
+
+        assert local.get("b") is None
+        assert local.get("a") == 1
+        assert local.get("c") == 3
+
+    def test_expires_entries(self, monkeypatch):
+        local = content_cache.LocalCache(maxsize=2, timeout=60)
+        local.set("a", 1)
+        now = time.monotonic()
+        monkeypatch.setattr(content_cache.time, "monotonic", lambda: now + 61)
+
+        assert local.get("a", "missing") == "missing"
+        assert len(local) == 0
+
+
+@pytest.mark.django_db
+class TestTwoTierCache:
+
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        with patch("apps.content.signals.run_async"):
+            self.root = Category.objects.create(title="Root", is_folder=True)
+            self.doc = Category.objects.create(title="Doc", is_folder=False, parent=self.root)
+
+    def test_served_from_process_memory(self, django_assert_num_queries):
+        details = services.get_category_details(self.root.id)
+        cache.delete(content_cache.content_cache_key(f"category:{self.root.id}:details"))
+
+        with django_assert_num_queries(0):
+            assert services.get_category_details(self.root.id) is details
+
+    def test_falls_back_to_redis(self, django_assert_num_queries):
+        details = services.get_document_details(self.doc.id)
+        content_cache.local_cache.clear()
+
+        with django_assert_num_queries(0):
+            assert services.get_document_details(self.doc.id) == details
+
+    def test_empty_result_is_cached(self, django_assert_num_queries):
+        Category.objects.all().delete()
+        assert services.get_root_categories() == []
+
+        with django_assert_num_queries(0):
+            assert services.get_root_categories() == []
+
+
+class TestSingleFlight:
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"value": 42}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(content_cache.get_cached_content("hot", build)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [{"value": 42}] * 8
+        metrics = content_cache.get_cache_metrics()
+        assert metrics["rebuilds"] == 1
+        assert metrics["coalesced_hits"] >= 1
+
+    def test_stale_payload_served_during_rebuild(self):
+        assert content_cache.get_cached_content("hot", lambda: "old") == "old"
+        content_cache.bump_content_revision()
+
+        key = content_cache.content_cache_key("hot")
+        lock = cache.lock(f"{key}:lock", timeout=5)
+        assert lock.acquire(blocking=False)
+        try:
+            assert content_cache.get_cached_content("hot", lambda: "new") == "old"
+        finally:
+            lock.release()
+
+        assert content_cache.get_cached_content("hot", lambda: "new") == "new"
+        assert content_cache.get_cache_metrics()["stale_hits"] == 1
+
+    def test_lock_holder_gone(self, monkeypatch):
+        monkeypatch.setattr(content_cache, "LOCK_WAIT", 0.05)
+        key = content_cache.content_cache_key("hot")
+        assert cache.lock(f"{key}:lock", timeout=5).acquire(blocking=False)
+
+        assert content_cache.get_cached_content("hot", lambda: "value") == "value"
+        assert content_cache.get_cache_metrics()["lock_timeouts"] == 1
+
+
+@pytest.mark.django_db
+class TestNegativeCaching:
+
+    def test_missing_category_is_cached(self, django_assert_num_queries):
+        with pytest.raises(Http404):
+            services.get_category_details(10**9)
+
+        with django_assert_num_queries(0):
+            with pytest.raises(Http404):
+                services.get_category_details(10**9)
+        assert services.get_cache_stats()["negative_hits"] == 2
+
+    def test_created_category_is_found(self, django_capture_on_commit_callbacks):
+        with pytest.raises(Http404):
+            services.get_document_details(10**9)
+
+        with patch("apps.content.signals.run_async"), django_capture_on_commit_callbacks(execute=True):
+            doc = Category.objects.create(title="Doc", is_folder=False)
+
+        with pytest.raises(Http404):
+            services.get_document_details(10**9)
+        assert services.get_document_details(doc.id)["title"] == "Doc"
+
+
+@pytest.mark.django_db(transaction=True)
+class TestInvalidationListener:
+
+    @pytest.fixture(autouse=True)
+    def listener(self):
+        listener = content_cache.start_invalidation_listener()
+        assert wait_for(lambda: content_cache.tracked_content_revision() is not None)
+        yield listener
+        content_cache.stop_invalidation_listener()
+        assert content_cache.tracked_content_revision() is None
+
+    def test_tracks_published_revisions(self, django_assert_num_queries):
+        with patch("apps.content.signals.run_async"):
+            root = Category.objects.create(title="Root", is_folder=True)
+        revision = content_cache.tracked_content_revision()
+        services.get_category_details(root.id)
+
+        # Another process bumps the revision
+        get_redis_connection("default").publish(content_cache.INVALIDATION_CHANNEL, revision + 1)
+
+        assert wait_for(lambda: content_cache.tracked_content_revision() == revision + 1)
+        assert len(content_cache.local_cache) == 0
+        with django_assert_num_queries(0):
+            assert content_cache.get_content_revision() == revision + 1
+
+    def test_admin_edit_reaches_cached_payload(self):
+        with patch("apps.content.signals.run_async"):
+            root = Category.objects.create(title="Root", is_folder=True)
+            assert services.get_category_details(root.id)["category"] == "Root"
+
+            root.title = "Renamed"
+            root.save()
+
+        # The bump is applied locally before any message arrives
+        assert services.get_category_details(root.id)["category"] == "Renamed"
+
+    def test_forked_process_starts_its_own_listener(self, listener):
+        pid = os.fork()
+        if pid == 0:
+            # Child: the parent's thread is gone, as in a gunicorn --preload worker
+            ok = False
+            try:
+                ok = content_cache.tracked_content_revision() is None
+                content_cache.get_content_revision()
+                ok = ok and wait_for(lambda: content_cache.tracked_content_revision() is not None)
+            finally:
+                os._exit(0 if ok else 1)
+
+        _pid, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        assert listener.is_alive()
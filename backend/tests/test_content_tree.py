@@ -0,0 +1,68 @@
+import pytest
+from unittest.mock import patch
+from apps.content import services, tree as content_tree
+from apps.content.cache import get_content_revision
+from apps.content.models import Category, DocumentVersion
+
+
+@pytest.mark.django_db
+class TestContentTree:
+
+    @pytest.fixture(autouse=True)
+    def setup_data(self, monkeypatch):
+        # Check the revision on every access instead of once per second
+        monkeypatch.setattr(content_tree, "REVISION_CHECK_INTERVAL", 0)
+
+        with patch("apps.content.signals.run_async"):
+            self.root = Category.objects.create(title="Root", is_folder=True, order=1)
+            self.hidden_root = Category.objects.create(title="Hidden", is_folder=True, visible_in_bot=False, order=2)
+            self.folder = Category.objects.create(title="Folder", is_folder=True, parent=self.root, order=1)
+            self.doc = Category.objects.create(title="Doc", is_folder=False, parent=self.folder, order=2)
+            DocumentVersion.objects.create(content_node=self.doc, version="1.0", file="documents/doc.pdf")
+
+    def test_matches_service_payload(self):
+        tree = content_tree.get_content_tree()
+
+        assert [node.title for node in tree.roots] == ["Root"]
+        for category in (self.root, self.folder):
+            assert tree.category_details(category.id) == services.get_category_details(category.id)
+
+    def test_breadcrumbs_and_ancestors(self):
+        tree = content_tree.get_content_tree()
+
+        assert tree.category_details(self.doc.id)["path"] == ["Root", "Folder"]
+        assert tree.ancestor_ids(self.doc.id) == [self.folder.id, self.root.id]
+
+    def test_unknown_category(self):
+        tree = content_tree.get_content_tree()
+        with pytest.raises(Category.DoesNotExist):
+            tree.category_details(10**9)
+
+    def test_patched_on_revision_change(self, django_capture_on_commit_callbacks, django_assert_num_queries):
+        before = content_tree.get_content_tree()
+
+        with patch("apps.content.signals.run_async"), django_capture_on_commit_callbacks(execute=True):
+            self.folder.title = "Renamed"
+            self.folder.save()
+            DocumentVersion.objects.create(content_node=self.doc, version="2.0", file="documents/doc-v2.pdf")
+
+        # Only the changed nodes are re-read
+        with django_assert_num_queries(1):
+            after = content_tree.get_content_tree()
+
+        assert after.revision == get_content_revision() > before.revision
+        assert after.category_details(self.doc.id)["path"] == ["Root", "Renamed"]
+        assert after.category_details(self.folder.id)["documents"][0]["file_path"] == "documents/doc-v2.pdf"
+        # The previous snapshot is left untouched
+        assert before.category_details(self.doc.id)["path"] == ["Root", "Folder"]
+
+    def test_deleted_subtree_removed(self, django_capture_on_commit_callbacks):
+        content_tree.get_content_tree()
+
+        with patch("apps.content.signals.run_async"), django_capture_on_commit_callbacks(execute=True):
+            Category.objects.get(id=self.folder.id).delete()
+
+        tree = content_tree.get_content_tree()
+        assert self.folder.id not in tree.nodes
+        assert self.doc.id not in tree.nodes
+        assert tree.category_details(self.root.id)["subcategories"] == []
@@ -0,0 +1,66 @@
+import re
+from pathlib import Path
+
+import pytest
+
+from apps.bot import formatting
+from apps.bot.formatting import convert, html_to_telegram
+
+FIXTURES = Path(__file__).parent / "fixtures" / "ckeditor"
+
+
+def fixture(name):
+    return (FIXTURES / f"{name}.html").read_text(encoding="utf-8")
+
+
+class TestHtmlToTelegram:
+
+    def test_tables(self):
+        result = convert("<table><tr><th>Порт</th><th>VLAN</th></tr><tr><td>GE0/0/1</td><td>101</td></tr></table>")
+        separator = "\n" + "—" * 15
+        assert result == f"Порт | VLAN | {separator}\nGE0/0/1 | 101 | {separator}"
+
+    def test_block_tags_and_blank_lines(self):
+        assert convert("<p>Один</p><div>Два<br>Три<br/>Четыре</div><p>&nbsp;</p><p>&nbsp;</p><p>Пять</p>") == (
+            "Один\nДва\nТри\nЧетыре\n\nПять"
+        )
+
+    def test_whitelist_and_attributes(self):
+        result = convert(
+            '<p style="color:red"><span><b class="x">Жирный</b></span> '
+            '<a href="https://example.com/?a=1&amp;b=2" target="_blank">ссылка</a> '
+            '<img src="x.png"><script>alert(1)</script></p>'
+        )
+        assert result == '<b>Жирный</b> <a href="https://example.com/?a=1&amp;b=2">ссылка</a>'
+
+    def test_entities(self):
+        assert convert("&laquo;A&raquo; &mdash; x &lt; y &amp;&amp; &quot;z&quot; &#8470;5") == (
+            '«A» — x &lt; y &amp;&amp; "z" №5'
+        )
+
+    def test_rare_entities_and_bare_ampersands(self):
+        assert convert("AT&T &euro;5 &hearts; &#x2116;\xa01 &bogus;") == "AT&amp;T €5 ♥ № 1 &amp;bogus;"
+
+    def test_unclosed_script_dropped(self):
+        assert convert("<b>до</b><!-- <i> --><script>var a = '<b>';") == "<b>до</b>"
+
+    def test_balanced_tags(self):
+        assert convert("<b>открыт <i>вложен</b> хвост</i> <u>без конца") == (
+            "<b>открыт <i>вложен</i></b> хвост <u>без конца</u>"
+        )
+
+    @pytest.mark.parametrize("name", ["instruction", "tables", "formatting"])
+    def test_ckeditor_fixtures(self, name):
+        result = convert(fixture(name))
+        assert "&nbsp;" not in result
+        assert not re.search(r"<(p|span|table|td|img|figure)\b", result)
+        assert result.count("<") == result.count(">")
+
+    def test_memoized_by_content(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(formatting, "convert", lambda text: calls.append(text) or text.upper())
+        description = fixture("instruction")
+
+        assert html_to_telegram(description) == html_to_telegram(str(description)) == description.upper()
+        assert len(calls) == 1
+        assert html_to_telegram("") == ""
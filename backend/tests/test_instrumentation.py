@@ -0,0 +1,121 @@
+import time
+
+import httpx
+import pytest
+from asgiref.sync import sync_to_async
+from prometheus_client import REGISTRY
+from telegram import Update
+from telegram.ext import Application
+
+from apps.analytics.models import BotInteraction
+from apps.bot import instrumentation
+from apps.bot.instrumentation import install_db_timing, instrument, render, start_metrics_server
+from apps.bot.management.commands.runbot import register_handlers
+from apps.bot.models import BotUser
+from apps.bot.ratelimit import SharedRateLimiter
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def start_update(user_id):
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Ivan"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+class TestHandlerInstrumentation:
+
+    @pytest.mark.asyncio
+    async def test_start_broken_down_and_logged(self, telegram):
+        # Runs in the thread that executes the handlers' queries
+        await sync_to_async(install_db_timing)()
+        telegram.delay = 0.05
+        app = (
+            Application.builder().token("123:TEST").request(telegram).updater(None)
+            .rate_limiter(SharedRateLimiter()).build()
+        )
+        register_handlers(app)
+        before = {
+            "calls": sample("bot_handler_seconds_count", handler="start"),
+            "queries": sample("bot_handler_db_queries_sum", handler="start"),
+            "db": sample("bot_handler_phase_seconds_sum", handler="start", phase="db"),
+            "telegram": sample("bot_handler_phase_seconds_sum", handler="start", phase="telegram"),
+        }
+
+        async with app:
+            await app.process_update(Update.de_json(start_update(77), app.bot))
+
+        assert sample("bot_handler_seconds_count", handler="start") == before["calls"] + 1
+        assert sample("bot_handler_db_queries_sum", handler="start") - before["queries"] >= 3
+        assert sample("bot_handler_phase_seconds_sum", handler="start", phase="db") > before["db"]
+        telegram_time = sample("bot_handler_phase_seconds_sum", handler="start", phase="telegram") - before["telegram"]
+        assert 0.05 <= telegram_time < 1
+
+        # log_interaction picked up the handler's duration by itself
+        interaction = await BotInteraction.objects.select_related("user").aget(path="/start_reg")
+        assert interaction.user.telegram_id == 77
+        assert interaction.response_time_ms >= 50
+        assert await BotUser.objects.filter(telegram_id=77).aexists()
+
+    def test_every_registered_callback_wrapped(self, telegram):
+        app = Application.builder().token("123:TEST").request(telegram).updater(None).build()
+        register_handlers(app)
+
+        callbacks = [
+            handler.callback for group in app.handlers.values() for handler in instrumentation._handlers(group)
+        ]
+        assert len(callbacks) > 10
+        assert all(getattr(callback, "instrumented", False) for callback in callbacks)
+
+    @pytest.mark.asyncio
+    async def test_nested_render_counted_once(self):
+        @render
+        def inner():
+            time.sleep(0.02)
+
+        @render
+        def outer():
+            time.sleep(0.02)
+            inner()
+
+        async def callback(update, context):
+            outer()
+            inner()
+
+        before = sample("bot_handler_phase_seconds_sum", handler="nested_render", phase="render")
+        await instrument(callback, name="nested_render")(None, None)
+        rendered = sample("bot_handler_phase_seconds_sum", handler="nested_render", phase="render") - before
+        assert 0.06 <= rendered < 0.08
+
+        # Outside handlers nothing is recorded
+        outer()
+        assert sample("bot_handler_phase_seconds_sum", handler="nested_render", phase="render") - before == rendered
+
+
+class TestMetricsEndpoint:
+
+    def test_histograms_exported(self):
+        # Labelled histograms have no samples until a handler was observed
+        instrumentation.observe("scrape_test", instrumentation.HandlerTimings())
+        server = start_metrics_server(0)
+        try:
+            port = server.server_address[1]
+            response = httpx.get(f"http://127.0.0.1:{port}/metrics")
+        finally:
+            server.shutdown()
+
+        assert response.status_code == 200
+        assert "# TYPE bot_handler_seconds histogram" in response.text
+        assert 'bot_handler_phase_seconds_bucket{handler="scrape_test"' in response.text
+        assert 'bot_handler_db_queries_bucket{handler="scrape_test"' in response.text
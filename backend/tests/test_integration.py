@@ -68,6 +68,27 @@ class TestBotIntegration:
         mock_update.callback_query.edit_message_text.assert_called_once()
         assert "Инструкции" in mock_update.callback_query.edit_message_text.call_args[1]["text"]
 
+    @pytest.mark.asyncio
+    async def test_section_search_is_scoped(self, mock_update, mock_context):
+        """The search button of a category limits the next query to its subtree"""
+        root_cat = await Category.objects.acreate(title="Инструкции", is_folder=True)
+        other_cat = await Category.objects.acreate(title="Схемы", is_folder=True)
+        await Category.objects.acreate(title="Настройка OLT", is_folder=False, parent=root_cat)
+        await Category.objects.acreate(title="Настройка ONT", is_folder=False, parent=other_cat)
+
+        mock_context.user_data = {}
+        mock_update.callback_query.data = f"search_init:{root_cat.id}"
+        await handlers.initiate_search_handler(mock_update, mock_context)
+        assert mock_context.user_data["search_category_id"] == root_cat.id
+
+        mock_update.message.text = "настройка"
+        await handlers.handle_search_query(mock_update, mock_context)
+
+        reply = mock_update.message.reply_text.call_args
+        assert "Настройка OLT" in reply.args[0]
+        assert "Настройка ONT" not in reply.args[0]
+        assert "search_category_id" not in mock_context.user_data
+
     @pytest.mark.asyncio
     @patch("apps.bot.notifications.send_telegram_notification", new_callable=AsyncMock)
     async def test_notification_delivery_logic(self, mock_send):
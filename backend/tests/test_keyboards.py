@@ -0,0 +1,62 @@
+import pytest
+from asgiref.sync import sync_to_async
+from unittest.mock import AsyncMock, patch
+
+from apps.bot import keyboards
+from apps.content import tree as content_tree
+from apps.content.models import Category
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPrerenderedMenus:
+
+    @pytest.fixture(autouse=True)
+    def setup_data(self, monkeypatch):
+        monkeypatch.setattr(content_tree, "REVISION_CHECK_INTERVAL", 0)
+        with patch("apps.content.signals.run_async"):
+            self.root = Category.objects.create(title="Root", is_folder=True)
+            self.folder = Category.objects.create(
+                title="Folder", is_folder=True, parent=self.root, description="<p>Long <b>text</b></p>" * 1000
+            )
+            Category.objects.create(title="Doc", is_folder=False, parent=self.folder)
+
+    def rename_folder(self, title):
+        # Autocommit: the content revision is bumped right away
+        with patch("apps.content.signals.run_async"):
+            self.folder.title = title
+            self.folder.save()
+
+    @pytest.mark.asyncio
+    async def test_rendered_once_with_per_user_bell(self):
+        subscribed = AsyncMock(side_effect=[(True, "direct"), (False, None)])
+        with patch.object(keyboards, "is_user_subscribed", subscribed), \
+             patch.object(keyboards, "html_to_telegram", wraps=keyboards.html_to_telegram) as convert:
+            first_text, first_markup = await keyboards.get_category_menu_content(self.folder.id, 1)
+            second_text, second_markup = await keyboards.get_category_menu_content(str(self.folder.id), 2, prefix="✅ ")
+
+        assert convert.call_count == 1
+        assert second_text == "✅ " + first_text
+        assert first_text.startswith("📂 Root &gt; <u>Folder</u>")
+
+        first_rows = [[b.text for b in row] for row in first_markup.inline_keyboard]
+        second_rows = [[b.text for b in row] for row in second_markup.inline_keyboard]
+        assert first_rows == [["📄 Doc"], ["🔕"], ["🔍 Поиск по разделу"], ["⬅ Назад"]]
+        assert second_rows[1] == ["🔔"]
+        assert second_markup.inline_keyboard[1][0].callback_data == f"sub:toggle:{self.folder.id}"
+
+    @pytest.mark.asyncio
+    async def test_rerendered_after_content_change(self):
+        subscribed = AsyncMock(return_value=(False, None))
+        with patch.object(keyboards, "is_user_subscribed", subscribed):
+            await keyboards.get_category_menu_content(self.folder.id, 1)
+            root_menu = await keyboards.build_root_keyboard()
+            assert root_menu.inline_keyboard[0][0].text == "🗂 Root"
+
+            await sync_to_async(self.rename_folder)("Renamed")
+            text, _markup = await keyboards.get_category_menu_content(self.folder.id, 1)
+        assert "<u>Renamed</u>" in text
+
+    @pytest.mark.asyncio
+    async def test_unknown_category(self):
+        with pytest.raises(Category.DoesNotExist):
+            await keyboards.get_category_menu_content(10**9, 1)
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from apps.analytics.tasks import send_telegram_messages_task
+from apps.bot import notifications
+from apps.bot.models import BotUser
+from apps.content.models import Category
+
+
+@pytest.mark.django_db
+class TestSubscriberIds:
+
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        with patch("apps.content.signals.run_async"):
+            self.root = Category.objects.create(title="Root", is_folder=True)
+            self.folder = Category.objects.create(title="Folder", is_folder=True, parent=self.root)
+            self.other = Category.objects.create(title="Other", is_folder=True)
+            self.doc = Category.objects.create(title="Doc", is_folder=False, parent=self.folder)
+
+        users = BotUser.objects.bulk_create([
+            BotUser(telegram_id=1000 + i, agreed_to_policy=(i != 4)) for i in range(1200)
+        ])
+        through = BotUser.subscribed_categories.through
+        through.objects.bulk_create(
+            [through(botuser=user, category=self.root) for user in users[:800]]
+            + [through(botuser=user, category=self.folder) for user in users[600:1100]]
+            + [through(botuser=user, category=self.other) for user in users[1100:]]
+        )
+
+    def test_subscribers_of_ancestors_streamed_once(self):
+        ids = list(notifications.iter_subscriber_ids(self.folder))
+
+        assert len(ids) == len(set(ids)) == 1099
+        assert 1004 not in ids
+        assert 2150 not in ids
+
+
+class TestNotificationBatch:
+
+    def test_bounded_concurrency_and_stats(self):
+        in_flight = []
+        peak = []
+
+        async def send(chat_id, message, parse_mode):
+            in_flight.append(chat_id)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(chat_id)
+            return chat_id % 10 != 0
+
+        with patch.object(notifications, "send_telegram_notification", AsyncMock(side_effect=send)):
+            stats = send_telegram_messages_task([(chat_id, "Hi") for chat_id in range(1, 101)])
+
+        assert max(peak) == notifications.NOTIFICATION_CONCURRENCY
+        assert stats["total"] == 100
+        assert stats["sent"] == 90
+        assert stats["failed"] == 10
+
+
+class TestTelegramClient:
+
+    def test_one_pooled_client_per_loop(self):
+        from apps.bot import telegram_client
+
+        async def client_id():
+            return id(telegram_client.get_client())
+
+        first = telegram_client.run_sync(client_id())
+        assert telegram_client.run_sync(client_id()) == first
+        assert asyncio.run(client_id()) != first
+
+    def test_batch_send_over_shared_client(self):
+        import json
+        import httpx
+        from apps.bot import telegram_client
+
+        sent = []
+
+        def handle(request):
+            payload = json.loads(request.content)
+            sent.append((request.url.path, payload["chat_id"], payload["text"]))
+            return httpx.Response(200 if payload["chat_id"] != 3 else 403, json={"ok": True})
+
+        async def install_client():
+            loop = asyncio.get_running_loop()
+            telegram_client._clients[loop] = httpx.AsyncClient(
+                base_url="https://api.telegram.org/botTOKEN/", transport=httpx.MockTransport(handle)
+            )
+
+        telegram_client.run_sync(install_client())
+        try:
+            stats = send_telegram_messages_task([(1, "a"), (2, "b"), (3, "c")])
+        finally:
+            telegram_client.run_sync(telegram_client.close_client())
+
+        assert sorted(sent) == [
+            ("/botTOKEN/sendMessage", 1, "a"), ("/botTOKEN/sendMessage", 2, "b"), ("/botTOKEN/sendMessage", 3, "c"),
+        ]
+        assert (stats["sent"], stats["failed"]) == (2, 1)
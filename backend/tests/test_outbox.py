@@ -0,0 +1,197 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+from unittest.mock import AsyncMock, patch
+
+from apps.bot import outbox
+from apps.bot.models import BotUser, NotificationOutbox
+from apps.bot.notifications import PERMANENT, RETRY, SENT
+from apps.content.models import Category, DocumentVersion
+
+
+@pytest.fixture
+def subscribed_tree():
+    with patch("apps.content.signals.run_async"):
+        root = Category.objects.create(title="Root", is_folder=True)
+        folder = Category.objects.create(title="Folder", is_folder=True, parent=root)
+        doc = Category.objects.create(title="Doc", is_folder=False, parent=folder)
+
+    users = BotUser.objects.bulk_create([BotUser(telegram_id=500 + i, agreed_to_policy=True) for i in range(12)])
+    through = BotUser.subscribed_categories.through
+    through.objects.bulk_create(
+        [through(botuser=user, category=root) for user in users[:8]]
+        + [through(botuser=user, category=folder) for user in users[4:]]
+    )
+    return doc
+
+
+def create_version(doc, version="2.0"):
+    with patch("apps.content.signals.run_async"), patch.object(outbox, "_wake_dispatcher") as wake:
+        with transaction.atomic():
+            created = DocumentVersion.objects.create(content_node=doc, version=version, file="documents/doc.pdf")
+    return created, wake
+
+
+@pytest.mark.django_db(transaction=True)
+class TestOutboxWrites:
+
+    def test_rows_written_with_the_version(self, subscribed_tree):
+        version, wake = create_version(subscribed_tree)
+
+        rows = NotificationOutbox.objects.filter(version=version)
+        assert sorted(rows.values_list("recipient", flat=True)) == list(range(500, 512))
+        assert {row.parse_mode for row in rows} == {"HTML"}
+        assert "Folder" in rows[0].message and "v2.0" in rows[0].message
+        wake.assert_called_once()
+
+    def test_rollback_drops_rows(self, subscribed_tree):
+        with patch("apps.content.signals.run_async"), patch.object(outbox, "_wake_dispatcher") as wake:
+            with pytest.raises(RuntimeError), transaction.atomic():
+                DocumentVersion.objects.create(content_node=subscribed_tree, version="3.0", file="documents/doc.pdf")
+                raise RuntimeError
+
+        assert not NotificationOutbox.objects.exists()
+        wake.assert_not_called()
+
+    def test_one_row_per_version_and_recipient(self, subscribed_tree):
+        version, _wake = create_version(subscribed_tree)
+        with patch.object(outbox, "_wake_dispatcher"):
+            outbox.enqueue_version_notifications(version)
+
+        assert NotificationOutbox.objects.filter(version=version).count() == 12
+
+
+@pytest.mark.django_db(transaction=True)
+class TestOutboxDispatch:
+
+    @pytest.fixture(autouse=True)
+    def version(self, subscribed_tree):
+        self.version, _wake = create_version(subscribed_tree)
+
+    def test_claims_skip_locked_and_leased_rows(self):
+        claimed_elsewhere = []
+
+        def other_dispatcher():
+            claimed_elsewhere.extend(outbox.claim_batch(batch_size=100))
+            connection.close()
+
+        with transaction.atomic():
+            held = list(NotificationOutbox.objects.select_for_update().order_by("id")[:5])
+            thread = threading.Thread(target=other_dispatcher)
+            thread.start()
+            thread.join()
+
+        held_ids = {row.pk for row in held}
+        assert len(claimed_elsewhere) == 7
+        assert held_ids.isdisjoint(row.pk for row in claimed_elsewhere)
+        # Leased rows are not handed out again; the ones that were locked are
+        assert {row.pk for row in outbox.claim_batch(batch_size=100)} == held_ids
+
+    def test_dispatch_retries_with_backoff(self):
+        send = AsyncMock(side_effect=lambda chat_id, text, parse_mode: RETRY if chat_id % 3 == 0 else SENT)
+        started = timezone.now()
+        with patch.object(outbox, "deliver_telegram_message", send):
+            stats = outbox.dispatch_outbox(batch_size=5)
+
+        assert stats == {"sent": 8, "messages": 8, "retrying": 4, "failed": 0}
+        assert send.call_count == 12
+        retrying = NotificationOutbox.objects.filter(status=NotificationOutbox.PENDING)
+        assert sorted(retrying.values_list("recipient", flat=True)) == [501, 504, 507, 510]
+        for row in retrying:
+            assert row.attempts == 1
+            assert row.next_attempt_at >= started + timedelta(seconds=outbox.RETRY_BACKOFF)
+        assert NotificationOutbox.objects.filter(status=NotificationOutbox.SENT, sent_at__isnull=False).count() == 8
+
+    def test_refused_messages_fail_without_retries(self):
+        results = {500: PERMANENT, 501: RETRY}
+        send = AsyncMock(side_effect=lambda chat_id, text, parse_mode: results.get(chat_id, SENT))
+        with patch.object(outbox, "deliver_telegram_message", send):
+            stats = outbox.dispatch_outbox()
+
+        assert stats == {"sent": 10, "messages": 10, "retrying": 1, "failed": 1}
+        status = dict(NotificationOutbox.objects.values_list("recipient", "status"))
+        assert status[500] == NotificationOutbox.FAILED
+        assert status[501] == NotificationOutbox.PENDING
+
+    def test_gives_up_after_max_attempts(self):
+        NotificationOutbox.objects.update(attempts=outbox.MAX_ATTEMPTS - 1)
+        with patch.object(outbox, "deliver_telegram_message", AsyncMock(return_value=RETRY)):
+            stats = outbox.dispatch_outbox()
+
+        assert stats == {"sent": 0, "messages": 0, "retrying": 0, "failed": 12}
+        assert NotificationOutbox.objects.filter(status=NotificationOutbox.FAILED).count() == 12
+        assert outbox.dispatch_outbox() == {"sent": 0, "messages": 0, "retrying": 0, "failed": 0}
+
+    def test_backoff_is_capped(self):
+        assert outbox.retry_delay(1) == outbox.RETRY_BACKOFF
+        assert outbox.retry_delay(3) == outbox.RETRY_BACKOFF * 4
+        assert outbox.retry_delay(30) == outbox.MAX_BACKOFF
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDigest:
+
+    @pytest.fixture(autouse=True)
+    def setup_data(self, subscribed_tree, settings):
+        settings.BOT_DIGEST_WINDOW = 600
+        self.doc = subscribed_tree
+        # 500 reads everything right away, 501 collects for an hour
+        BotUser.objects.filter(telegram_id=500).update(digest_window=0)
+        BotUser.objects.filter(telegram_id=501).update(digest_window=3600)
+
+    def test_rows_wait_for_the_users_window(self):
+        started = timezone.now()
+        version, _wake = create_version(self.doc)
+
+        due = dict(NotificationOutbox.objects.filter(version=version).values_list("recipient", "next_attempt_at"))
+        assert due[500] <= timezone.now()
+        assert started + timedelta(seconds=3600) <= due[501] <= timezone.now() + timedelta(seconds=3600)
+        assert started + timedelta(seconds=600) <= due[502] <= timezone.now() + timedelta(seconds=600)
+
+    def test_burst_flushed_as_one_message_per_user(self):
+        for number in range(5):
+            create_version(self.doc, version=f"{number}.0")
+        # The windows have passed
+        NotificationOutbox.objects.exclude(recipient=501).update(next_attempt_at=timezone.now())
+
+        send = AsyncMock(return_value=SENT)
+        with patch.object(outbox, "deliver_telegram_message", send):
+            stats = outbox.dispatch_outbox(batch_size=7)
+
+        assert stats == {"sent": 55, "messages": 11, "retrying": 0, "failed": 0}
+        messages = {call.args[0]: call.args[1] for call in send.call_args_list}
+        assert len(messages) == 11 and 501 not in messages
+        assert "Обновления файлов: 5" in messages[502]
+        assert messages[502].index("(v0.0)") < messages[502].index("(v4.0)")
+        assert NotificationOutbox.objects.filter(recipient=501, status=NotificationOutbox.PENDING).count() == 5
+        assert outbox.get_delivery_stats() == {"events": 55, "messages": 11, "savings": 0.8}
+
+    def test_titles_cannot_break_the_markup(self):
+        Category.objects.filter(pk=self.doc.pk).update(title="snake_case *v2* `<draft>` & co")
+        self.doc.refresh_from_db()
+        for number in range(2):
+            create_version(self.doc, version=f"{number}.0")
+        NotificationOutbox.objects.filter(recipient=500).update(next_attempt_at=timezone.now())
+
+        send = AsyncMock(return_value=SENT)
+        with patch.object(outbox, "deliver_telegram_message", send):
+            outbox.dispatch_outbox()
+
+        (recipient, message, parse_mode), = [call.args for call in send.call_args_list]
+        assert parse_mode == "HTML"
+        assert "<b>snake_case *v2* `&lt;draft&gt;` &amp; co</b> (v0.0)" in message
+
+    def test_single_event_keeps_its_message(self):
+        version, _wake = create_version(self.doc)
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+
+        send = AsyncMock(return_value=SENT)
+        with patch.object(outbox, "deliver_telegram_message", send):
+            outbox.dispatch_outbox()
+
+        assert send.call_count == 12
+        assert {call.args[1] for call in send.call_args_list} == {outbox.version_message(version)}
+        assert outbox.get_delivery_stats()["savings"] == 0.0
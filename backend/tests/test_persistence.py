@@ -0,0 +1,211 @@
+import asyncio
+import pickle
+import time
+from io import StringIO
+
+import pytest
+import redis
+from django.conf import settings
+from django.core.management import call_command
+
+from apps.bot import persistence as bot_persistence
+from apps.bot.persistence import (
+    ACTIVITY_KEY,
+    CHAT_DATA_KEY,
+    CONVERSATION_KEY,
+    USER_DATA_KEY,
+    RedisPersistence,
+    decode,
+    encode,
+)
+
+REDIS_URL = settings.CACHES["default"]["LOCATION"]
+
+
+@pytest.fixture
+def client():
+    # conftest flushes this Redis database before every test
+    client = redis.from_url(REDIS_URL)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def persistence():
+    return RedisPersistence(url=REDIS_URL)
+
+
+class TestRedisPersistence:
+
+    @pytest.mark.asyncio
+    async def test_user_data_per_user_and_loaded_lazily(self, persistence, client):
+        for user_id in range(1, 1001):
+            await persistence.update_user_data(user_id, {"name": f"user{user_id}"})
+        await persistence.update_user_data(7, {"name": "seven", "step": 2})
+
+        restarted = RedisPersistence(url=REDIS_URL)
+        assert await restarted.get_user_data() == {}
+
+        user_data = {}
+        await restarted.refresh_user_data(7, user_data)
+        assert user_data == {"name": "seven", "step": 2}
+
+        # Already in the application: not read again
+        client.hset(USER_DATA_KEY, "7", pickle.dumps({"name": "changed"}))
+        await restarted.refresh_user_data(7, user_data)
+        assert user_data == {"name": "seven", "step": 2}
+
+        unknown = {}
+        await restarted.refresh_user_data(5000, unknown)
+        assert unknown == {}
+
+    @pytest.mark.asyncio
+    async def test_update_touches_only_its_entry(self, persistence):
+        await persistence.update_chat_data(1, {"a": 1})
+        await persistence.update_chat_data(2, {"b": 2})
+        await persistence.drop_chat_data(1)
+
+        restarted = RedisPersistence(url=REDIS_URL)
+        first, second = {}, {}
+        await restarted.refresh_chat_data(1, first)
+        await restarted.refresh_chat_data(2, second)
+        assert (first, second) == ({}, {"b": 2})
+
+    @pytest.mark.asyncio
+    async def test_conversations_roundtrip(self, persistence, client):
+        await persistence.update_conversation("support", (10, 20), 3)
+        await persistence.update_conversation("support", (11, 21), 4)
+        await persistence.update_conversation("support", (11, 21), None)
+        await persistence.update_conversation("registration", (10, 20), 1)
+
+        assert await persistence.get_conversations("support") == {(10, 20): 3}
+        assert await persistence.get_conversations("registration") == {(10, 20): 1}
+        assert client.hlen(CONVERSATION_KEY.format(name="support")) == 1
+
+    @pytest.mark.asyncio
+    async def test_bot_and_callback_data(self, persistence):
+        await persistence.update_bot_data({"x": 1})
+        await persistence.update_callback_data(([], {}))
+
+        assert await persistence.get_bot_data() == {"x": 1}
+        assert await persistence.get_callback_data() == ([], {})
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writes_share_a_pipeline(self, persistence, client, monkeypatch):
+        pipelines = []
+        original = persistence.redis.pipeline
+
+        def pipeline(*args, **kwargs):
+            pipelines.append(1)
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(persistence.redis, "pipeline", pipeline)
+        await asyncio.gather(*(persistence.update_user_data(user_id, {"n": user_id}) for user_id in range(200)))
+
+        assert len(pipelines) == 1
+        assert client.hlen(USER_DATA_KEY) == 200
+        await persistence.flush()
+
+    @pytest.mark.asyncio
+    async def test_legacy_pickles_migrated(self, client):
+        client.set("user_data", pickle.dumps({1: {"name": "old"}, 2: {}}))
+        client.set("chat_data", pickle.dumps({}))
+        client.set("bot_data", pickle.dumps({"k": "v"}))
+        client.set("conv:support", pickle.dumps({(1, 1): 5}))
+
+        migrated = RedisPersistence(url=REDIS_URL)
+
+        user_data = {}
+        await migrated.refresh_user_data(1, user_data)
+        assert user_data == {"name": "old"}
+        assert await migrated.get_bot_data() == {"k": "v"}
+        assert await migrated.get_conversations("support") == {(1, 1): 5}
+        assert not client.exists("user_data", "chat_data", "bot_data", "conv:support")
+
+
+class TestStateEncoding:
+
+    def test_json_with_schema_tag(self):
+        data = {"awaiting_search": True, "search_category_id": "12", "history": [1, 2]}
+        raw = encode(data)
+        assert raw.startswith(b"J1{")
+        assert len(raw) < len(pickle.dumps(data))
+        assert decode(raw) == data
+
+    @pytest.mark.parametrize("data", [{1: "int key"}, {"pair": (1, 2)}, {"ids": {1, 2}}])
+    def test_pickle_when_json_would_change_the_value(self, data):
+        raw = encode(data)
+        assert raw.startswith(b"P1")
+        assert decode(raw) == data
+
+    def test_untagged_legacy_pickle(self):
+        assert decode(pickle.dumps({"a": 1})) == {"a": 1}
+
+
+class TestStateExpiry:
+
+    @pytest.mark.asyncio
+    async def test_activity_refreshed_on_write_and_load(self, persistence, client):
+        await persistence.update_user_data(1, {"a": 1})
+        await persistence.update_conversation("support", (1, 1), 2)
+        activity = ACTIVITY_KEY.format(key=USER_DATA_KEY)
+        written = client.zscore(activity, "1")
+        assert written == pytest.approx(time.time(), abs=5)
+        assert client.zscore(ACTIVITY_KEY.format(key=CONVERSATION_KEY.format(name="support")), "[1, 1]")
+
+        client.zadd(activity, {"1": 0})
+        await RedisPersistence(url=REDIS_URL).refresh_user_data(1, {})
+        assert client.zscore(activity, "1") >= written
+
+        await persistence.drop_user_data(1)
+        assert client.zscore(activity, "1") is None
+
+    def test_prune_inactive_entries(self, client):
+        now = time.time()
+        old, recent = now - bot_persistence.STATE_TTL - 60, now - 60
+        client.hset(USER_DATA_KEY, mapping={"1": encode({}), "2": encode({}), "3": encode({})})
+        client.zadd(ACTIVITY_KEY.format(key=USER_DATA_KEY), {"1": old, "2": recent})
+        support = CONVERSATION_KEY.format(name="support")
+        client.hset(support, mapping={"[1, 1]": encode(1), "[2, 2]": encode(2)})
+        client.zadd(ACTIVITY_KEY.format(key=support), {"[1, 1]": old, "[2, 2]": old})
+
+        pruned = bot_persistence.prune_inactive(client)
+
+        assert pruned == {"user_data": 1, "chat_data": 0, "conv:support": 2}
+        assert sorted(client.hkeys(USER_DATA_KEY)) == [b"2", b"3"]
+        # Entries from before activity tracking get a full TTL from now on
+        assert client.zscore(ACTIVITY_KEY.format(key=USER_DATA_KEY), "3") >= now
+        assert not client.exists(support)
+
+    def test_prune_skips_entries_used_meanwhile(self, client, monkeypatch):
+        client.hset(USER_DATA_KEY, mapping={"1": encode({}), "2": encode({})})
+        activity = ACTIVITY_KEY.format(key=USER_DATA_KEY)
+        client.zadd(activity, {"1": 0, "2": 0})
+        candidates = client.zrangebyscore
+
+        def zrangebyscore(*args, **kwargs):
+            stale = candidates(*args, **kwargs)
+            # The bot writes user 2 after the stale entries were listed
+            client.zadd(activity, {"2": time.time()})
+            return stale
+
+        monkeypatch.setattr(client, "zrangebyscore", zrangebyscore)
+
+        assert bot_persistence.prune_inactive(client)["user_data"] == 1
+        assert client.hkeys(USER_DATA_KEY) == [b"2"]
+
+    def test_maintenance_command(self, client):
+        client.hset(USER_DATA_KEY, mapping={str(user_id): encode({"n": user_id}) for user_id in range(100)})
+        client.zadd(ACTIVITY_KEY.format(key=USER_DATA_KEY), {str(user_id): 0 for user_id in range(40)})
+        client.hset(CHAT_DATA_KEY, "5", encode({}))
+
+        out = StringIO()
+        call_command("bot_persistence", stdout=out)
+        report = out.getvalue()
+        assert "user_data" in report and "chat_data" in report
+        assert client.hlen(USER_DATA_KEY) == 100
+
+        out = StringIO()
+        call_command("bot_persistence", "--prune", stdout=out)
+        assert "Pruned 40 inactive entries from user_data" in out.getvalue()
+        assert client.hlen(USER_DATA_KEY) == 60
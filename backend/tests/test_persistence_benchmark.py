@@ -0,0 +1,108 @@
+"""
+Event-loop lag while the bot persists 200 concurrent updates: the former
+blocking ``redis`` client vs. ``redis.asyncio`` with pipelined writes.
+Redis is reached through a local proxy that adds a network round trip.
+
+    RUN_BENCHMARKS=1 pytest tests/test_persistence_benchmark.py -s
+"""
+import asyncio
+import pickle
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+import redis
+from django.conf import settings
+
+from apps.bot.persistence import USER_DATA_KEY, RedisPersistence, _field
+
+UPDATES = 200
+ROUNDS = 10
+TICK = 0.001
+
+
+class BlockingRedisPersistence(RedisPersistence):
+    """The persistence as it was before: synchronous client, one command per write."""
+
+    def __init__(self, url):
+        super().__init__(url)
+        self.sync_redis = redis.from_url(url)
+
+    async def update_user_data(self, user_id, data):
+        self._loaded_users.add(user_id)
+        self.sync_redis.hset(USER_DATA_KEY, _field(user_id), pickle.dumps(data))
+
+
+def start_latency_proxy(target_url, round_trip):
+    """Forwards to Redis, delaying each chunk by half of ``round_trip``. Returns the proxy URL."""
+    target = urlsplit(target_url)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    address = {}
+
+    async def pipe(reader, writer):
+        while data := await reader.read(65536):
+            await asyncio.sleep(round_trip / 2)
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(target.hostname, target.port or 6379)
+        await asyncio.gather(pipe(client_reader, server_writer), pipe(server_reader, client_writer))
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        address["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(serve(), loop)
+    ready.wait()
+    return f"redis://127.0.0.1:{address['port']}{target.path}"
+
+
+async def measure(persistence):
+    """Worst delay of a 1 ms ticker and total time while ROUNDS x UPDATES writes run."""
+    lags = []
+    done = asyncio.Event()
+    payload = {"step": 1, "history": list(range(50))}
+    # Open the connections outside of the measurement
+    await persistence.update_user_data(0, payload)
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - started - TICK)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(TICK * 5)
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        await asyncio.gather(*(persistence.update_user_data(user_id, payload) for user_id in range(UPDATES)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticking
+    return max(lags) * 1000, elapsed * 1000 / ROUNDS
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("round_trip_ms", [0, 0.5, 1])
+async def test_event_loop_lag_benchmark(round_trip_ms):
+    url = settings.CACHES["default"]["LOCATION"]
+    if round_trip_ms:
+        url = start_latency_proxy(url, round_trip_ms / 1000)
+
+    blocking_lag, blocking_round = await measure(BlockingRedisPersistence(url))
+    async_lag, async_round = await measure(RedisPersistence(url))
+
+    print(f"\n{UPDATES} concurrent updates, proxy adds {round_trip_ms} ms per round trip")
+    print(f"{'':<10}{'max loop lag ms':>16}{'ms per round':>14}")
+    print(f"{'blocking':<10}{blocking_lag:>16.1f}{blocking_round:>14.1f}")
+    print(f"{'asyncio':<10}{async_lag:>16.1f}{async_round:>14.1f}")
+
+    if round_trip_ms:
+        assert async_lag < blocking_lag
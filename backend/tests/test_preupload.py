@@ -0,0 +1,178 @@
+import asyncio
+import json
+from datetime import timedelta
+
+import httpx
+import pytest
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from unittest.mock import patch
+
+from apps.bot import outbox, preupload, telegram_client
+from apps.bot.tasks import preupload_document_task
+from apps.content.models import Category, DocumentVersion
+
+STORAGE_CHAT = "-100500"
+
+
+class FakeBotApi:
+    """
+    Answers sendDocument / sendPhoto / getFile; ``invalid`` file_ids are
+    unknown, ``too_big`` ones over the getFile limit.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.invalid = set()
+        self.too_big = set()
+
+    def __call__(self, request):
+        method = request.url.path.rsplit("/", 1)[-1]
+        self.requests.append((method, request))
+        number = len(self.requests)
+        if method == "sendDocument":
+            if b".gif" in request.content:
+                # Telegram turns GIFs into animations
+                animation = {"animation": {"file_id": f"gif-{number}"}, "document": {"file_id": f"gif-{number}"}}
+                return httpx.Response(200, json={"ok": True, "result": animation})
+            return httpx.Response(200, json={"ok": True, "result": {"document": {"file_id": f"doc-{number}"}}})
+        if method == "sendPhoto":
+            sizes = [{"file_id": f"thumb-{number}"}, {"file_id": f"photo-{number}"}]
+            return httpx.Response(200, json={"ok": True, "result": {"photo": sizes}})
+        file_id = json.loads(request.content)["file_id"]
+        if any(bad in file_id for bad in self.invalid):
+            description = "Bad Request: wrong file identifier/HTTP URL specified"
+            return httpx.Response(400, json={"ok": False, "description": description})
+        if any(big in file_id for big in self.too_big):
+            return httpx.Response(400, json={"ok": False, "description": "Bad Request: file is too big"})
+        return httpx.Response(200, json={"ok": True, "result": {"file_id": file_id}})
+
+    def methods(self):
+        return [method for method, _request in self.requests]
+
+
+@pytest.fixture
+def bot_api(settings, tmp_path):
+    settings.TELEGRAM_STORAGE_CHAT_ID = STORAGE_CHAT
+    settings.MEDIA_ROOT = str(tmp_path)
+    api = FakeBotApi()
+
+    async def install_client():
+        telegram_client._clients[asyncio.get_running_loop()] = httpx.AsyncClient(
+            base_url="https://api.telegram.org/botTOKEN/", transport=httpx.MockTransport(api)
+        )
+
+    telegram_client.run_sync(install_client())
+    yield api
+    telegram_client.run_sync(telegram_client.close_client())
+
+
+def create_version(title, name="manual.pdf", content=b"%PDF-1.4 data", version="1.0"):
+    with patch("apps.content.signals.run_async"), patch.object(outbox, "_wake_dispatcher"):
+        node, _created = Category.objects.get_or_create(title=title, is_folder=False)
+        with transaction.atomic():
+            return DocumentVersion.objects.create(
+                content_node=node, version=version, file=ContentFile(content, name=name)
+            )
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPreupload:
+
+    def test_queued_when_version_committed(self, bot_api):
+        with patch.object(preupload_document_task, "delay") as delay:
+            version = create_version("Guide")
+        delay.assert_called_once_with(version.pk)
+
+    def test_not_queued_without_storage_chat(self, bot_api, settings):
+        settings.TELEGRAM_STORAGE_CHAT_ID = ""
+        with patch.object(preupload_document_task, "delay") as delay:
+            create_version("Guide")
+        delay.assert_not_called()
+
+    def test_upload_stores_file_id(self, bot_api):
+        with patch.object(preupload_document_task, "delay"):
+            version = create_version("Guide")
+
+        assert preupload.preupload_version(version.pk) == "doc-1"
+
+        method, request = bot_api.requests[0]
+        assert method == "sendDocument"
+        assert b'name="chat_id"\r\n\r\n-100500' in request.content
+        assert b"%PDF-1.4 data" in request.content
+        version.refresh_from_db()
+        assert version.telegram_file_id == "doc-1"
+        assert version.telegram_file_checked_at is not None
+
+        # Already uploaded
+        assert preupload.preupload_version(version.pk) == "doc-1"
+        assert len(bot_api.requests) == 1
+
+    def test_images_uploaded_as_photos(self, bot_api):
+        with patch.object(preupload_document_task, "delay"):
+            version = create_version("Scheme", name="scheme.PNG", content=b"\x89PNG")
+
+        assert preupload.preupload_version(version.pk) == "photo-1"
+        assert bot_api.methods() == ["sendPhoto"]
+
+    def test_gifs_uploaded_as_documents(self, bot_api):
+        with patch.object(preupload_document_task, "delay"):
+            version = create_version("Animation", name="flow.gif", content=b"GIF89a")
+
+        assert preupload.preupload_version(version.pk) == "gif-1"
+        assert bot_api.methods() == ["sendDocument"]
+
+    def test_missing_file_skipped(self, bot_api):
+        with patch.object(preupload_document_task, "delay"):
+            version = create_version("Guide")
+        version.file.storage.delete(version.file.name)
+
+        assert preupload.preupload_version(version.pk) is None
+        assert bot_api.requests == []
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSyncFileIds:
+
+    def test_uploads_missing_and_replaces_dead_file_ids(self, bot_api):
+        long_ago = timezone.now() - preupload.REVALIDATE_AFTER - timedelta(days=1)
+        with patch.object(preupload_document_task, "delay"):
+            missing = create_version("Missing")
+            valid = create_version("Valid")
+            dead = create_version("Dead")
+            big = create_version("Big")
+            fresh = create_version("Fresh")
+            create_version("Old version", version="1.0")
+            current = create_version("Old version", version="2.0")
+        versions = DocumentVersion.objects
+        versions.filter(pk=valid.pk).update(telegram_file_id="id-valid", telegram_file_checked_at=long_ago)
+        versions.filter(pk=dead.pk).update(telegram_file_id="id-dead", telegram_file_checked_at=long_ago)
+        versions.filter(pk=big.pk).update(telegram_file_id="id-big")
+        versions.filter(pk=fresh.pk).update(telegram_file_id="id-fresh", telegram_file_checked_at=timezone.now())
+        bot_api.invalid.add("id-dead")
+        bot_api.too_big.add("id-big")
+
+        stats = preupload.sync_file_ids()
+
+        assert stats == {"uploaded": 2, "valid": 2, "replaced": 1, "failed": 0}
+        file_ids = dict(DocumentVersion.objects.values_list("pk", "telegram_file_id"))
+        assert file_ids[missing.pk].startswith("doc-") and file_ids[current.pk].startswith("doc-")
+        assert file_ids[valid.pk] == "id-valid" and file_ids[big.pk] == "id-big"
+        assert file_ids[dead.pk].startswith("doc-")
+        assert file_ids[fresh.pk] == "id-fresh"
+        # Only the newest version of a document is served
+        assert len([v for v in file_ids.values() if v is None]) == 1
+        assert bot_api.methods().count("getFile") == 3
+
+        # Everything is up to date now
+        assert preupload.sync_file_ids() == {"uploaded": 0, "valid": 0, "replaced": 0, "failed": 0}
+
+    def test_unreadable_files_rotate_to_the_back(self, bot_api):
+        with patch.object(preupload_document_task, "delay"):
+            broken = create_version("Broken")
+            create_version("Fine")
+        broken.file.storage.delete(broken.file.name)
+
+        assert preupload.sync_file_ids(batch_size=1) == {"uploaded": 0, "valid": 0, "replaced": 0, "failed": 1}
+        assert preupload.sync_file_ids(batch_size=1) == {"uploaded": 1, "valid": 0, "replaced": 0, "failed": 0}
@@ -0,0 +1,154 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock
+
+import httpx
+from telegram.error import RetryAfter
+
+from apps.bot import ratelimit, telegram_client
+from apps.bot.notifications import PERMANENT, RETRY, deliver_telegram_message, send_telegram_notification
+from apps.bot.ratelimit import BULK, INTERACTIVE, SharedRateLimiter, TelegramRateLimit
+
+
+class TestTokenBuckets:
+
+    def test_global_burst_then_wait(self):
+        limit = TelegramRateLimit(global_rate=5, global_burst=5, reserve=0)
+
+        granted = [limit.try_acquire(priority=INTERACTIVE) for _ in range(5)]
+        wait = limit.try_acquire(priority=INTERACTIVE)
+
+        assert granted == [0] * 5
+        assert 0 < wait <= 0.2
+
+    def test_bulk_leaves_reserve_for_interactive(self):
+        limit = TelegramRateLimit(global_rate=1, global_burst=10, reserve=4)
+
+        bulk = [limit.try_acquire(priority=BULK) for _ in range(7)]
+        assert bulk[:6] == [0] * 6
+        assert bulk[6] > 0
+
+        interactive = [limit.try_acquire(priority=INTERACTIVE) for _ in range(4)]
+        assert interactive == [0] * 4
+        assert limit.try_acquire(priority=INTERACTIVE) > 0
+
+    def test_per_chat_limit(self):
+        limit = TelegramRateLimit(chat_rate=1, chat_burst=2)
+
+        assert limit.try_acquire(chat_id=1) == 0
+        assert limit.try_acquire(chat_id=1) == 0
+        assert 0 < limit.try_acquire(chat_id=1) <= 1
+        assert limit.try_acquire(chat_id=2) == 0
+
+    def test_retry_after_blocks_every_sender(self):
+        limit = TelegramRateLimit()
+        other_process = TelegramRateLimit()
+
+        limit.block(3)
+
+        assert 2 < other_process.try_acquire(chat_id=5, priority=INTERACTIVE) <= 3
+        assert 2 < other_process.try_acquire(priority=BULK) <= 3
+
+    def test_async_path_shares_buckets_without_sync_client(self, monkeypatch):
+        limit = TelegramRateLimit(chat_rate=1, chat_burst=1)
+        # The event loop must never wait on the blocking django-redis client
+        monkeypatch.setattr(limit, "_get_scripts", None)
+
+        async def run():
+            await limit.acquire(chat_id=3, priority=INTERACTIVE)
+            waits = [await limit.atry_acquire(chat_id=3), await limit.atry_acquire(chat_id=4)]
+            await limit.ablock(2)
+            return waits, await limit.atry_acquire(chat_id=4)
+
+        waits, blocked_wait = asyncio.run(run())
+
+        assert 0 < waits[0] <= 1 and waits[1] == 0
+        assert 1 < blocked_wait <= 2
+
+    def test_async_client_closed_with_the_limiter(self):
+        limit = TelegramRateLimit()
+
+        async def run():
+            await limit.atry_acquire(chat_id=5)
+            client = limit._async_scripts[asyncio.get_running_loop()][0]
+            closed = []
+            client.connection_pool.disconnect = AsyncMock(side_effect=lambda *args, **kwargs: closed.append(True))
+            await SharedRateLimiter(limit).shutdown()
+            return closed
+
+        assert asyncio.run(run()) == [True]
+        assert len(limit._async_scripts) == 0
+
+
+def fake_block(blocked):
+    async def block(retry_after):
+        blocked.append(retry_after)
+    return block
+
+
+class TestSharedRateLimiter:
+
+    def test_retries_after_flood_error(self, monkeypatch):
+        blocked = []
+        monkeypatch.setattr(ratelimit.rate_limit, "ablock", fake_block(blocked))
+        calls = []
+
+        async def callback(text):
+            calls.append(text)
+            if len(calls) == 1:
+                raise RetryAfter(2)
+            return {"ok": True}
+
+        result = asyncio.run(SharedRateLimiter().process_request(
+            callback, ("hi",), {}, "sendMessage", {"chat_id": 7, "text": "hi"}, None,
+        ))
+
+        assert result == {"ok": True}
+        assert calls == ["hi", "hi"]
+        assert blocked == [2]
+
+
+class TestNotificationFloodControl:
+
+    def test_429_stored_and_retried(self, monkeypatch):
+        blocked = []
+        monkeypatch.setattr(ratelimit.rate_limit, "ablock", fake_block(blocked))
+        responses = iter([
+            httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 4}}),
+            httpx.Response(200, json={"ok": True}),
+        ])
+        sent = []
+
+        def handle(request):
+            sent.append(json.loads(request.content)["chat_id"])
+            return next(responses)
+
+        async def send():
+            loop = asyncio.get_running_loop()
+            telegram_client._clients[loop] = httpx.AsyncClient(
+                base_url="https://api.telegram.org/botTOKEN/", transport=httpx.MockTransport(handle)
+            )
+            try:
+                return await send_telegram_notification(42, "Hi")
+            finally:
+                await telegram_client.close_client()
+
+        assert asyncio.run(send()) is True
+        assert sent == [42, 42]
+        assert blocked == [4]
+
+    def test_only_transient_errors_are_retryable(self):
+        statuses = iter([403, 400, 502])
+
+        async def send():
+            loop = asyncio.get_running_loop()
+            telegram_client._clients[loop] = httpx.AsyncClient(
+                base_url="https://api.telegram.org/botTOKEN/",
+                transport=httpx.MockTransport(lambda request: httpx.Response(next(statuses), json={"ok": False})),
+            )
+            try:
+                return [await deliver_telegram_message(42, "Hi") for _ in range(3)]
+            finally:
+                await telegram_client.close_client()
+
+        assert asyncio.run(send()) == [PERMANENT, PERMANENT, RETRY]
@@ -0,0 +1,109 @@
+"""
+Full-text search vs. the former ILIKE search at 50k nodes.
+
+    RUN_BENCHMARKS=1 pytest tests/test_search_benchmark.py -s
+"""
+import random
+import statistics
+import time
+
+import pytest
+from django.db import connection
+from django.db.models import Q
+
+from apps.content.models import Category
+from apps.content.search import search_documents
+
+NODES = 50_000
+DOCUMENTS_PER_FOLDER = 1_000
+REPEATS = 5
+
+WORDS = [
+    "настройка", "настройки", "маршрутизатор", "маршрутизатора", "коммутатор", "коммутаторов",
+    "инструкция", "инструкции", "обновление", "прошивки", "подключение", "абонента", "линии",
+    "оптического", "терминала", "порт", "портов", "резервирование", "питания", "схема",
+    "монтажа", "сервисного", "обслуживания", "диагностика", "неисправностей", "журнал",
+]
+EQUIPMENT = ["MA5800-X7", "MA5608T", "S5720-28X", "NE40E-X8", "OLT-C320", "ONT-HG8245H"]
+QUERIES = ["маршрутизаторы", "инструкции по настройке", "MA5608", "резервирования питания", "журнала"]
+
+
+def legacy_search(query):
+    """The ILIKE query used before full-text search."""
+    return list(Category.objects.filter(
+        Q(title__icontains=query) | Q(description__icontains=query),
+        is_folder=False,
+        visible_in_bot=True
+    )[:10])
+
+
+def fts_search(query):
+    return list(search_documents(query)[:10])
+
+
+def make_description(rnd):
+    sentence = " ".join(rnd.choices(WORDS, k=25))
+    cells = "".join(f"<td>{rnd.choice(WORDS)}</td>" for _ in range(4))
+    return (
+        f"<p>{sentence} <strong>{rnd.choice(EQUIPMENT)}</strong>&nbsp;{rnd.choice(WORDS)}</p>"
+        f"<figure class=\"table\"><table><tbody><tr>{cells}</tr></tbody></table></figure>"
+        f"<p>{' '.join(rnd.choices(WORDS, k=20))}</p>"
+    )
+
+
+def populate(rnd):
+    nodes = []
+    for tree_id in range(1, NODES // DOCUMENTS_PER_FOLDER + 1):
+        size = DOCUMENTS_PER_FOLDER - 1
+        nodes.append(Category(
+            title=f"Раздел {tree_id}", is_folder=True,
+            tree_id=tree_id, lft=1, rght=2 * size + 2, level=0
+        ))
+    Category.objects.bulk_create(nodes, batch_size=1_000)
+
+    documents = []
+    for folder in Category.objects.filter(parent=None):
+        for i in range(DOCUMENTS_PER_FOLDER - 1):
+            documents.append(Category(
+                title=f"{rnd.choice(WORDS).capitalize()} {rnd.choice(WORDS)} {rnd.choice(EQUIPMENT)}",
+                description=make_description(rnd),
+                is_folder=False, parent=folder, order=i,
+                tree_id=folder.tree_id, lft=2 * i + 2, rght=2 * i + 3, level=1
+            ))
+    Category.objects.bulk_create(documents, batch_size=1_000)
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE content_category")
+
+
+def timed(func, query):
+    samples = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        results = func(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), len(results)
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def test_fulltext_vs_ilike():
+    populate(random.Random(42))
+    assert Category.objects.count() == NODES
+
+    print(f"\n{'query':<28}{'ILIKE ms':>10}{'hits':>6}{'FTS ms':>10}{'hits':>6}")
+    totals = {"ilike": 0.0, "fts": 0.0}
+    for query in QUERIES:
+        ilike_ms, ilike_hits = timed(legacy_search, query)
+        fts_ms, fts_hits = timed(fts_search, query)
+        totals["ilike"] += ilike_ms
+        totals["fts"] += fts_ms
+        print(f"{query:<28}{ilike_ms:>10.1f}{ilike_hits:>6}{fts_ms:>10.1f}{fts_hits:>6}")
+    print(f"{'total':<28}{totals['ilike']:>10.1f}{'':>6}{totals['fts']:>10.1f}")
+
+    # Inflected forms are found only by the stemmed search
+    assert timed(legacy_search, "маршрутизаторы")[1] == 0
+    assert timed(fts_search, "маршрутизаторы")[1] == 10
+
+    plan = search_documents("MA5608")[:10].explain()
+    assert "content_category_search_idx" in plan
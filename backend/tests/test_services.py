@@ -1,6 +1,7 @@
 import pytest
 from django.core.cache import cache
 from apps.content import services
+from apps.content.cache import content_cache_key, get_content_revision
 from apps.content.models import Category, DocumentVersion
 from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch
@@ -15,7 +16,7 @@ class TestContentServices:
         
         # Mock run_async and notification functions to avoid threading/async issues in tests
         with patch("apps.content.signals.run_async"), \
-             patch("apps.content.signals.broadcast_notification"), \
+             patch("apps.content.signals.enqueue_version_notifications"), \
              patch("apps.content.signals.notify_admins_document_error"):
             # Root Categories
             self.root1 = Category.objects.create(title="Root 1", is_folder=True, visible_in_bot=True, order=1)
@@ -93,3 +94,177 @@ class TestContentServices:
         # No match
         results = services.search_content("NonExistent")
         assert len(results) == 0
+
+    def test_search_content_russian_stemming(self):
+        """Inflected forms match, markup is not indexed, snippets are highlighted"""
+        with patch("apps.content.signals.run_async"):
+            Category.objects.create(
+                title="Инструкция по настройке маршрутизатора", is_folder=False, parent=self.root1,
+                description="<p>Перед <strong>настройкой</strong> обновите прошивку</p>"
+            )
+
+        results = services.search_content("инструкции маршрутизаторов")
+        assert [r["title"] for r in results] == ["Инструкция по настройке маршрутизатора"]
+
+        results = services.search_content("прошивки")
+        assert len(results) == 1
+        assert "<b>прошивку</b>" in results[0]["headline"]
+        assert "<p>" not in results[0]["headline"]
+
+        # Tag names are stripped before indexing
+        assert services.search_content("strong") == []
+
+    def test_search_headline_escapes_description(self):
+        """Only the highlight markup reaches the page, not markup left in the description"""
+        with patch("apps.content.signals.run_async"):
+            Category.objects.create(
+                title="Прошивка", is_folder=False, parent=self.root1,
+                description="Обновите прошивку &amp; перезагрузите <img src=x onerror=alert(1)",
+            )
+
+        headline = services.search_content("прошивку")[0]["headline"]
+        assert "<b>прошивку</b>" in headline
+        assert "<img" not in headline
+        assert "&lt;img src=x onerror=alert(1)" in headline
+        assert "&amp; перезагрузите" in headline
+
+    def test_search_content_fuzzy_fallback(self):
+        """Misspelled titles and equipment names are found through trigram similarity"""
+        from apps.content.models import Equipment
+        equipment = Equipment.objects.create(name="MA5800-X7")
+        with patch("apps.content.signals.run_async"):
+            Category.objects.create(title="Маршрутизатор домашний", is_folder=False, parent=self.root1)
+            Category.objects.create(title="Схема OLT", is_folder=False, parent=self.root1, equipment=equipment)
+
+        results = services.search_content("маршрутизтор")
+        assert [r["title"] for r in results] == ["Маршрутизатор домашний"]
+        assert results[0]["fuzzy"] is True
+
+        results = services.search_content("MA5880")
+        assert [r["title"] for r in results] == ["Схема OLT"]
+        assert results[0]["suggestion"] == "MA5800-X7"
+
+        # The short timeout and the threshold do not leak into the rest of the transaction
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT current_setting('statement_timeout'), current_setting('pg_trgm.word_similarity_threshold')"
+            )
+            assert cursor.fetchone() == ("0", "0.6")
+
+        # Exact hits never go through the fallback
+        assert services.search_content("Doc 1")[0]["fuzzy"] is False
+        assert services.search_content("qqqqqq") == []
+
+    def test_search_content_within_category(self):
+        """Scoped search only returns documents from the category's subtree"""
+        with patch("apps.content.signals.run_async"):
+            Category.objects.create(title="Doc 2", is_folder=False, parent=self.child1)
+            Category.objects.create(title="Doc 3", is_folder=False, parent=self.root2)
+
+        assert len(services.search_content("Doc")) == 3
+        assert {r["title"] for r in services.search_content("Doc", category_id=self.root1.id)} == {"Doc 1", "Doc 2"}
+        assert [r["title"] for r in services.search_content("Doc", category_id=self.child1.id)] == ["Doc 2"]
+        # The fallback is scoped as well
+        assert services.search_content("Dac 3", category_id=self.root1.id) == []
+
+        # Same scoping through the REST API
+        from django.test import Client
+        response = Client().get("/api/search/", {"q": "Doc", "category": self.child1.id})
+        assert [r["title"] for r in response.json()] == ["Doc 2"]
+        assert Client().get("/api/search/", {"q": "Doc", "category": "abc"}).status_code == 400
+
+    def test_fuzzy_search_uses_trigram_index(self):
+        """The fallback must be answerable from the trigram index, not a table scan"""
+        from django.db import connection
+        from apps.content.search import _fuzzy_documents_queryset
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = _fuzzy_documents_queryset("маршрутизтор", {}).explain()
+        assert "content_cat_title_trgm_idx" in plan
+
+
+@pytest.mark.django_db
+class TestCategoryDetailsQueryCount:
+    """get_category_details must not issue a query per child node."""
+
+    def build_folder(self, children_count):
+        with patch("apps.content.signals.run_async"):
+            root = Category.objects.create(title="Root", is_folder=True)
+            folder = Category.objects.create(title="Folder", is_folder=True, parent=root)
+
+        # Bulk insert bypasses MPTT bookkeeping, so the tree is rebuilt afterwards
+        Category.objects.bulk_create([
+            Category(
+                title=f"Node {i}", parent=folder, is_folder=(i % 4 == 3), order=i,
+                tree_id=folder.tree_id, lft=0, rght=0, level=folder.level + 1
+            )
+            for i in range(children_count)
+        ])
+        Category.objects.rebuild()
+
+        documents = Category.objects.filter(parent=folder, is_folder=False)
+        DocumentVersion.objects.bulk_create([
+            DocumentVersion(content_node=node, version="1.0", file=f"documents/node_{node.id}.pdf")
+            for node in documents
+        ])
+        return folder
+
+    @pytest.mark.parametrize("children_count", [1, 100, 1000])
+    def test_constant_query_count(self, children_count, django_assert_num_queries):
+        cache.clear()
+        folder = self.build_folder(children_count)
+
+        # category + children with latest versions + ancestors
+        with django_assert_num_queries(3):
+            details = services.get_category_details(folder.id)
+
+        assert details["path"] == ["Root"]
+        assert len(details["subcategories"]) + len(details["documents"]) == children_count
+        assert details["documents"][0]["title"] == "Node 0"
+        assert all(d["file_path"].startswith("documents/node_") for d in details["documents"])
+
+    def test_latest_version_wins(self):
+        cache.clear()
+        folder = self.build_folder(1)
+        doc = Category.objects.get(parent=folder)
+        with patch("apps.content.signals.run_async"):
+            DocumentVersion.objects.create(content_node=doc, version="2.0", file="documents/newest.pdf")
+        cache.clear()
+
+        details = services.get_category_details(folder.id)
+        assert details["documents"][0]["file_path"] == "documents/newest.pdf"
+
+
+@pytest.mark.django_db
+class TestRevisionInvalidation:
+    """Content caches are keyed by the content revision instead of being deleted."""
+
+    def test_change_invalidates_cached_details(self, django_capture_on_commit_callbacks):
+        with patch("apps.content.signals.run_async"):
+            root = Category.objects.create(title="Root", is_folder=True)
+            doc = Category.objects.create(title="Old title", is_folder=False, parent=root)
+        old_key = content_cache_key(f"category:{root.id}:details")
+        assert services.get_category_details(root.id)["documents"][0]["title"] == "Old title"
+
+        with patch("apps.content.signals.run_async"), django_capture_on_commit_callbacks(execute=True):
+            doc.title = "New title"
+            doc.save()
+
+        assert services.get_category_details(root.id)["documents"][0]["title"] == "New title"
+        # The previous revision's entry is left to expire, not deleted
+        assert cache.get(old_key)["documents"][0]["title"] == "Old title"
+
+    def test_new_version_invalidates_root_and_details(self, django_capture_on_commit_callbacks):
+        with patch("apps.content.signals.run_async"):
+            root = Category.objects.create(title="Root", is_folder=True)
+            doc = Category.objects.create(title="Doc", is_folder=False, parent=root)
+        assert services.get_category_details(root.id)["documents"][0]["file_path"] is None
+        revision = get_content_revision()
+
+        with patch("apps.content.signals.run_async"), django_capture_on_commit_callbacks(execute=True):
+            DocumentVersion.objects.create(content_node=doc, version="1.0", file="documents/v1.pdf")
+
+        assert get_content_revision() == revision + 1
+        assert services.get_category_details(root.id)["documents"][0]["file_path"] == "documents/v1.pdf"
@@ -68,3 +68,69 @@ class TestAnalyticsUnitLogic:
         
         exists = await sync_to_async(check_exists)()
         assert exists is True
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSubscriptionCache:
+
+    @pytest.fixture(autouse=True)
+    def setup_data(self):
+        from unittest.mock import patch
+        with patch("apps.content.signals.run_async"):
+            self.user = BotUser.objects.create(telegram_id=999)
+            self.root = Category.objects.create(title="Root", is_folder=True)
+            self.sub = Category.objects.create(title="Sub", is_folder=True, parent=self.root)
+
+    def test_bell_state_without_queries(self, django_assert_num_queries):
+        from apps.bot.subscriptions import get_subscribed_category_ids, subscription_status
+        from apps.content.tree import get_content_tree
+        self.user.subscribed_categories.add(self.root)
+        get_subscribed_category_ids(999)
+        get_content_tree()
+
+        with django_assert_num_queries(0):
+            ids = get_subscribed_category_ids(999)
+            assert subscription_status(ids, get_content_tree(), self.sub.id) == (True, "inherited")
+            assert subscription_status(ids, get_content_tree(), str(self.root.id)) == (True, "direct")
+            assert subscription_status(frozenset(), get_content_tree(), self.sub.id) == (False, None)
+
+    def test_changes_invalidate_cached_set(self):
+        from apps.bot.subscriptions import get_subscribed_category_ids
+        assert get_subscribed_category_ids(999) == frozenset()
+
+        self.user.subscribed_categories.add(self.sub)
+        assert get_subscribed_category_ids(999) == {self.sub.id}
+
+        # Reverse side, as in the category admin
+        self.root.subscribers.add(self.user)
+        assert get_subscribed_category_ids(999) == {self.root.id, self.sub.id}
+
+        self.sub.subscribers.clear()
+        assert get_subscribed_category_ids(999) == {self.root.id}
+
+    def test_reader_from_before_commit_cannot_restore_stale_set(self):
+        from django.core.cache import cache
+        from apps.bot import subscriptions
+        assert subscriptions.get_subscribed_category_ids(999) == frozenset()
+        # A reader loads the rows and computes its key before the change commits...
+        version = cache.get(subscriptions.SUBSCRIPTIONS_VERSION_KEY.format(telegram_id=999), 0)
+        stale_key = subscriptions.SUBSCRIPTIONS_KEY.format(telegram_id=999, version=version)
+
+        self.user.subscribed_categories.add(self.sub)
+        # ...and writes them back only after it
+        cache.set(stale_key, frozenset(), timeout=subscriptions.SUBSCRIPTIONS_TIMEOUT)
+
+        assert subscriptions.get_subscribed_category_ids(999) == {self.sub.id}
+        # The version outlives the sets cached under it, but does not stay forever
+        version_ttl = cache.ttl(subscriptions.SUBSCRIPTIONS_VERSION_KEY.format(telegram_id=999))
+        assert subscriptions.SUBSCRIPTIONS_TIMEOUT < version_ttl <= subscriptions.SUBSCRIPTIONS_VERSION_TIMEOUT
+
+    def test_web_toggle_invalidates(self, client):
+        from django.contrib.auth import get_user_model
+        from apps.bot.subscriptions import get_subscribed_category_ids
+        web_user = get_user_model().objects.create_user(username="web", password="pass", telegram_id=999)
+        client.force_login(web_user)
+        assert get_subscribed_category_ids(999) == frozenset()
+
+        client.post(f"/category/{self.root.id}/subscribe/")
+        assert get_subscribed_category_ids(999) == {self.root.id}
@@ -0,0 +1,90 @@
+import pytest
+from io import StringIO
+from celery.exceptions import Retry
+from unittest.mock import patch
+from django.core.management import call_command
+
+from apps.content import services, tasks
+from apps.content.cache import get_cache_metrics, local_cache, reset_cache_metrics
+from apps.content.models import Category
+from apps.content.warmup import visible_levels, warm_content_cache
+
+
+def build_tree():
+    with patch("apps.content.signals.run_async"):
+        # Async tests elsewhere may leave nodes committed through their own connections
+        Category.objects.all().delete()
+        root = Category.objects.create(title="Root", is_folder=True, order=1)
+        folder = Category.objects.create(title="Folder", is_folder=True, parent=root, order=1)
+        hidden = Category.objects.create(title="Hidden", is_folder=True, parent=root, visible_in_bot=False)
+        Category.objects.create(title="Doc", is_folder=False, parent=folder)
+        Category.objects.create(title="Hidden doc", is_folder=False, parent=hidden)
+    return root, folder
+
+
+def assert_warm(root, folder, django_assert_num_queries):
+    local_cache.clear()
+    doc = Category.objects.get(title="Doc")
+    with django_assert_num_queries(0):
+        services.get_root_categories()
+        services.get_category_details(root.id)
+        services.get_category_details(folder.id)
+        services.get_document_details(doc.id)
+
+
+@pytest.mark.django_db
+class TestWarmContentCache:
+
+    def test_breadth_first_levels(self):
+        root, folder = build_tree()
+        levels = visible_levels()
+
+        assert levels[0] == [(root.id, True)]
+        assert levels[1] == [(folder.id, True)]
+        assert [is_folder for _, is_folder in levels[2]] == [False]
+        assert len(levels) == 3
+
+    def test_command_warms_and_reports(self, django_assert_num_queries):
+        root, folder = build_tree()
+        out = StringIO()
+        call_command("warm_content_cache", "--concurrency=1", stdout=out)
+
+        output = out.getvalue()
+        assert "Level 0: 1 folders, 0 documents" in output
+        assert "Level 2: 0 folders, 1 documents" in output
+        assert "Warmed 3 nodes on 3 levels" in output
+        assert_warm(root, folder, django_assert_num_queries)
+
+        reset_cache_metrics()
+        warm_content_cache(concurrency=1)
+        assert "rebuilds" not in get_cache_metrics()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_warm_up(django_assert_num_queries):
+    root, folder = build_tree()
+    stats = warm_content_cache(concurrency=3)
+
+    assert [level["folders"] + level["documents"] for level in stats] == [1, 1, 1]
+    assert_warm(root, folder, django_assert_num_queries)
+
+
+class TestAutoWarm:
+
+    def test_bulk_changes_schedule_one_warm_up(self):
+        with patch.object(tasks.warm_content_cache_task, "apply_async") as apply_async:
+            for _ in range(tasks.AUTO_WARM_MIN_CHANGES - 1):
+                tasks.schedule_warm_content_cache(1)
+            apply_async.assert_not_called()
+
+            tasks.schedule_warm_content_cache(1)
+            tasks.schedule_warm_content_cache(5)
+
+        apply_async.assert_called_once_with(kwargs={"debounce": True}, countdown=tasks.AUTO_WARM_DELAY)
+
+    def test_task_waits_until_changes_settle(self):
+        tasks.schedule_warm_content_cache(1)
+        with patch("apps.content.warmup.warm_content_cache") as warm:
+            with pytest.raises(Retry):
+                tasks.warm_content_cache_task.apply(kwargs={"debounce": True}, throw=True)
+        warm.assert_not_called()
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import socket
+
+import httpx
+import pytest
+import redis.asyncio
+from django.conf import settings
+from telegram.ext import Application
+
+from apps.bot.management.commands.runbot import register_handlers
+from apps.bot.models import BotUser
+from apps.bot.webhook import INSTANCE_LOCK_KEY, MAX_BODY_SIZE, WEBHOOK_PATH, TelegramWebhook, serve_webhook
+
+SECRET = "s3cret-token"
+AUTH = [(b"x-telegram-bot-api-secret-token", SECRET.encode())]
+
+
+def start_update(update_id=1, user_id=42):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Ivan"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+@pytest.fixture
+def application(telegram):
+    app = Application.builder().token("123:TEST").request(telegram).updater(None).build()
+    register_handlers(app)
+    return app
+
+
+async def call(endpoint, method="POST", path=WEBHOOK_PATH, body=b"", headers=AUTH):
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": list(headers), "client": ("10.0.0.1", 1)}
+    await endpoint(scope, receive, send)
+    return sent[0]["status"]
+
+
+class TestTelegramWebhook:
+
+    @pytest.mark.asyncio
+    async def test_acknowledges_before_processing(self, application):
+        endpoint = TelegramWebhook(application, SECRET)
+
+        assert await call(endpoint, body=json.dumps(start_update()).encode()) == 200
+
+        # Handed over, not handled: the application is not even running
+        update = application.update_queue.get_nowait()
+        assert update.update_id == 1 and update.message.text == "/start"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("headers", [[], [(b"x-telegram-bot-api-secret-token", b"guess")]])
+    async def test_rejects_bad_secret(self, application, headers):
+        endpoint = TelegramWebhook(application, SECRET)
+        assert await call(endpoint, body=json.dumps(start_update()).encode(), headers=headers) == 403
+        assert application.update_queue.empty()
+
+    @pytest.mark.asyncio
+    async def test_rejects_malformed_requests(self, application):
+        endpoint = TelegramWebhook(application, SECRET)
+
+        assert await call(endpoint, body=b"{not json") == 400
+        assert await call(endpoint, body=b"x" * (MAX_BODY_SIZE + 1)) == 413
+        assert await call(endpoint, method="GET") == 405
+        assert await call(endpoint, path="/other") == 404
+        assert await call(endpoint, method="GET", path="/healthz", headers=[]) == 200
+        assert application.update_queue.empty()
+
+    def test_secret_required(self, application):
+        with pytest.raises(ValueError):
+            TelegramWebhook(application, "")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestWebhookServer:
+
+    @pytest.mark.asyncio
+    async def test_update_flows_from_http_to_handler(self, application, telegram):
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        server = asyncio.ensure_future(
+            serve_webhook(application, f"https://bot.example.com{WEBHOOK_PATH}", SECRET, host="127.0.0.1", port=port)
+        )
+        try:
+            async with httpx.AsyncClient(base_url=base) as client:
+                for _ in range(100):
+                    try:
+                        if (await client.get("/healthz")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        await asyncio.sleep(0.05)
+
+                response = await client.post(
+                    WEBHOOK_PATH, json=start_update(), headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+                )
+                assert response.status_code == 200
+                forged = await client.post(WEBHOOK_PATH, json=start_update(2, 43))
+                assert forged.status_code == 403
+
+            await asyncio.wait_for(telegram.sent.wait(), timeout=10)
+        finally:
+            server.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await server
+
+        webhook = next(params for endpoint, params in telegram.calls if endpoint == "setWebhook")
+        assert webhook["url"] == f"https://bot.example.com{WEBHOOK_PATH}"
+        assert webhook["secret_token"] == SECRET
+        assert len(telegram.messages()) == 1
+        assert telegram.messages()[0].startswith("Добро пожаловать!")
+        assert await BotUser.objects.filter(telegram_id=42).aexists()
+        assert not await BotUser.objects.filter(telegram_id=43).aexists()
+        assert not application.running
+
+    @pytest.mark.asyncio
+    async def test_second_replica_refuses_to_start(self, application, telegram):
+        client = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+        await client.set(INSTANCE_LOCK_KEY, "other-replica", ex=30)
+        try:
+            with pytest.raises(RuntimeError):
+                await serve_webhook(
+                    application, f"https://bot.example.com{WEBHOOK_PATH}", SECRET, host="127.0.0.1", port=free_port()
+                )
+        finally:
+            await client.delete(INSTANCE_LOCK_KEY)
+            await client.aclose()
+
+        assert not any(endpoint == "setWebhook" for endpoint, _params in telegram.calls)
+        assert not application.running
@@ -0,0 +1,185 @@
+import asyncio
+
+import pytest
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from apps.bot.management.commands.runbot import heartbeat_job
+from apps.bot.models import BotStatus
+from apps.bot import workers
+from apps.bot.workers import PartitionedUpdateProcessor, partition_key
+
+
+def message_update(update_id, user_id, bot=None):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "text": str(update_id),
+        },
+    }, bot)
+
+
+def build(telegram, processor, callback):
+    app = Application.builder().token("123:TEST").request(telegram).updater(None).concurrent_updates(processor).build()
+    app.add_handler(TypeHandler(Update, callback))
+    return app
+
+
+class TestPartitionedUpdateProcessor:
+
+    def test_partition_by_user(self):
+        assert partition_key(message_update(1, 42)) == partition_key(message_update(2, 42)) == 42
+        assert partition_key(Update(update_id=9)) == 9
+
+    @pytest.mark.asyncio
+    async def test_users_concurrent_each_user_in_order(self, telegram):
+        handled = []
+
+        async def callback(update, context):
+            user_id = update.effective_user.id
+            # User 1 uploads large documents, the others are quick
+            await asyncio.sleep(0.2 if user_id == 1 else 0.01)
+            handled.append((user_id, update.update_id))
+
+        app = build(telegram, PartitionedUpdateProcessor(workers=4), callback)
+        async with app:
+            await app.start()
+            for update_id in range(30):
+                await app.update_queue.put(message_update(update_id, update_id % 3, app.bot))
+            await app.update_queue.join()
+            await app.stop()
+
+        assert len(handled) == 30
+        for user_id in range(3):
+            updates = [update_id for user, update_id in handled if user == user_id]
+            assert updates == sorted(updates)
+        # Nobody waited for the slow user
+        assert {user for user, _update_id in handled[:20]} == {0, 2}
+
+    @pytest.mark.asyncio
+    async def test_one_worker_is_sequential(self, telegram):
+        handled = []
+
+        async def callback(update, context):
+            await asyncio.sleep(0.01 if update.update_id % 2 else 0.03)
+            handled.append(update.update_id)
+
+        app = build(telegram, PartitionedUpdateProcessor(workers=1), callback)
+        async with app:
+            await app.start()
+            for update_id in range(10):
+                await app.update_queue.put(message_update(update_id, update_id, app.bot))
+            await app.update_queue.join()
+            await app.stop()
+
+        assert handled == list(range(10))
+
+    @pytest.mark.asyncio
+    async def test_flooding_user_does_not_hold_up_other_workers(self, telegram, monkeypatch):
+        monkeypatch.setattr(workers, "MAX_QUEUED_PER_WORKER", 2)
+        release = asyncio.Event()
+        handled = []
+
+        async def callback(update, context):
+            if update.effective_user.id == 7:
+                await release.wait()
+            handled.append(update.effective_user.id)
+
+        app = build(telegram, PartitionedUpdateProcessor(workers=2), callback)
+        async with app:
+            await app.start()
+            for update_id in range(20):
+                await app.update_queue.put(message_update(update_id, 7, app.bot))
+            await app.update_queue.put(message_update(20, 8, app.bot))
+            await asyncio.sleep(0.1)
+            assert handled == [8]
+
+            release.set()
+            await app.update_queue.join()
+            await app.stop()
+
+        assert handled == [8] + [7] * 20
+
+    @pytest.mark.asyncio
+    async def test_worker_survives_cancelled_handler(self, telegram):
+        handled = []
+
+        async def callback(update, context):
+            if update.update_id == 0:
+                inner = asyncio.ensure_future(asyncio.sleep(1))
+                inner.cancel()
+                await inner
+            handled.append(update.update_id)
+
+        app = build(telegram, PartitionedUpdateProcessor(workers=1), callback)
+        async with app:
+            await app.start()
+            for update_id in range(3):
+                await app.update_queue.put(message_update(update_id, 7, app.bot))
+            # Never completes if the worker died with updates still queued
+            await asyncio.wait_for(app.update_queue.join(), timeout=5)
+            await app.stop()
+
+        assert handled == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_snapshot_reports_backlog_and_lag(self, telegram):
+        release = asyncio.Event()
+
+        async def callback(update, context):
+            await release.wait()
+
+        processor = PartitionedUpdateProcessor(workers=2)
+        app = build(telegram, processor, callback)
+        async with app:
+            await app.start()
+            for update_id in range(5):
+                await app.update_queue.put(message_update(update_id, 7, app.bot))
+            await asyncio.sleep(0.1)
+
+            snapshot = processor.snapshot()
+            # One is being handled, four wait behind it
+            assert snapshot["queued"] == 4
+            assert snapshot["lag"] >= 0.1
+
+            release.set()
+            await app.stop()
+
+        # The rest waited for the release too
+        after = processor.snapshot()
+        assert after["queued"] == 0 and after["lag"] >= 0.1
+        assert processor.snapshot() == {"queued": 0, "lag": 0.0}
+
+
+@pytest.mark.django_db(transaction=True)
+class TestHeartbeat:
+
+    @pytest.mark.asyncio
+    async def test_queue_metrics_stored_in_bot_status(self, telegram):
+        release = asyncio.Event()
+
+        async def callback(update, context):
+            await release.wait()
+
+        app = build(telegram, PartitionedUpdateProcessor(workers=2), callback)
+        async with app:
+            await app.start()
+            for update_id in range(3):
+                await app.update_queue.put(message_update(update_id, 7, app.bot))
+            await asyncio.sleep(0.05)
+
+            class Context:
+                application = app
+
+            await heartbeat_job(Context())
+            release.set()
+            await app.stop()
+
+        status = await BotStatus.objects.aget(pk=1)
+        assert status.is_running
+        assert status.queued_updates == 2
+        assert status.processing_lag >= 0.05